@@ -0,0 +1,159 @@
+from functools import partial
+
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gdk, GLib, Gtk
+
+from utils.logger import Logger
+from control import ControlServer
+from display_manager import apply_succeeded
+from events import DisplaysChangedEvent, InitialDisplaysEvent
+from gui import GUI
+from screens import ScreenSet
+import settings
+
+
+class ScreenManagerGTK:
+    def __init__(self):
+        self.config = settings.load_config()
+
+        self.logger = Logger(self.config)
+        self.guis = {}
+        self.settle_sources = {}
+        self.screens = ScreenSet(
+                settings.displays(self.config),
+                self.handle_event,
+                self.logger,
+                record_path=settings.record_path(self.config),
+                command_connection=settings.command_connection(self.config),
+                settle_window=settings.settle_window(self.config),
+                profile_store=settings.profile_store(self.config)
+                )
+        for _, disp_mgr in self.screens:
+            disp_mgr.gamma.fade_started = partial(self.start_fade, disp_mgr)
+        self.control_servers = []
+        if settings.control_enabled(self.config):
+            for name, disp_mgr in self.screens:
+                self.control_servers.append(ControlServer(
+                    disp_mgr,
+                    settings.control_socket_path(
+                        self.config, self.screens.screen_suffix(name)),
+                    self.add_watch,
+                    GLib.source_remove,
+                    self.logger,
+                    apply_layout=partial(self.apply_layout, name),
+                    metrics_path=settings.metrics_path(
+                        self.config, self.screens.screen_suffix(name))
+                    ))
+
+    def apply_layout(self, name, layout, remember=False):
+        disp_mgr = self.screens.managers[name]
+        statuses = disp_mgr.apply_layout(layout)
+        if remember and apply_succeeded(statuses):
+            disp_mgr.save_profile(layout)
+        # Reading the replies can pull events into Xlib's queue without the
+        # socket becoming readable again.
+        GLib.idle_add(self.dispatch_x_events, disp_mgr.fileno())
+        return statuses
+
+    def start_fade(self, disp_mgr):
+        GLib.timeout_add(
+                int(1000 / disp_mgr.gamma.frame_rate),
+                self.on_fade_frame, disp_mgr)
+
+    def on_fade_frame(self, disp_mgr):
+        # The timer stops with the last frame of the fades.
+        return disp_mgr.gamma.advance() is not None
+
+    def handle_event(self, name, event):
+        try:
+            if isinstance(event, InitialDisplaysEvent):
+                self.show_gui(name)
+            elif isinstance(event, DisplaysChangedEvent):
+                gui = self.guis.get(name)
+                if event.changes.added:
+                    self.show_gui(name)
+                elif gui is not None and gui.window.get_visible():
+                    # Removed or changed displays must not linger on an
+                    # open dialog.
+                    gui.refresh()
+            else:
+                self.logger.warning("Unexpected event: %s", event)
+        except Exception as e:
+            self.logger.exception("Error handling event: %s", e)
+
+    def show_gui(self, name):
+        disp_mgr = self.screens.managers[name]
+        with disp_mgr.metrics.timed("gui_show"):
+            gui = self.guis.get(name)
+            if gui is None:
+                screen = self.get_gdk_screen(name)
+                if screen is None:
+                    return
+                gui = self.guis[name] = GUI(
+                        disp_mgr, partial(self.apply_layout, name),
+                        self.logger, screen)
+            gui.show()
+            gui.window.present()
+        disp_mgr.metrics.mark("gui_shown")
+
+    def get_gdk_screen(self, name):
+        if len(self.screens) == 1:
+            return Gdk.Screen.get_default()
+        display = Gdk.Display.open(name)
+        if display is None:
+            self.logger.error("GTK cannot open %s; no dialog there.", name)
+            return None
+        return display.get_default_screen()
+
+    def dump_metrics(self):
+        self.screens.dump_metrics(
+                partial(settings.metrics_path, self.config))
+        return True
+
+    def add_watch(self, fileobj, callback):
+        return GLib.io_add_watch(
+                fileobj.fileno(),
+                GLib.PRIORITY_DEFAULT,
+                GLib.IO_IN | GLib.IO_HUP | GLib.IO_ERR,
+                lambda fd, condition: callback(fileobj)
+                )
+
+    def on_x_readable(self, fd, condition):
+        self.dispatch_x_events(fd)
+        return True
+
+    def dispatch_x_events(self, fd):
+        for disp_mgr in self.screens.dispatch(fd):
+            source = self.settle_sources.get(disp_mgr)
+            if source is not None:
+                GLib.source_remove(source)
+            self.settle_sources[disp_mgr] = GLib.timeout_add(
+                    int(disp_mgr.settle_window * 1000),
+                    self.on_settled, disp_mgr)
+        return False
+
+    def on_settled(self, disp_mgr):
+        del self.settle_sources[disp_mgr]
+        disp_mgr.flush_events()
+        return False
+
+    def start(self):
+        # One watch per X connection, however many screens it serves.
+        for fd in self.screens.connections:
+            GLib.io_add_watch(
+                    fd,
+                    GLib.PRIORITY_DEFAULT,
+                    GLib.IO_IN,
+                    self.on_x_readable
+                    )
+        for control_server in self.control_servers:
+            control_server.start()
+        dump_signal = settings.metrics_signal(self.config)
+        if dump_signal is not None:
+            GLib.unix_signal_add(
+                    GLib.PRIORITY_DEFAULT, dump_signal, self.dump_metrics)
+        self.screens.check_initial_displays()
+        for fd in self.screens.connections:
+            self.dispatch_x_events(fd)
+        Gtk.main()
@@ -0,0 +1,388 @@
+import os
+import time
+from array import array
+from collections import Counter
+from types import SimpleNamespace
+
+from Xlib import X
+from Xlib.ext import randr
+
+
+SCREEN_CHANGE_NOTIFY = 89
+RANDR_NOTIFY = 90
+
+EXTENSION_EVENT = SimpleNamespace(
+    ScreenChangeNotify=SCREEN_CHANGE_NOTIFY,
+    CrtcChangeNotify=(RANDR_NOTIFY, randr.RRNotify_CrtcChange),
+    OutputChangeNotify=(RANDR_NOTIFY, randr.RRNotify_OutputChange),
+    OutputPropertyNotify=(RANDR_NOTIFY, randr.RRNotify_OutputProperty),
+    )
+
+# Event classes named like python-xlib's, so events can be told apart.
+EVENT_CLASSES = {
+    name: type(name, (SimpleNamespace,), {})
+    for name in ("ScreenChangeNotify", "CrtcChangeNotify",
+                 "OutputChangeNotify")
+    }
+
+EDID_ATOM = 500
+GAMMA_SIZE = 1024
+
+# Widths and heights the fake modes cycle through, widest first.
+GEOMETRIES = [
+    (3840, 2160), (2560, 1440), (1920, 1200), (1920, 1080), (1680, 1050),
+    (1600, 900), (1440, 900), (1366, 768), (1280, 1024), (1280, 720),
+    (1024, 768), (800, 600), (720, 400), (640, 480),
+    ]
+REFRESH_RATES = [60, 75, 120, 144, 50, 30]
+
+
+class FakeRequest:
+    """A request whose reply arrives with the backend's next round trip."""
+
+    def __init__(self, backend, kind, **fields):
+        self.backend = backend
+        self.kind = kind
+        self.answered = False
+        self.__dict__.update(fields)
+
+    def reply(self):
+        if not self.answered:
+            self.backend.round_trip()
+        return self
+
+
+class FakeRandrBackend:
+    """
+    An in-memory RandR server for benchmarks.
+
+    The screen has the given number of outputs, modes per output and
+    CRTCs, split round-robin between gpus so that an output can only be
+    driven by the CRTCs of its own GPU. Every request is counted by kind;
+    replies are only delivered by a round trip, which sleeps for latency
+    seconds and answers everything sent before it, so pipelined requests
+    cost one latency between them.
+    Configuration changes queue the events a real server would send.
+    """
+
+    def __init__(self, outputs=2, modes=10, crtcs=None, connected=None,
+                 active=1, latency=0.0, gpus=1):
+        self.latency = latency
+        self.requests = Counter()
+        self.round_trips = 0
+        self.in_flight = []
+        self.events = []
+        self.timestamp = 1
+        self.config_timestamp = 1
+        self.screen_size = (0, 0)
+        self.event_read_fd, self.event_write_fd = os.pipe()
+        os.set_blocking(self.event_read_fd, False)
+        os.set_blocking(self.event_write_fd, False)
+
+        self.modes = [
+            self.make_mode_info(300 + index, index) for index in range(modes)]
+        self.mode_names = "".join(
+                f"{mode.width}x{mode.height}" for mode in self.modes)
+        self.crtcs = {
+            100 + index: SimpleNamespace(
+                mode=0, x=0, y=0, width=0, height=0,
+                rotation=randr.Rotate_0, outputs=[],
+                gamma=[array("H", [index * 64 + index // 16
+                                   for index in range(GAMMA_SIZE)])] * 3)
+            for index in range(outputs if crtcs is None else crtcs)
+            }
+        connected = outputs if connected is None else connected
+        self.outputs = {
+            200 + index: SimpleNamespace(
+                name=f"OUT-{index}",
+                connection=(randr.Connected if index < connected
+                            else randr.Disconnected),
+                crtc=0,
+                crtcs=[crtc for crtc in self.crtcs
+                       if (crtc - 100) % gpus == index % gpus],
+                modes=[mode.id for mode in self.modes],
+                edid=self.make_edid(index) if index < connected else b"",
+                )
+            for index in range(outputs)
+            }
+
+        x = 0
+        for output, crtc in zip(list(self.outputs)[:active], self.crtcs):
+            mode = self.modes[0]
+            self.configure_crtc(crtc, x, 0, mode.id, randr.Rotate_0, [output])
+            x += mode.width
+        self.screen_size = (max(x, 320), self.modes[0].height if x else 200)
+        self.events.clear()
+
+    def make_mode_info(self, mode_id, index):
+        width, height = GEOMETRIES[index % len(GEOMETRIES)]
+        refresh_rate = REFRESH_RATES[
+                index // len(GEOMETRIES) % len(REFRESH_RATES)]
+        h_total, v_total = width + 160, height + 40
+        flags = randr.Interlace if index % 7 == 6 else 0
+        return SimpleNamespace(
+            id=mode_id,
+            width=width,
+            height=height,
+            dot_clock=h_total * v_total * refresh_rate,
+            h_total=h_total,
+            v_total=v_total,
+            flags=flags,
+            name_length=len(f"{width}x{height}"),
+            )
+
+    def make_edid(self, index):
+        edid = bytearray(128)
+        edid[0:8] = b"\x00\xff\xff\xff\xff\xff\xff\x00"
+        edid[8:10] = (0x10AC).to_bytes(2, "big")
+        edid[10:12] = index.to_bytes(2, "little")
+        edid[12:16] = (1000 + index).to_bytes(4, "little")
+        edid[21], edid[22] = 60, 34
+        return bytes(edid)
+
+    # Connection
+
+    def fileno(self):
+        return self.event_read_fd
+
+    def pending_events(self):
+        return len(self.events)
+
+    def next_event(self):
+        while not self.events:
+            self.round_trip()
+        try:
+            os.read(self.event_read_fd, 1)
+        except BlockingIOError:
+            pass
+        return self.events.pop(0)
+
+    def flush(self):
+        pass
+
+    def note(self, call, **args):
+        pass
+
+    def grab_server(self):
+        self.requests["GrabServer"] += 1
+
+    def ungrab_server(self):
+        self.requests["UngrabServer"] += 1
+
+    @property
+    def extension_event(self):
+        return EXTENSION_EVENT
+
+    def has_extension(self, name):
+        self.requests["QueryExtension"] += 1
+        self.round_trip()
+        return name == "RANDR"
+
+    def query_version(self):
+        return self.send("QueryVersion", False, major_version=1,
+                         minor_version=5).reply()
+
+    def get_atom(self, name):
+        return EDID_ATOM
+
+    def select_root_input(self, event_mask):
+        self.requests["ChangeWindowAttributes"] += 1
+
+    def select_randr_input(self, mask):
+        self.requests["SelectInput"] += 1
+
+    def screen_dimensions(self):
+        width, height = self.screen_size
+        return width, height, round(width / 3.78), round(height / 3.78)
+
+    # Requests
+
+    def send(self, kind, defer, **fields):
+        self.requests[kind] += 1
+        request = FakeRequest(self, kind, **fields)
+        self.in_flight.append(request)
+        if not defer:
+            request.reply()
+        return request
+
+    def round_trip(self):
+        """Answer everything in flight, paying the latency once."""
+        self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+        for request in self.in_flight:
+            request.answered = True
+        self.in_flight = []
+
+    def read_reply(self, request):
+        return request.reply()
+
+    def get_screen_resources(self, current=True):
+        return self.send(
+            "GetScreenResourcesCurrent" if current else "GetScreenResources",
+            False,
+            timestamp=self.timestamp,
+            config_timestamp=self.config_timestamp,
+            crtcs=list(self.crtcs),
+            outputs=list(self.outputs),
+            modes=list(self.modes),
+            mode_names=self.mode_names,
+            )
+
+    def get_screen_size_range(self):
+        return self.send(
+            "GetScreenSizeRange", False,
+            min_width=320, min_height=200, max_width=16384, max_height=16384)
+
+    def get_root_geometry(self):
+        width, height = self.screen_size
+        return self.send("GetGeometry", False, width=width, height=height)
+
+    def get_output_info(self, output, config_timestamp=X.CurrentTime,
+                        defer=False):
+        state = self.outputs[output]
+        return self.send(
+            "GetOutputInfo", defer,
+            timestamp=self.timestamp,
+            crtc=state.crtc,
+            name=state.name,
+            connection=state.connection,
+            crtcs=list(state.crtcs),
+            modes=list(state.modes),
+            )
+
+    def get_crtc_info(self, crtc, config_timestamp=X.CurrentTime,
+                      defer=False):
+        state = self.crtcs[crtc]
+        return self.send(
+            "GetCrtcInfo", defer,
+            timestamp=self.timestamp,
+            x=state.x, y=state.y, width=state.width, height=state.height,
+            mode=state.mode, rotation=state.rotation,
+            outputs=list(state.outputs),
+            possible_outputs=[
+                output for output, output_state in self.outputs.items()
+                if crtc in output_state.crtcs],
+            )
+
+    def get_output_property(self, output, atom, defer=False):
+        return self.send(
+                "GetOutputProperty", defer,
+                value=list(self.outputs[output].edid))
+
+    def set_crtc_config(self, crtc, config_timestamp, x, y, mode, rotation,
+                        outputs, defer=False):
+        if config_timestamp not in (X.CurrentTime, self.config_timestamp):
+            status = randr.SetConfigInvalidConfigTime
+        else:
+            self.configure_crtc(crtc, x, y, mode, rotation, outputs)
+            status = randr.SetConfigSuccess
+        return self.send(
+                "SetCrtcConfig", defer,
+                status=status, new_timestamp=self.timestamp)
+
+    def get_crtc_gamma_size(self, crtc, defer=False):
+        return self.send("GetCrtcGammaSize", defer, size=GAMMA_SIZE)
+
+    def get_crtc_gamma(self, crtc, defer=False):
+        red, green, blue = self.crtcs[crtc].gamma
+        return self.send(
+                "GetCrtcGamma", defer, size=GAMMA_SIZE,
+                red=list(red), green=list(green), blue=list(blue))
+
+    def set_crtc_gamma(self, crtc, size, red, green, blue):
+        self.requests["SetCrtcGamma"] += 1
+        self.crtcs[crtc].gamma = [red, green, blue]
+
+    def set_screen_size(self, width, height, width_mm, height_mm):
+        self.requests["SetScreenSize"] += 1
+        self.screen_size = (width, height)
+        self.queue_event(
+            "ScreenChangeNotify", type=SCREEN_CHANGE_NOTIFY,
+            width_in_pixels=width,
+            height_in_pixels=height,
+            config_timestamp=self.config_timestamp,
+            )
+
+    # Server side
+
+    def configure_crtc(self, crtc, x, y, mode, rotation, outputs):
+        state = self.crtcs[crtc]
+        for output in state.outputs:
+            self.outputs[output].crtc = 0
+        mode_info = next(
+                (info for info in self.modes if info.id == mode), None)
+        state.mode, state.x, state.y, state.rotation = mode, x, y, rotation
+        state.width = mode_info.width if mode_info else 0
+        state.height = mode_info.height if mode_info else 0
+        state.outputs = list(outputs) if mode else []
+        self.timestamp += 1
+
+        for output in state.outputs:
+            self.outputs[output].crtc = crtc
+        self.queue_event(
+            "CrtcChangeNotify",
+            type=RANDR_NOTIFY, sub_code=randr.RRNotify_CrtcChange,
+            crtc=crtc, mode=mode, x=x, y=y, rotation=rotation,
+            width=state.width, height=state.height, timestamp=self.timestamp)
+        for output in outputs:
+            self.queue_output_event(output)
+
+    def plug(self, output, connected=True):
+        """Connect or disconnect an output, as a hotplug would."""
+        state = self.outputs[output]
+        state.connection = randr.Connected if connected else \
+            randr.Disconnected
+        state.edid = self.make_edid(output) if connected else b""
+        if not connected and state.crtc:
+            self.configure_crtc(state.crtc, 0, 0, 0, randr.Rotate_0, [])
+        self.config_timestamp += 1
+        self.queue_output_event(output)
+
+    def add_output(self):
+        """Attach and connect a new output, as an MST hub would."""
+        output = max(self.outputs) + 1
+        self.outputs[output] = SimpleNamespace(
+            name=f"OUT-{output - 200}",
+            connection=randr.Connected,
+            crtc=0,
+            crtcs=list(self.crtcs),
+            modes=[mode.id for mode in self.modes],
+            edid=self.make_edid(output),
+            )
+        self.config_timestamp += 1
+        self.queue_output_event(output)
+        return output
+
+    def queue_output_event(self, output):
+        state = self.outputs[output]
+        crtc = self.crtcs.get(state.crtc)
+        self.queue_event(
+            "OutputChangeNotify",
+            type=RANDR_NOTIFY, sub_code=randr.RRNotify_OutputChange,
+            output=output, crtc=state.crtc, mode=crtc.mode if crtc else 0,
+            rotation=crtc.rotation if crtc else randr.Rotate_0,
+            connection=state.connection, timestamp=self.timestamp,
+            config_timestamp=self.config_timestamp)
+
+    def queue_event(self, kind, **fields):
+        self.events.append(EVENT_CLASSES[kind](**fields))
+        try:
+            os.write(self.event_write_fd, b"\0")
+        except BlockingIOError:
+            # The pipe only signals readability; a full one still does.
+            pass
+
+    def drain_events(self):
+        """Drop queued events without the cost of reading them."""
+        self.events.clear()
+        while True:
+            try:
+                if not os.read(self.event_read_fd, 4096):
+                    break
+            except BlockingIOError:
+                break
+
+    def reset_counters(self):
+        self.requests.clear()
+        self.round_trips = 0
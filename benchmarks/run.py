@@ -0,0 +1,291 @@
+"""
+Benchmark the display model against a fake RandR server, and against
+Xvfb when it is installed.
+
+    python -m benchmarks.run [--latency MS] [--output FILE]
+    python -m benchmarks.run --compare benchmarks/baseline.json
+
+Every case reports the median wall time of an operation and how many
+requests and round trips it cost. Round trips are exact for the fake
+backend; wall time on it is dominated by --latency per round trip.
+"""
+import argparse
+import configparser
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import time
+
+from display_manager import DisplayManager
+from utils.logger import Logger
+
+from benchmarks.fake_backend import FakeRandrBackend
+
+
+SIZES = [(2, 10), (4, 40), (8, 160), (16, 320)]
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def make_logger():
+    config = configparser.ConfigParser()
+    config.read_dict({"LOGGING": {"LEVEL": "WARNING", "LOG_FILE_PATH": ""}})
+    return Logger(config, name="benchmarks")
+
+
+logger = make_logger()
+
+
+def ignore_event(event):
+    pass
+
+
+def measure(operation, repeat, backend=None, setup=None):
+    """
+    Run operation repeat times and return its median wall time in
+    milliseconds, with the requests and round trips of the last run.
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        if isinstance(backend, FakeRandrBackend):
+            backend.reset_counters()
+        start = time.perf_counter()
+        operation()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    result = {"median_ms": round(statistics.median(timings), 4)}
+    if isinstance(backend, FakeRandrBackend):
+        result["requests"] = sum(backend.requests.values())
+        result["round_trips"] = backend.round_trips
+        result["by_kind"] = dict(sorted(backend.requests.items()))
+    return result
+
+
+def make_manager(backend):
+    return DisplayManager(
+            ignore_event, logger, settle_window=0, backend=backend)
+
+
+def bench_enumeration(display_manager, backend, repeat):
+    def cold():
+        display_manager.invalidate_snapshot()
+        display_manager.mode_catalog = None
+        display_manager.edid_cache.digest_by_output.clear()
+        display_manager.get_connected_displays()
+
+    def warm():
+        display_manager.invalidate_snapshot()
+        display_manager.get_connected_displays()
+
+    return {
+        "enumeration_cold": measure(cold, repeat, backend),
+        "enumeration": measure(warm, repeat, backend),
+        }
+
+
+def bench_process_event(display_manager, backend, repeat):
+    """Unplug and replug the last output and process what the server sends."""
+    output = list(backend.outputs)[-1]
+
+    def unplug():
+        display_manager.update_display_info()
+        backend.drain_events()
+        backend.plug(output, connected=False)
+
+    def replug():
+        display_manager.update_display_info()
+        backend.drain_events()
+        backend.plug(output, connected=True)
+
+    def process():
+        display_manager.dispatch_pending()
+        display_manager.flush_events()
+
+    return {
+        "process_event_unplug": measure(process, repeat, backend, unplug),
+        "process_event_replug": measure(process, repeat, backend, replug),
+        }
+
+
+def bench_turn_on_off(display_manager, backend, repeat):
+    """Turn the last display on next to the primary and off again."""
+    def reset():
+        display_manager.update_display_info()
+        backend.drain_events()
+
+    def target():
+        display_info = display_manager.displays[-1]
+        return display_info, display_info["modes"][0]
+
+    def turn_on():
+        display_info, mode = target()
+        display_manager.turn_on_display(display_info["name"], mode)
+
+    def turn_off():
+        display_info, _ = target()
+        display_manager.turn_off_display(
+                display_info["name"], display_info["crtc"])
+
+    def turn_on_reset():
+        reset()
+        turn_off()
+        reset()
+
+    def turn_off_reset():
+        reset()
+        turn_on()
+        reset()
+
+    return {
+        "turn_on_display": measure(turn_on, repeat, backend, turn_on_reset),
+        "turn_off_display": measure(
+            turn_off, repeat, backend, turn_off_reset),
+        }
+
+
+def bench_gui(display_manager, repeat):
+    """Toggle every mode flag filter on the first page of the dialog."""
+    try:
+        import gi
+        gi.require_version("Gtk", "3.0")
+        from gi.repository import Gtk
+    except (ImportError, ValueError) as e:
+        return {"update_display_modes": {"skipped": f"no GTK: {e}"}}
+    if not Gtk.init_check(None)[0]:
+        return {"update_display_modes": {"skipped": "no display for GTK"}}
+
+    from gui import GUI
+
+    class Toggle:
+        active = False
+
+        def get_active(self):
+            return self.active
+
+    gui = GUI(display_manager, lambda layout, remember: None, logger)
+    gui.reconcile_pages(display_manager.displays)
+    page = next(iter(gui.pages.values()))
+    gui.build_page(page)
+    toggle = Toggle()
+
+    def toggle_flags():
+        for flag in gui.FLAGS:
+            toggle.active = not toggle.active
+            gui.update_display_modes(toggle, page, flag)
+        while Gtk.events_pending():
+            Gtk.main_iteration()
+
+    result = measure(toggle_flags, repeat)
+    gui.window.destroy()
+    return {"update_display_modes": result}
+
+
+def run_fake(latency, repeat):
+    results = []
+    for outputs, modes in SIZES:
+        backend = FakeRandrBackend(
+                outputs=outputs, modes=modes, active=1, latency=latency)
+        display_manager = make_manager(backend)
+        case = {"outputs": outputs, "modes": modes}
+        case.update(bench_enumeration(display_manager, backend, repeat))
+        case.update(bench_process_event(display_manager, backend, repeat))
+        case.update(bench_turn_on_off(display_manager, backend, repeat))
+        case.update(bench_gui(display_manager, repeat))
+        results.append(case)
+    return results
+
+
+def run_xvfb(repeat):
+    """Enumerate and apply against a real X server, when Xvfb exists."""
+    xvfb = shutil.which("Xvfb")
+    if xvfb is None:
+        return {"skipped": "Xvfb not installed"}
+
+    from Xlib.display import Display
+    from randr_backend import XlibRandrBackend
+
+    name = f":{100 + os.getpid() % 400}"
+    server = subprocess.Popen(
+            [xvfb, name, "-screen", "0", "1920x1080x24", "-nolisten", "tcp"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        backend = None
+        deadline = time.monotonic() + 5
+        while backend is None:
+            try:
+                backend = XlibRandrBackend(Display(name))
+            except Exception:
+                if time.monotonic() > deadline:
+                    return {"skipped": "Xvfb did not start"}
+                time.sleep(0.05)
+
+        display_manager = make_manager(backend)
+        case = {"outputs": len(display_manager.displays)}
+        case.update(bench_enumeration(display_manager, backend, repeat))
+        case.update(bench_turn_on_off(display_manager, backend, repeat))
+        return case
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def compare(baseline, current):
+    """Print the wall time and round trip changes from a baseline."""
+    baseline_cases = {
+        (case["outputs"], case["modes"]): case for case in baseline["fake"]}
+    for case in current["fake"]:
+        previous = baseline_cases.get((case["outputs"], case["modes"]))
+        if previous is None:
+            continue
+        for key, result in case.items():
+            before = previous.get(key)
+            if not isinstance(result, dict) or not isinstance(before, dict) \
+                    or "median_ms" not in result:
+                continue
+            print(
+                f"{case['outputs']:>3} outputs {case['modes']:>4} modes "
+                f"{key:<24} {before['median_ms']:>9.3f} -> "
+                f"{result['median_ms']:>9.3f} ms, round trips "
+                f"{before.get('round_trips')} -> {result.get('round_trips')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Benchmark the display model.")
+    parser.add_argument(
+            "--latency", type=float, default=0.0,
+            help="Milliseconds the fake server waits per round trip")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument(
+            "--compare", metavar="BASELINE",
+            help="Print changes from a baseline instead of saving")
+    parser.add_argument("--no-xvfb", action="store_true")
+    args = parser.parse_args()
+
+    results = {
+        "python": platform.python_version(),
+        "latency_ms": args.latency,
+        "repeat": args.repeat,
+        "fake": run_fake(args.latency / 1000, args.repeat),
+        "xvfb": ({"skipped": "disabled"} if args.no_xvfb
+                 else run_xvfb(args.repeat)),
+        }
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            compare(json.load(baseline_file), results)
+        return
+
+    with open(args.output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+        output_file.write("\n")
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
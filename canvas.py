@@ -0,0 +1,229 @@
+import math
+
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gdk, Gtk
+
+from layout import EdgeIndex, bounding_box
+
+
+# Distance in widget pixels within which a dragged output snaps.
+SNAP_DISTANCE = 12
+MARGIN = 16
+BACKGROUND = (0.18, 0.18, 0.2)
+OUTPUT_FILL = (0.32, 0.45, 0.62)
+DRAGGED_FILL = (0.42, 0.58, 0.8)
+OUTPUT_BORDER = (0.9, 0.9, 0.9)
+
+
+class CanvasOutput:
+    """One output on the canvas, in screen pixels."""
+
+    __slots__ = ("name", "x", "y", "width", "height", "rotation")
+
+    def __init__(self, name, x, y, width, height, rotation):
+        self.name = name
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.rotation = rotation
+
+    @property
+    def rect(self):
+        return self.x, self.y, self.width, self.height
+
+
+class LayoutCanvas:
+    """
+    A cairo drawing of the active outputs at scale, where outputs are
+    dragged into place.
+
+    The scale is only recomputed when no drag is in progress, so a drag
+    invalidates just the rectangles the output leaves and enters and
+    draw skips every output outside the clip. Snapping looks up the
+    edges of the other outputs in an EdgeIndex built when the drag
+    starts. Positions are in screen pixels and feed the apply path as
+    they are.
+    """
+
+    def __init__(self):
+        self.outputs = {}
+        self.scale = 1.0
+        self.origin = (0.0, 0.0)
+        self.dragged = None
+        self.drag_offset = (0, 0)
+        self.edge_index = None
+
+        self.area = Gtk.DrawingArea()
+        self.area.set_size_request(520, 180)
+        self.area.add_events(
+                Gdk.EventMask.BUTTON_PRESS_MASK
+                | Gdk.EventMask.BUTTON_RELEASE_MASK
+                | Gdk.EventMask.POINTER_MOTION_MASK)
+        self.area.connect("draw", self.on_draw)
+        self.area.connect("size-allocate", self.on_size_allocate)
+        self.area.connect("button-press-event", self.on_button_press)
+        self.area.connect("motion-notify-event", self.on_motion)
+        self.area.connect("button-release-event", self.on_button_release)
+
+    def set_outputs(self, layout):
+        """Show the entries of a layout: name, x, y, width and height."""
+        self.outputs = {
+            entry["name"]: CanvasOutput(
+                entry["name"], entry["x"], entry["y"], entry["width"],
+                entry["height"], entry["rotation"])
+            for entry in layout}
+        self.dragged = None
+        self.rescale()
+
+    def set_output(self, name, width, height, rotation):
+        """
+        Resize an output in place, or add it to the right of the others.
+        """
+        output = self.outputs.get(name)
+        if output is None:
+            _, min_y, max_x, _ = bounding_box(
+                    other.rect for other in self.outputs.values())
+            output = self.outputs[name] = CanvasOutput(
+                    name, max_x, min_y, width, height, rotation)
+        else:
+            output.width, output.height = width, height
+            output.rotation = rotation
+        self.rescale()
+
+    def remove_output(self, name):
+        if self.outputs.pop(name, None) is not None:
+            if self.dragged is not None and self.dragged.name == name:
+                self.dragged = None
+            self.rescale()
+
+    # Geometry
+
+    def rescale(self):
+        """Fit every output, plus room to drag, and redraw everything."""
+        allocation = self.area.get_allocation()
+        min_x, min_y, max_x, max_y = bounding_box(
+                output.rect for output in self.outputs.values())
+        # Leave room around the layout to drag an output to any side.
+        slack = max((max(output.width, output.height)
+                     for output in self.outputs.values()), default=0) / 2
+        width = max(max_x - min_x + 2 * slack, 1)
+        height = max(max_y - min_y + 2 * slack, 1)
+        self.scale = max(min(
+            (allocation.width - 2 * MARGIN) / width,
+            (allocation.height - 2 * MARGIN) / height), 1e-3)
+        self.origin = (
+            (allocation.width - (max_x - min_x) * self.scale) / 2
+            - min_x * self.scale,
+            (allocation.height - (max_y - min_y) * self.scale) / 2
+            - min_y * self.scale)
+        self.area.queue_draw()
+
+    def to_widget(self, output):
+        origin_x, origin_y = self.origin
+        return (origin_x + output.x * self.scale,
+                origin_y + output.y * self.scale,
+                output.width * self.scale,
+                output.height * self.scale)
+
+    def damage(self, output):
+        x, y, width, height = self.to_widget(output)
+        # Pad for the border and antialiasing.
+        self.area.queue_draw_area(
+                math.floor(x) - 2, math.floor(y) - 2,
+                math.ceil(width) + 4, math.ceil(height) + 4)
+
+    def output_at(self, widget_x, widget_y):
+        # The output drawn last is on top.
+        for output in reversed(list(self.outputs.values())):
+            x, y, width, height = self.to_widget(output)
+            if x <= widget_x < x + width and y <= widget_y < y + height:
+                return output
+        return None
+
+    # Events
+
+    def on_size_allocate(self, area, allocation):
+        if self.dragged is None:
+            self.rescale()
+
+    def on_button_press(self, area, event):
+        if event.button != Gdk.BUTTON_PRIMARY:
+            return False
+        output = self.output_at(event.x, event.y)
+        if output is None:
+            return False
+
+        origin_x, origin_y = self.origin
+        self.dragged = output
+        self.drag_offset = (
+            (event.x - origin_x) / self.scale - output.x,
+            (event.y - origin_y) / self.scale - output.y)
+        self.edge_index = EdgeIndex(
+            other.rect for other in self.outputs.values()
+            if other is not output)
+        # Draw the dragged output on top of the others.
+        del self.outputs[output.name]
+        self.outputs[output.name] = output
+        self.damage(output)
+        return True
+
+    def on_motion(self, area, event):
+        output = self.dragged
+        if output is None:
+            return False
+
+        origin_x, origin_y = self.origin
+        offset_x, offset_y = self.drag_offset
+        x = round((event.x - origin_x) / self.scale - offset_x)
+        y = round((event.y - origin_y) / self.scale - offset_y)
+        x, y = self.edge_index.snap(
+                x, y, output.width, output.height,
+                SNAP_DISTANCE / self.scale)
+        if (x, y) == (output.x, output.y):
+            return True
+
+        self.damage(output)
+        output.x, output.y = x, y
+        self.damage(output)
+        return True
+
+    def on_button_release(self, area, event):
+        if self.dragged is None:
+            return False
+        self.dragged = None
+        self.edge_index = None
+        self.rescale()
+        return True
+
+    def on_draw(self, area, cr):
+        clip_x1, clip_y1, clip_x2, clip_y2 = cr.clip_extents()
+        cr.set_source_rgb(*BACKGROUND)
+        cr.paint()
+
+        cr.set_line_width(1)
+        cr.set_font_size(11)
+        for output in self.outputs.values():
+            x, y, width, height = self.to_widget(output)
+            if x > clip_x2 or y > clip_y2 or x + width < clip_x1 \
+                    or y + height < clip_y1:
+                continue
+
+            cr.rectangle(x + 0.5, y + 0.5, width - 1, height - 1)
+            cr.set_source_rgb(*(DRAGGED_FILL if output is self.dragged
+                                else OUTPUT_FILL))
+            cr.fill_preserve()
+            cr.set_source_rgb(*OUTPUT_BORDER)
+            cr.stroke()
+
+            cr.save()
+            cr.rectangle(x, y, width, height)
+            cr.clip()
+            cr.move_to(x + 6, y + 16)
+            cr.show_text(output.name)
+            cr.move_to(x + 6, y + 30)
+            cr.show_text(f"{output.width}x{output.height}"
+                         f"{output.x:+d}{output.y:+d}")
+            cr.restore()
+        return False
@@ -0,0 +1,294 @@
+import json
+import re
+import signal
+import sys
+import time
+from functools import partial
+
+from utils.logger import Logger
+from control import ControlServer
+from display_manager import DisplayManager, apply_succeeded, \
+    describe_display
+from randr_trace import ReplayBackend, TraceError, replay_trace
+from screens import ScreenSet
+import settings
+
+
+LAYOUT_SPEC = re.compile(
+        r"^(?P<name>[^=]+)=(?P<width>\d+)x(?P<height>\d+)"
+        r"(?:@(?P<rate>\d+(?:\.\d+)?))?"
+        r"(?:(?P<x>[+-]\d+)(?P<y>[+-]\d+))?$")
+
+# The commands that change CRTCs; only they open a command connection.
+CONFIGURING_COMMANDS = ("apply", "watch")
+
+
+def add_commands(subparsers):
+    list_parser = subparsers.add_parser(
+            "list", help="print the connected displays")
+    list_parser.add_argument(
+            "--json", action="store_true", help="print JSON instead of text")
+
+    apply_parser = subparsers.add_parser(
+            "apply", help="apply a layout or the saved profile")
+    apply_parser.add_argument(
+            "outputs", nargs="*", metavar="NAME=WxH[@RATE][+X+Y]",
+            help="displays to enable; every other display is turned off")
+    apply_parser.add_argument(
+            "--profile", action="store_true",
+            help="apply the saved profile for the connected monitors")
+    apply_parser.add_argument(
+            "--save", action="store_true",
+            help="save the applied layout as the profile for these monitors")
+
+    gamma_parser = subparsers.add_parser(
+            "gamma", help="set the brightness and colour temperature")
+    gamma_parser.add_argument(
+            "outputs", nargs="*", metavar="NAME",
+            help="displays to change; all active displays by default")
+    gamma_parser.add_argument(
+            "--brightness", type=float, help="from 0.1 to 1.0")
+    gamma_parser.add_argument(
+            "--temperature", type=int, metavar="KELVIN",
+            help="colour temperature; 6500 is neutral")
+    gamma_parser.add_argument(
+            "--fade", type=float, default=0.0, metavar="SECONDS",
+            help="fade to the new values over SECONDS")
+
+    subparsers.add_parser(
+            "watch", help="apply saved profiles on hotplug without a GUI")
+
+    for subparser in subparsers.choices.values():
+        subparser.add_argument(
+                "--timings", action="store_true",
+                help="print startup and command timings to stderr")
+        subparser.add_argument(
+                "--display", action="append", metavar="DISPLAY[.SCREEN]",
+                help="X display or screen to manage, instead of $DISPLAY "
+                     "or DISPLAYS in config.ini; may be repeated")
+        subparser.add_argument(
+                "--record", metavar="FILE",
+                help="record X events and replies to FILE for replay, "
+                     "instead of RECORD_PATH in config.ini")
+
+    replay_parser = subparsers.add_parser(
+            "replay", help="run a recorded trace through the display model")
+    replay_parser.add_argument("trace", metavar="FILE")
+    replay_parser.add_argument(
+            "--realtime", action="store_true",
+            help="keep the recorded time between events")
+    replay_parser.add_argument(
+            "--json", action="store_true",
+            help="print the metrics of the replay as JSON")
+
+
+def run_command(args, started):
+    """Run a headless command and return the process exit status."""
+    config = settings.load_config()
+    logger = Logger(config)
+    if args.command == "replay":
+        return replay_displays(args, config, logger)
+    timings = [("imports", time.perf_counter() - started)]
+
+    phase_started = time.perf_counter()
+    command_connection = (settings.command_connection(config)
+                          and args.command in CONFIGURING_COMMANDS)
+    screens = ScreenSet(
+            args.display or settings.displays(config),
+            lambda name, event: print(name, event, flush=True),
+            logger,
+            record_path=args.record or settings.record_path(config),
+            command_connection=command_connection,
+            settle_window=settings.settle_window(config),
+            profile_store=settings.profile_store(config)
+            )
+    timings.append(("connect", time.perf_counter() - phase_started))
+
+    if args.command == "watch":
+        report_timings(args, config, logger, timings)
+        for name, display_manager in screens:
+            screen_name = screens.screen_suffix(name)
+            if settings.control_enabled(config):
+                ControlServer(
+                    display_manager,
+                    settings.control_socket_path(config, screen_name),
+                    screens.add_watch,
+                    screens.remove_watch,
+                    logger,
+                    metrics_path=settings.metrics_path(config, screen_name)
+                    ).start()
+        dump_signal = settings.metrics_signal(config)
+        if dump_signal is not None:
+            signal.signal(
+                dump_signal,
+                lambda signum, frame: screens.dump_metrics(
+                    partial(settings.metrics_path, config)))
+        screens.check_initial_displays()
+        screens.start_monitoring()
+        return 0
+
+    phase_started = time.perf_counter()
+    commands = {
+        "list": list_displays,
+        "apply": apply_displays,
+        "gamma": adjust_gamma,
+        }
+    status = commands[args.command](screens, args)
+    timings.append((args.command, time.perf_counter() - phase_started))
+
+    report_timings(args, config, logger, timings)
+    return status
+
+
+def report_timings(args, config, logger, timings):
+    total = sum(seconds for _, seconds in timings)
+    budget = config.getfloat("CLI", "STARTUP_BUDGET_MS", fallback=150) / 1000
+    if total > budget:
+        logger.warning(
+                "Headless %s took %.1f ms, over the %.0f ms budget",
+                args.command, total * 1000, budget * 1000)
+
+    if args.timings:
+        for phase, seconds in timings:
+            print(f"{phase:>8}: {seconds * 1000:8.2f} ms", file=sys.stderr)
+        print(f"{'total':>8}: {total * 1000:8.2f} ms", file=sys.stderr)
+
+
+def list_displays(screens, args):
+    displays_by_screen = {
+        name: [describe_display(display_info)
+               for display_info in display_manager.displays]
+        for name, display_manager in screens
+        }
+
+    if args.json:
+        # A single screen keeps the plain list of displays.
+        print(json.dumps(
+            displays_by_screen if len(screens) > 1
+            else next(iter(displays_by_screen.values())), indent=2))
+        return 0
+
+    for name, displays in displays_by_screen.items():
+        if len(screens) > 1:
+            print(f"{name}:")
+        for display in displays:
+            mode = "off" if display["mode"] is None else \
+                "{}x{}@{}".format(*display["mode"])
+            print(f"{display['name']:<10} {display['status']:<9} "
+                  f"{mode:<18} {display['monitor'] or ''}")
+    return 0
+
+
+def apply_displays(screens, args):
+    if args.profile:
+        status = 0
+        for name, display_manager in screens:
+            if not display_manager.apply_saved_profile():
+                print(f"No saved profile for the monitors on {name}.",
+                      file=sys.stderr)
+                status = 1
+        return status
+
+    if len(screens) > 1:
+        print("Choose one screen with --display to apply a layout.",
+              file=sys.stderr)
+        return 2
+    _, display_manager = next(iter(screens))
+
+    try:
+        layout = [parse_layout_spec(display_manager, spec)
+                  for spec in args.outputs]
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if not layout:
+        print("Nothing to apply.", file=sys.stderr)
+        return 2
+
+    statuses = display_manager.apply_layout(layout)
+    if not apply_succeeded(statuses):
+        return 1
+    if args.save:
+        display_manager.save_profile(layout)
+    return 0
+
+
+def adjust_gamma(screens, args):
+    if args.brightness is None and args.temperature is None:
+        print("Give --brightness, --temperature or both.", file=sys.stderr)
+        return 2
+
+    changed = []
+    for _, display_manager in screens:
+        changed += display_manager.adjust_gamma(
+                args.outputs, args.brightness, args.temperature, args.fade)
+    # Nothing else runs in this process, so wait for the fades here.
+    controllers = [display_manager.gamma for _, display_manager in screens]
+    while True:
+        deadlines = [controller.deadline for controller in controllers
+                     if controller.deadline is not None]
+        if not deadlines:
+            break
+        time.sleep(max(0, min(deadlines) - time.monotonic()))
+        for controller in controllers:
+            controller.advance()
+
+    missing = set(args.outputs) - set(changed)
+    if missing:
+        print(f"Not active: {', '.join(sorted(missing))}", file=sys.stderr)
+    return 0 if changed and not missing else 1
+
+
+def replay_displays(args, config, logger):
+    try:
+        backend = ReplayBackend(args.trace)
+    except (OSError, ValueError, TraceError) as e:
+        print(f"Cannot read {args.trace}: {e}", file=sys.stderr)
+        return 2
+
+    display_manager = DisplayManager(
+            lambda event: print(backend.name, event, flush=True),
+            logger,
+            settle_window=settings.settle_window(config),
+            profile_store=backend.profile_store,
+            backend=backend)
+    phase_started = time.perf_counter()
+    try:
+        counts = replay_trace(display_manager, backend, args.realtime)
+    except TraceError as e:
+        print(e, file=sys.stderr)
+        return 1
+    elapsed_ms = (time.perf_counter() - phase_started) * 1000
+
+    if args.json:
+        print(json.dumps(display_manager.metrics.as_dict(), indent=2))
+    print(f"Replayed {counts['events']} events, "
+          f"{counts['flush_events']} flushes, "
+          f"{counts['apply_layout']} applies and "
+          f"{counts['turn_off_display']} turn-offs in {elapsed_ms:.1f} ms",
+          file=sys.stderr)
+    return 0
+
+
+def parse_layout_spec(display_manager, spec):
+    match = LAYOUT_SPEC.match(spec)
+    if match is None:
+        raise ValueError(f"Invalid layout {spec!r}")
+
+    display_info = display_manager.find_display(match["name"])
+    if display_info is None:
+        raise ValueError(f"Display {match['name']} is not connected")
+
+    width, height = int(match["width"]), int(match["height"])
+    mode = display_manager.find_mode(
+            display_info, width, height,
+            float(match["rate"]) if match["rate"] else None)
+    if mode is None:
+        raise ValueError(f"{match['name']} has no {width}x{height} mode")
+
+    return {
+        "name": match["name"],
+        "mode": mode,
+        "x": int(match["x"] or 0),
+        "y": int(match["y"] or 0),
+        }
@@ -0,0 +1,122 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+
+# Backend methods that take defer=True and are answered by read_reply.
+DEFERRABLE = frozenset((
+    "get_output_info", "get_crtc_info", "get_output_property",
+    "set_crtc_config", "get_crtc_gamma_size", "get_crtc_gamma",
+    ))
+
+
+def run_batches(backend, batches):
+    """
+    Send every operation of batches, flush once and read the replies.
+
+    batches is a list of (operations, grab, future), where operations
+    are (method name, args) of backend methods. Each future gets the
+    results of its operations in order: the reply of a deferrable
+    request, or what any other method returned.
+    """
+    sent = []
+    for operations, grab, future in batches:
+        if not future.set_running_or_notify_cancel():
+            continue
+        results = []
+        try:
+            if grab:
+                backend.grab_server()
+            try:
+                for name, args in operations:
+                    method = getattr(backend, name)
+                    if name in DEFERRABLE:
+                        results.append(method(*args, defer=True))
+                    else:
+                        results.append(method(*args))
+            finally:
+                if grab:
+                    backend.ungrab_server()
+        except Exception as e:
+            future.set_exception(e)
+            continue
+        sent.append((operations, results, future))
+
+    try:
+        backend.flush()
+    except Exception as e:
+        # A broken connection must not leave a caller waiting forever.
+        for _, _, future in sent:
+            future.set_exception(e)
+        return
+    for operations, results, future in sent:
+        try:
+            future.set_result([
+                backend.read_reply(result) if name in DEFERRABLE else result
+                for (name, _), result in zip(operations, results)])
+        except Exception as e:
+            future.set_exception(e)
+
+
+class InlineCommands:
+    """Run command batches at once on the event connection's backend."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def submit(self, operations, grab=False):
+        future = Future()
+        run_batches(self.backend, [(operations, grab, future)])
+        return future
+
+    def close(self):
+        pass
+
+
+class CommandWorker:
+    """
+    A worker thread that owns a second X connection for commands.
+
+    Layouts and CRTC changes are sent on this connection while the
+    event connection only ever reads events, so applying a layout never
+    interleaves its replies with the event stream. Batches submitted
+    while the worker is busy are sent together on its next turn, with
+    a single flush, and every batch is answered through its future.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.batches = queue.SimpleQueue()
+        self.thread = threading.Thread(
+                target=self.run, name="x-commands", daemon=True)
+        self.thread.start()
+
+    def submit(self, operations, grab=False):
+        """
+        Queue operations, (backend method name, args) pairs, to be sent
+        in one go, inside a server grab when grab is set. Returns a
+        Future of their results.
+        """
+        future = Future()
+        self.batches.put((list(operations), grab, future))
+        return future
+
+    def run(self):
+        while True:
+            batches = [self.batches.get()]
+            while True:
+                try:
+                    batches.append(self.batches.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = None in batches
+            run_batches(self.backend, [
+                batch for batch in batches if batch is not None])
+            if stop:
+                return
+
+    def close(self):
+        """Stop the worker once the queued batches are sent."""
+        self.batches.put(None)
+        self.thread.join()
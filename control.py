@@ -0,0 +1,246 @@
+import json
+import os
+import socket
+
+from display_manager import apply_succeeded, describe_display
+
+
+class ControlClient:
+    """One connection to the control socket."""
+
+    def __init__(self, connection, watch):
+        self.connection = connection
+        self.watch = watch
+        self.buffer = b""
+        self.subscribed = False
+
+
+class ControlServer:
+    """
+    Serve the cached display model on a Unix-domain socket.
+
+    Requests and replies are single JSON lines. "list" is answered from
+    DisplayManager.displays without touching the X server, "apply" takes
+    a layout, "subscribe" keeps the connection open to stream every
+    coalesced display event and "metrics" returns the DisplayManager's
+    request counts, latencies and hotplug traces, writing them to
+    metrics_path as well when the request has "dump" set. "gamma" sets
+    the "brightness" and "temperature" of the "outputs", or of all
+    active displays, over "fade" seconds; the reply comes at once and
+    the fade runs from the main loop. add_watch and remove_watch hook
+    the sockets into whichever main loop owns the X connection.
+    """
+
+    MAX_REQUEST_SIZE = 65536
+
+    def __init__(self, display_manager, path, add_watch, remove_watch,
+                 logger, apply_layout=None, metrics_path=None):
+        self.display_manager = display_manager
+        self.path = path
+        self.add_watch = add_watch
+        self.remove_watch = remove_watch
+        self.logger = logger
+        self.apply_layout = apply_layout or display_manager.apply_layout
+        self.metrics_path = metrics_path
+
+        self.server = None
+        self.server_watch = None
+        self.clients = {}
+        self.model_cache = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self.server.listen()
+        self.server.setblocking(False)
+
+        self.server_watch = self.add_watch(self.server, self.accept)
+        self.display_manager.add_listener(self.notify)
+        self.logger.info("Control socket listening on %s", self.path)
+
+    def stop(self):
+        for connection in list(self.clients):
+            self.close_client(connection)
+        if self.server is not None:
+            self.remove_watch(self.server_watch)
+            self.server.close()
+            self.server = None
+            os.unlink(self.path)
+
+    def accept(self, server):
+        try:
+            connection, _ = server.accept()
+        except BlockingIOError:
+            return True
+
+        connection.setblocking(False)
+        watch = self.add_watch(connection, self.read)
+        self.clients[connection] = ControlClient(connection, watch)
+        return True
+
+    def read(self, connection):
+        client = self.clients.get(connection)
+        if client is None:
+            return True
+
+        try:
+            data = connection.recv(self.MAX_REQUEST_SIZE)
+        except BlockingIOError:
+            return True
+        except OSError:
+            data = b""
+        if not data:
+            self.close_client(connection)
+            return True
+
+        client.buffer += data
+        if len(client.buffer) > self.MAX_REQUEST_SIZE:
+            self.close_client(connection)
+            return True
+
+        *lines, client.buffer = client.buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                self.send(client, self.handle_request(client, line))
+        return True
+
+    def handle_request(self, client, line):
+        try:
+            request = json.loads(line)
+            command = request["command"]
+        except (ValueError, KeyError, TypeError):
+            return {"ok": False, "error": "invalid request"}
+
+        if command == "list":
+            return self.get_model()
+        if command == "subscribe":
+            client.subscribed = True
+            return self.get_model()
+        if command == "apply":
+            return self.handle_apply(request.get("layout"))
+        if command == "metrics":
+            return self.handle_metrics(request.get("dump", False))
+        if command == "gamma":
+            return self.handle_gamma(request)
+        return {"ok": False, "error": f"unknown command {command!r}"}
+
+    def get_model(self):
+        # The reply is rebuilt only after the model changed.
+        if self.model_cache is None:
+            self.model_cache = {
+                "ok": True,
+                "displays": [
+                    describe_display(display_info)
+                    for display_info in self.display_manager.displays
+                    ],
+                }
+        return self.model_cache
+
+    def handle_apply(self, entries):
+        if not isinstance(entries, list) or not entries:
+            return {"ok": False, "error": "layout must be a non-empty list"}
+
+        layout = []
+        for entry in entries:
+            try:
+                layout.append(self.resolve_entry(entry))
+            except (KeyError, TypeError, ValueError) as e:
+                return {"ok": False, "error": str(e)}
+
+        statuses = self.apply_layout(layout)
+        # The replies of the apply may already have updated the model.
+        self.model_cache = None
+        return {
+            "ok": apply_succeeded(statuses),
+            "statuses": {str(crtc): status
+                         for crtc, status in statuses.items()},
+            }
+
+    def handle_metrics(self, dump):
+        metrics = self.display_manager.metrics
+        reply = {"ok": True, "metrics": metrics.as_dict()}
+        if dump and self.metrics_path:
+            try:
+                metrics.dump(self.metrics_path)
+            except OSError as e:
+                return {"ok": False, "error": str(e)}
+            reply["path"] = self.metrics_path
+        return reply
+
+    def handle_gamma(self, request):
+        outputs = request.get("outputs")
+        if outputs is not None and not (
+                isinstance(outputs, list)
+                and all(isinstance(name, str) for name in outputs)):
+            return {"ok": False, "error": "outputs must be a list of names"}
+
+        try:
+            changed = self.display_manager.adjust_gamma(
+                outputs,
+                request.get("brightness"),
+                request.get("temperature"),
+                float(request.get("fade", 0)))
+        except (TypeError, ValueError) as e:
+            return {"ok": False, "error": str(e)}
+        return {"ok": bool(changed), "outputs": changed}
+
+    def resolve_entry(self, entry):
+        """
+        Turn {"name", "width", "height", ["refresh"], ["x"], ["y"]} into
+        a DisplayManager layout entry.
+        """
+        display_info = self.display_manager.find_display(entry["name"])
+        if display_info is None:
+            raise ValueError(f"Display {entry['name']} is not connected")
+
+        mode = self.display_manager.find_mode(
+                display_info, int(entry["width"]), int(entry["height"]),
+                entry.get("refresh"))
+        if mode is None:
+            raise ValueError(f"{entry['name']} has no such mode")
+
+        return {
+            "name": entry["name"],
+            "mode": mode,
+            "x": int(entry.get("x", 0)),
+            "y": int(entry.get("y", 0)),
+            }
+
+    def notify(self, display_event):
+        self.model_cache = None
+        subscribers = [client for client in self.clients.values()
+                       if client.subscribed]
+        if not subscribers:
+            return
+
+        message = {
+            "event": type(display_event).__name__,
+            "folded": display_event.folded,
+            "changes": {
+                kind: [display["name"] for display in displays]
+                for kind, displays
+                in display_event.changes._asdict().items()
+                },
+            }
+        for client in subscribers:
+            self.send(client, message)
+
+    def send(self, client, message):
+        try:
+            client.connection.sendall(
+                    json.dumps(message).encode() + b"\n")
+        except (BlockingIOError, OSError):
+            # A subscriber that cannot keep up is dropped instead of
+            # stalling the event loop.
+            self.close_client(client.connection)
+
+    def close_client(self, connection):
+        client = self.clients.pop(connection, None)
+        if client is None:
+            return
+        self.remove_watch(client.watch)
+        connection.close()
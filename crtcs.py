@@ -0,0 +1,78 @@
+class CrtcIndex:
+    """
+    Which CRTCs can drive which outputs.
+
+    Built from the output infos' crtcs and the CRTC infos' possible
+    outputs of a snapshot, and updated as single outputs and CRTCs are
+    re-read. A pair is only compatible when both sides agree, so a CRTC
+    on another GPU or behind an MST hub is never handed to an output it
+    cannot drive.
+    """
+
+    def __init__(self):
+        self.crtcs_by_output = {}
+        self.outputs_by_crtc = {}
+
+    def update_output(self, output, crtcs):
+        self.crtcs_by_output[output] = tuple(crtcs)
+
+    def update_crtc(self, crtc, possible_outputs):
+        self.outputs_by_crtc[crtc] = frozenset(possible_outputs)
+
+    def can_drive(self, crtc, output):
+        possible_outputs = self.outputs_by_crtc.get(crtc)
+        return (crtc in self.crtcs_by_output.get(output, ())
+                and (possible_outputs is None or output in possible_outputs))
+
+    def candidates(self, output):
+        return [crtc for crtc in self.crtcs_by_output.get(output, ())
+                if self.can_drive(crtc, output)]
+
+    def assign(self, outputs, current=None):
+        """
+        Give each output its own compatible CRTC.
+
+        The assignment is a maximum matching, so an output is only left
+        without a CRTC when no assignment could drive all of them. Outputs
+        keep the CRTC in current that drives them whenever the matching
+        allows it, and other outputs prefer the CRTCs fewest requested
+        outputs can use. Returns {output: crtc} for the matched outputs.
+        """
+        current = current or {}
+        candidates = {output: self.candidates(output) for output in outputs}
+        demand = {}
+        for crtcs in candidates.values():
+            for crtc in crtcs:
+                demand[crtc] = demand.get(crtc, 0) + 1
+        for output, crtcs in candidates.items():
+            crtcs.sort(key=lambda crtc, output=output: (
+                crtc != current.get(output), demand[crtc]))
+
+        owners = {}
+        for output in outputs:
+            crtc = current.get(output)
+            if crtc in candidates[output] and crtc not in owners:
+                owners[crtc] = output
+
+        def augment(output, seen):
+            # A free CRTC is taken before any output is moved.
+            for crtc in candidates[output]:
+                if crtc not in owners:
+                    owners[crtc] = output
+                    return True
+            for crtc in candidates[output]:
+                if crtc in seen:
+                    continue
+                seen.add(crtc)
+                if augment(owners[crtc], seen):
+                    owners[crtc] = output
+                    return True
+            return False
+
+        # The most constrained outputs go first.
+        for output in sorted(outputs, key=lambda output: len(
+                candidates[output])):
+            if output not in owners.values():
+                augment(output, set())
+
+        return {output: crtc for crtc, output in owners.items()}
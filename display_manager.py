@@ -1,184 +1,803 @@
 import sys
+import time
+from collections import namedtuple
 
 from Xlib import X
-from Xlib.display import Display
 from Xlib.ext import randr
 
+from commands import CommandWorker, InlineCommands
+from edid import EdidCache
+from events import DisplayChanges, EventCoalescer, InitialDisplaysEvent
+from gamma import GammaController
+from layout import bounding_box, outermost, output_size, solve_layout
+from metrics import InstrumentedBackend, Metrics, timed
+from profiles import edid_hash, fingerprint
+from randr_backend import XlibRandrBackend
+from snapshot import ScreenSnapshot
+
+
+CrtcTarget = namedtuple(
+        "CrtcTarget", ["crtc", "name", "output", "mode", "x", "y", "rotation"])
+
+# The CRTCs to turn off first, the screen size to set (None to keep it),
+# and the targets to configure or to leave as they are.
+ApplyPlan = namedtuple(
+        "ApplyPlan", ["disable", "size", "configure", "unchanged"])
+
+
+def describe_display(display_info):
+    """Summarise a display dict as plain, JSON-serialisable values."""
+    mode = next(
+        (mode for mode in display_info["modes"]
+         if mode.id == display_info["mode"]), None)
+    edid = display_info["edid"]
+    return {
+        "name": display_info["name"],
+        "status": display_info["status"],
+        "type": display_info["type"],
+        "mode": mode.geometry if mode else None,
+        "monitor": edid.description if edid else None,
+        "modes": len(display_info["modes"]),
+        }
+
+
+def apply_succeeded(statuses):
+    """Whether every CRTC reported by apply_layout was set successfully."""
+    return bool(statuses) and all(
+        status == randr.SetConfigSuccess for status in statuses.values())
+
 
 class DisplayManager:
     """A class to monitor and set xorg display configurations."""
 
-    def __init__(self, event_handler, logger):
+    RANDR_EVENT_MASK = (
+        randr.RRScreenChangeNotifyMask
+        | randr.RROutputChangeNotifyMask
+        | randr.RRCrtcChangeNotifyMask
+        | randr.RROutputPropertyNotifyMask
+    )
+
+    def __init__(self, event_handler, logger, use_randr_events=True,
+                 settle_window=0.25, profile_store=None, backend=None,
+                 command_backend=None):
         self.event_handler = event_handler
         self.logger = logger
+        self.profile_store = profile_store
+        self.settle_window = settle_window
+        self.coalescer = EventCoalescer()
+        self.listeners = []
+        self.edid_cache = EdidCache()
+        self.snapshot = None
+        self.mode_catalog = None
+        self.screen_size = None
+        self.flushing = False
+        self.metrics = Metrics()
 
         try:
-            self.display = Display()
-            self.root_window = self.display.screen().root
-            self.root_window.change_attributes(
-                    event_mask=(X.StructureNotifyMask))
+            self.backend = InstrumentedBackend(
+                    backend or XlibRandrBackend(), self.metrics)
+            self.backend.select_root_input(X.StructureNotifyMask)
+            self.gamma = GammaController(self.backend)
+            # Configuration changes go through their own connection when
+            # one is given, so their replies never mix with the events.
+            if command_backend is not None:
+                self.commands = CommandWorker(
+                        InstrumentedBackend(command_backend, self.metrics))
+            else:
+                self.commands = InlineCommands(self.backend)
 
             self.check_for_extensions()
+            self.randr_events = use_randr_events and self.select_randr_input()
             self.displays = self.get_connected_displays()
-            if any(display["status"] == "inactive" for display
-                   in self.displays):
-                self.event_handler("initial_display_added")
+            self.prev_connected_displays = self.displays
 
         except Exception as e:
-            self.logger.error(f"Error initializing DisplayManager: {e}")
+            self.logger.error("Error initializing DisplayManager: %s", e)
             raise
 
-    def start_monitoring(self):
-        while True:
-            event = self.display.next_event()
-            if event:
-                self.logger.info(f"EVENT: {event}")
-                self.process_event(event)
+    def check_initial_displays(self):
+        """
+        Apply the saved profile, or report an InitialDisplaysEvent, when a
+        connected display is inactive at startup.
+        """
+        if any(display["status"] == "inactive" for display
+               in self.displays) and not self.apply_saved_profile():
+            self.event_handler(InitialDisplaysEvent(self.displays))
+
+    def receive_event(self):
+        event = self.backend.next_event()
+        if not event:
+            return
+        self.logger.debug("X event %s", event, rate_key="x_event")
+        # One bad event must not stop the main loop watching the
+        # connection. The snapshot may be half updated, so drop it.
+        try:
+            self.process_event(event)
+        except Exception:
+            self.logger.exception("Error processing %s", event)
+            self.invalidate_snapshot()
+
+    def dispatch_pending(self):
+        """
+        Process every event that can be read without blocking and return
+        how many there were. Used by main loops watching self.fileno().
+        """
+        count = 0
+        while self.backend.pending_events():
+            self.receive_event()
+            count += 1
+        return count
+
+    def fileno(self):
+        return self.backend.fileno()
+
+    def add_listener(self, listener):
+        """Call listener with every coalesced DisplayEvent."""
+        self.listeners.append(listener)
 
     def set_event_handler(self, event_handler):
         self.event_handler = event_handler
 
+    def select_randr_input(self):
+        """
+        Subscribe to RandR change notifications on the root window.
+        Returns False when python-xlib has not registered the RandR events
+        for this server, in which case ConfigureNotify is used instead.
+        """
+        extension_event = self.backend.extension_event
+        if getattr(extension_event, "OutputChangeNotify", None) is None:
+            self.logger.info(
+                    "RandR events unavailable, using ConfigureNotify")
+            return False
+
+        self.backend.select_randr_input(self.RANDR_EVENT_MASK)
+        return True
+
+    @timed("process_event")
     def process_event(self, event):
-        if event.type == X.ConfigureNotify:
+        """Update the display model and queue the changes for coalescing."""
+        started = time.perf_counter()
+        self.metrics.count_event(type(event).__name__)
+        if self.randr_events:
+            changes = self.process_randr_event(event)
+        elif event.type == X.ConfigureNotify:
+            self.screen_size = (event.width, event.height)
             self.update_display_info()
-            if self.all_displays_inactive():
-                primary_display = self.get_primary_display()
-                if primary_display:
-                    self.turn_on_display(
-                        primary_display['name'],
-                        primary_display['modes'],
-                        primary_display['crtc']
-                    )
-                else:
-                    self.logger.error("No primary display found.")
-            elif self.new_display_added():
-                self.event_handler("display_added")
+            changes = self.diff_displays(
+                    self.prev_connected_displays, self.displays)
+        else:
+            changes = None
+
+        if changes is not None and (changes.added or changes.removed):
+            self.trace_hotplug(started)
+        self.coalescer.add(changes)
+        return changes
+
+    def trace_hotplug(self, started):
+        """Open a hotplug trace at the first connection change of a batch."""
+        trace = self.metrics.trace
+        if trace is None or trace.reached("coalesced"):
+            self.metrics.begin_trace("hotplug", started)
+        self.metrics.mark("diff")
+
+    def flush_events(self):
+        """Emit one event for everything received since the last flush."""
+        # Noted even when the burst folds to nothing, so that a replay
+        # ends the burst at the same event.
+        self.backend.note("flush_events")
+        display_event = self.coalescer.flush()
+        if display_event is None:
+            return
+
+        self.logger.debug("Coalesced %s", display_event)
+        self.metrics.mark("coalesced")
+        self.flushing = True
+        try:
+            self.handle_display_event(display_event)
+        except Exception:
+            self.logger.exception("Error handling %s", display_event)
+        finally:
+            self.flushing = False
+
+    def handle_display_event(self, display_event):
+        for listener in self.listeners:
+            listener(display_event)
+
+        if self.all_displays_inactive():
+            primary_display = self.get_primary_display()
+            if primary_display:
+                # RandR lists an output's preferred modes first.
+                self.turn_on_display(
+                    primary_display['name'],
+                    primary_display['modes'][0]
+                )
+            else:
+                self.logger.error("No primary display found.")
+        elif (display_event.changes.added or display_event.changes.removed) \
+                and self.apply_saved_profile():
+            self.logger.info("Applied saved profile for connected displays.")
+        else:
+            self.event_handler(display_event)
+
+    def process_randr_event(self, event):
+        extension_event = self.backend.extension_event
+        event_code = (event.type, getattr(event, "sub_code", None))
+
+        if event.type == extension_event.ScreenChangeNotify:
+            self.screen_size = (
+                    event.width_in_pixels, event.height_in_pixels)
+            self.track_config_timestamp(event)
+        elif event_code == extension_event.OutputChangeNotify:
+            self.track_config_timestamp(event)
+            return self.handle_output_change(event)
+        elif event_code == extension_event.CrtcChangeNotify:
+            return self.handle_crtc_change(event)
+        elif event_code == extension_event.OutputPropertyNotify:
+            return self.handle_output_property_change(event)
+        return None
+
+    def track_config_timestamp(self, event):
+        if self.snapshot is not None:
+            self.snapshot.update_config_timestamp(event.config_timestamp)
+
+    def handle_output_change(self, event):
+        """
+        Re-query only the output named by the event and fold the result
+        into self.displays.
+        """
+        previous = self.find_display_by_output(event.output)
+        snapshot = self.get_snapshot()
+        output_info = snapshot.refresh_output(event.output)
+        self.prev_connected_displays = list(self.displays)
+
+        if not snapshot.covers(event.output, output_info):
+            # A newly attached monitor or MST output can bring outputs and
+            # modes the cached resources have never seen.
+            snapshot.capture()
+            output_info = snapshot.outputs.get(event.output)
+
+        if output_info is None or output_info.connection != randr.Connected:
+            if previous is None:
+                return None
+            self.displays.remove(previous)
+            return DisplayChanges([], [previous], [])
+
+        self.load_edids(snapshot, [event.output])
+        display_info = self.get_display_info(
+                output_info, snapshot, event.output, event.mode)
+        if previous is None:
+            self.displays.append(display_info)
+            return DisplayChanges([display_info], [], [])
+
+        self.displays[self.displays.index(previous)] = display_info
+        if self.display_mode_differs(previous, display_info):
+            return DisplayChanges([], [], [display_info])
+        return None
+
+    def handle_crtc_change(self, event):
+        """Update the displays driven by the CRTC from the event alone."""
+        if self.snapshot is not None:
+            self.snapshot.discard_crtc(event.crtc)
+        # A mode set can reset the CRTC's gamma ramps.
+        self.gamma.forget(event.crtc)
+
+        changed = []
+        for display_info in self.displays:
+            if display_info["crtc"] != event.crtc:
+                continue
+            if display_info["mode"] == event.mode:
+                continue
+            display_info["mode"] = event.mode
+            display_info["status"] = "active" if event.mode else "inactive"
+            changed.append(display_info)
+
+        if not changed:
+            return None
+        return DisplayChanges([], [], changed)
+
+    def handle_output_property_change(self, event):
+        """
+        Re-read an output's EDID only when that property changed, and
+        report its display as changed so that listeners see the new one.
+        """
+        if event.atom != self.backend.get_atom("EDID"):
+            return None
 
+        self.edid_cache.invalidate(event.output)
+        display_info = self.find_display_by_output(event.output)
+        if display_info is None:
+            return None
+        self.load_edids(self.get_snapshot(), [event.output])
+        display_info["edid"] = self.edid_cache.get(event.output)
+        return DisplayChanges([], [], [display_info])
+
+    def load_edids(self, snapshot, outputs):
+        """Read and parse the EDIDs of the outputs not yet cached."""
+        missing = self.edid_cache.missing(outputs)
+        if not missing:
+            return
+        for output, raw in snapshot.read_edids(missing).items():
+            self.edid_cache.store(output, raw)
+
+    def find_display_by_output(self, output):
+        return next(
+            (display for display in self.displays
+             if display["output"] == output), None)
+
+    def diff_displays(self, previous, current):
+        previous_by_name = {display["name"]: display for display in previous}
+        current_names = {display["name"] for display in current}
+
+        added = [display for display in current
+                 if display["name"] not in previous_by_name]
+        removed = [display for display in previous
+                   if display["name"] not in current_names]
+        mode_changed = [
+            display for display in current
+            if display["name"] in previous_by_name
+            and self.display_mode_differs(
+                previous_by_name[display["name"]], display)
+            ]
+        return DisplayChanges(added, removed, mode_changed)
+
+    def display_mode_differs(self, previous, current):
+        return (previous["mode"] != current["mode"]
+                or previous["status"] != current["status"])
+
+    def get_snapshot(self):
+        """Return the cached screen snapshot, capturing one if needed."""
+        if self.snapshot is None:
+            self.snapshot = ScreenSnapshot(self.backend, self.mode_catalog)
+        return self.snapshot
+
+    def invalidate_snapshot(self):
+        if self.snapshot is not None:
+            self.mode_catalog = self.snapshot.catalog
+        self.snapshot = None
+
+    @timed("enumeration")
     def get_connected_displays(self):
-        resources = self.root_window.xrandr_get_screen_resources()
+        snapshot = self.get_snapshot()
         displays = []
+        self.load_edids(
+            snapshot, [output for output, _ in snapshot.connected_outputs()])
 
-        for output in resources.outputs:
-            output_info = self.get_output_info(output)
-            if output_info.connection == randr.Connected:
-                display_info = self.get_display_info(
-                        output_info, resources)
-                displays.append(display_info)
+        for output, output_info in snapshot.connected_outputs():
+            display_info = self.get_display_info(
+                    output_info, snapshot, output)
+            displays.append(display_info)
 
         return displays
 
     def check_for_extensions(self):
         try:
-            randr_extension = self.display.query_extension('RANDR')
-            if not randr_extension.present:
+            if not self.backend.has_extension('RANDR'):
                 self.logger.error('Server does not have the RANDR extension')
                 sys.exit(1)
 
-            r = self.display.xrandr_query_version()
+            r = self.backend.query_version()
             self.logger.info(
-                    'RANDR version %d.%d' % (r.major_version, r.minor_version))
+                    'RANDR version %d.%d', r.major_version, r.minor_version)
         except Exception as e:
-            self.logger.error(f"Error checking for extensions: {e}")
+            self.logger.error("Error checking for extensions: %s", e)
             raise
 
-    def get_position_based_on_primary(self, position):
+    def current_layout(self):
+        """The active displays as layout entries with their Mode objects."""
+        snapshot = self.get_snapshot()
+        layout = []
+        for display in self.displays:
+            mode = snapshot.catalog.get(display["mode"])
+            if display["status"] != "active" or mode is None:
+                continue
+            crtc_info = snapshot.get_crtc_info(display["crtc"])
+            layout.append({
+                "name": display["name"],
+                "mode": mode,
+                "x": crtc_info.x,
+                "y": crtc_info.y,
+                "rotation": crtc_info.rotation,
+                })
+        return layout
+
+    @timed("turn_on_display")
+    def turn_on_display(self, name, mode, layout="right"):
+        """
+        Enable a display beyond the active display furthest to the side
+        given by layout, or as a clone of the primary, keeping the other
+        active displays where they are, with a single screen resize.
+        """
+        entries = [entry for entry in self.current_layout()
+                   if entry["name"] != name]
+        entry = {"name": name, "mode": mode}
         primary_display = self.get_primary_display()
-        if not primary_display:
-            self.logger.error("No primary display found.")
+        try:
+            if layout == "clone":
+                if primary_display and any(
+                        other["name"] == primary_display["name"]
+                        for other in entries):
+                    entry.update(
+                            relation=layout, anchor=primary_display["name"])
+            elif layout and entries:
+                entry.update(
+                        relation=layout, anchor=outermost(entries, layout))
+            entries.append(entry)
+            solved, _ = solve_layout(entries)
+        except ValueError as e:
+            self.logger.error("Cannot place %s: %s", name, e)
+            return {}
+        return self.apply_layout(solved)
+
+    @timed("apply")
+    def apply_layout(self, layout):
+        """
+        Apply a complete target layout in a single server grab.
+
+        layout is a list of dicts with "name", "mode", "x" and "y" keys and
+        an optional "rotation". Connected outputs missing from the layout
+        are turned off. Only the CRTCs whose state differs from the layout
+        are touched, and the screen is only resized when its size changes.
+        Returns a dict mapping every CRTC of the layout, and every CRTC
+        turned off, to its RandR set-config status; CRTCs that already
+        match report success without a request. Nothing is applied, and
+        the dict is empty, when a display of the layout is not connected
+        or no free CRTC can drive it.
+        """
+        if not self.flushing:
+            # Layouts applied while flushing follow from the events, so
+            # a replay only needs to be told about the others.
+            self.backend.note("apply_layout", layout=[
+                dict(entry, mode=getattr(entry["mode"], "id", entry["mode"]))
+                for entry in layout])
+
+        snapshot = self.get_snapshot()
+        targets = self.resolve_crtc_targets(snapshot, layout)
+        if not targets:
+            self.logger.error("Layout does not enable any display.")
+            return {}
+        if len(targets) < len(layout):
+            # resolve_crtc_targets has logged the displays it dropped, and
+            # a partial layout is not what was asked for.
+            return {}
+
+        width, height = self.get_layout_size(snapshot, targets)
+        size_range = snapshot.screen_size_range()
+        if width > size_range.max_width or height > size_range.max_height:
+            self.logger.error(
+                    "Layout %dx%d exceeds maximum screen size %dx%d",
+                    width, height, size_range.max_width,
+                    size_range.max_height)
+            return {}
+        width = max(width, size_range.min_width)
+        height = max(height, size_range.min_height)
+
+        plan = self.plan_layout(snapshot, targets, width, height)
+        statuses = {target.crtc: randr.SetConfigSuccess
+                    for target in plan.unchanged}
+
+        operations = []
+        crtcs = []
+        for crtc in plan.disable:
+            operations.append(self.crtc_config_operation(
+                snapshot, crtc, 0, 0, 0, randr.Rotate_0, []))
+            crtcs.append(crtc)
+        if plan.size is not None:
+            operations.append(self.screen_size_operation(*plan.size))
+            crtcs.append(None)
+        for target in plan.configure:
+            operations.append(self.crtc_config_operation(
+                snapshot, target.crtc, target.x, target.y, target.mode,
+                target.rotation, [target.output]))
+            crtcs.append(target.crtc)
+
+        if operations:
+            results = self.commands.submit(operations, grab=True).result()
+            for crtc, result in zip(crtcs, results):
+                if crtc is not None:
+                    statuses[crtc] = result.status
+                    # Plan the next apply against the CRTC as it is now,
+                    # even before its CrtcChangeNotify is dispatched.
+                    snapshot.discard_crtc(crtc)
+        else:
+            self.logger.debug("Layout is already applied")
+
+        if any(status != randr.SetConfigSuccess
+               for status in statuses.values()):
+            self.logger.error("Layout apply failed: %s", statuses)
+            self.invalidate_snapshot()
+            # Whether SetScreenSize took effect is unknown when the grab
+            # failed part way, so ask the server next time.
+            self.screen_size = None
+        else:
+            if plan.size is not None:
+                self.screen_size = plan.size
+            self.metrics.end_trace("applied")
+        return statuses
+
+    def plan_layout(self, snapshot, targets, width, height):
+        """
+        Diff the CRTC targets of a layout against the cached CRTCs.
+
+        Active CRTCs that the layout does not use are turned off, and so
+        are CRTCs that change outputs or that would not fit the new
+        screen while they are reconfigured. Targets that already match
+        their CRTC are left alone, and the screen is only resized when
+        its size differs from width x height.
+        """
+        crtcs = snapshot.load_crtcs()
+        target_crtcs = {target.crtc for target in targets}
+        size = (width, height)
+        if size == self.current_screen_size():
+            size = None
+
+        disable = [crtc for crtc, crtc_info in crtcs.items()
+                   if crtc_info.mode and crtc not in target_crtcs]
+        configure = []
+        unchanged = []
+        for target in targets:
+            crtc_info = crtcs.get(target.crtc)
+            if crtc_info is None or not crtc_info.mode:
+                configure.append(target)
+                continue
+
+            same_outputs = list(crtc_info.outputs) == [target.output]
+            if same_outputs and crtc_info.mode == target.mode \
+                    and (crtc_info.x, crtc_info.y, crtc_info.rotation) \
+                    == (target.x, target.y, target.rotation):
+                unchanged.append(target)
+                continue
+
+            configure.append(target)
+            if not same_outputs or size is not None and (
+                    crtc_info.x + crtc_info.width > width
+                    or crtc_info.y + crtc_info.height > height):
+                disable.append(target.crtc)
+
+        return ApplyPlan(disable, size, configure, unchanged)
+
+    def current_screen_size(self):
+        """
+        The screen size as of the last ScreenChangeNotify, ConfigureNotify
+        or successful apply, or as the root window reports it now.
+        """
+        if self.screen_size is None:
+            geometry = self.backend.get_root_geometry()
+            self.screen_size = (geometry.width, geometry.height)
+        return self.screen_size
+
+    @timed("gamma")
+    def adjust_gamma(self, names=None, brightness=None, temperature=None,
+                     duration=0.0):
+        """
+        Fade the named active displays, or all of them, to a brightness
+        from 0.1 to 1 and a colour temperature in kelvin over duration
+        seconds. The fade runs as the main loop calls self.gamma.advance.
+        Returns the names of the displays changed.
+        """
+        names_by_crtc = {
+            display["crtc"]: display["name"] for display in self.displays
+            if display["status"] == "active" and display["crtc"]
+            and (not names or display["name"] in names)
+            }
+        changed = self.gamma.fade(
+                list(names_by_crtc), brightness, temperature, duration)
+        return [names_by_crtc[crtc] for crtc in changed]
+
+    def find_display(self, name):
+        return next(
+            (display for display in self.displays
+             if display["name"] == name), None)
+
+    def find_mode(self, display_info, width, height, refresh_rate=None):
+        """
+        Pick the display's width x height mode closest to refresh_rate, or
+        the fastest one when no rate is given.
+        """
+        modes = display_info["modes"].with_size(width, height)
+        if not modes:
             return None
+        if refresh_rate is None:
+            return max(modes, key=lambda mode: mode.refresh_rate)
+        return min(
+            modes, key=lambda mode: abs(mode.refresh_rate - refresh_rate))
 
-        if position == "right":
-            return primary_display['modes'][0].width, 0
-        elif position == "left":
-            return -primary_display['modes'][0].width, 0
-        elif position == "up":
-            return 0, -primary_display['modes'][0].height
-        elif position == "down":
-            return 0, primary_display['modes'][0].height
-
-    def turn_on_display(self, name, mode, crtc, layout="right"):
-        resources = self.root_window.xrandr_get_screen_resources()
-        crtc_list = [display["crtc"] for display in self.displays]
-        matching_output = []
-        x, y = 0, 0
-        crtc = crtc
-        if layout:
-            pos = self.get_position_based_on_primary(layout)
-            if pos is not None:
-                x, y = pos
-
-        for output in resources.outputs:
-            output_info = self.get_output_info(output)
-            if output_info.connection == randr.Connected                      \
-                    and name == output_info.name:
-                matching_output.append(output)
-                for resource in resources.crtcs:
-                    if resource not in crtc_list:
-                        crtc = resource
-
-        randr.set_crtc_config(
-            self.display,
-            crtc,
-            X.CurrentTime,
-            x=x,
-            y=y,
-            mode=mode.id,
-            rotation=randr.Rotate_0,
-            outputs=matching_output
-            )
-
-    def turn_off_display(self, name, crtc):
-        resources = self.root_window.xrandr_get_screen_resources()
-        matching_output = []
-        x, y = 0, 0
-        for output in resources.outputs:
-            output_info = self.get_output_info(output)
-            if output_info.connection == randr.Connected                      \
-                    and name == output_info.name:
-                matching_output.append(output)
-
-        randr.set_crtc_config(
-            self.display,
-            crtc,
-            X.CurrentTime,
-            x=x,
-            y=y,
-            mode=0,
-            rotation=randr.Rotate_0,
-            outputs=matching_output
-            )
-
-    def get_output_info(self, output):
-        return randr.get_output_info(
-            self.display, output, X.CurrentTime)
-
-    def get_display_info(self, output_info, resources):
-        primary_output = resources.crtcs[0]
+    def get_edid_hashes(self):
+        """Return the EDID hash of every connected display by name."""
+        return {
+            display["name"]: edid_hash(display["edid"], display["name"])
+            for display in self.displays
+            }
+
+    def apply_saved_profile(self):
+        """
+        Apply the stored layout for the connected monitors, if there is
+        one. Returns True when a profile was applied successfully.
+        """
+        if self.profile_store is None:
+            return False
+
+        edid_hashes = self.get_edid_hashes()
+        profile = self.profile_store.get(fingerprint(edid_hashes.values()))
+        if profile is None:
+            return False
+
+        layout = self.resolve_profile(profile, edid_hashes)
+        if not layout:
+            return False
+
+        return apply_succeeded(self.apply_layout(layout))
+
+    def resolve_profile(self, profile, edid_hashes):
+        names_by_hash = {}
+        for name, output_hash in sorted(edid_hashes.items()):
+            names_by_hash.setdefault(output_hash, []).append(name)
+        displays_by_name = {
+            display["name"]: display for display in self.displays}
+
+        layout = []
+        for entry in profile["outputs"]:
+            names = names_by_hash.get(entry["edid"])
+            if not names:
+                return None
+            # Identical monitors share a hash; prefer the saved connector.
+            name = entry["name"] if entry["name"] in names else names[0]
+            names.remove(name)
+
+            geometry = (entry["width"], entry["height"], entry["refresh"])
+            mode = next(
+                (mode for mode in displays_by_name[name]["modes"].with_size(
+                    entry["width"], entry["height"])
+                 if mode.geometry == geometry), None)
+            if mode is None:
+                return None
+
+            layout.append({
+                "name": name,
+                "mode": mode.id,
+                "x": entry["x"],
+                "y": entry["y"],
+                "rotation": entry["rotation"],
+                })
+        return layout
+
+    def save_profile(self, layout):
+        """Remember layout for the currently connected monitors."""
+        if self.profile_store is None:
+            return
+
+        snapshot = self.get_snapshot()
+        edid_hashes = self.get_edid_hashes()
+        outputs = []
+        for entry in layout:
+            mode = snapshot.catalog.get(getattr(entry["mode"], "id",
+                                                entry["mode"]))
+            if mode is None or entry["name"] not in edid_hashes:
+                continue
+            width, height, refresh = mode.geometry
+            outputs.append({
+                "edid": edid_hashes[entry["name"]],
+                "name": entry["name"],
+                "width": width,
+                "height": height,
+                "refresh": refresh,
+                "x": entry.get("x", 0),
+                "y": entry.get("y", 0),
+                "rotation": entry.get("rotation", randr.Rotate_0),
+                })
+
+        self.profile_store.save(fingerprint(edid_hashes.values()), outputs)
+
+    def resolve_crtc_targets(self, snapshot, layout):
+        entries = []
+        for entry in layout:
+            output = snapshot.find_output(entry["name"])
+            if output is None:
+                self.logger.error("Display %s not connected.", entry["name"])
+                continue
+            entries.append((output, entry))
+
+        outputs = [output for output, _ in entries]
+        assignment = snapshot.crtc_index.assign(outputs, {
+            output: snapshot.outputs[output].crtc for output in outputs})
+
+        targets = []
+        for output, entry in entries:
+            crtc = assignment.get(output)
+            if crtc is None:
+                self.logger.error(
+                        "No free CRTC can drive %s.", entry["name"])
+                continue
+
+            targets.append(CrtcTarget(
+                crtc, entry["name"], output,
+                getattr(entry["mode"], "id", entry["mode"]),
+                entry.get("x", 0), entry.get("y", 0),
+                entry.get("rotation", randr.Rotate_0)))
+
+        if not targets:
+            return targets
+
+        # X screen coordinates start at the origin, so shift layouts that
+        # place displays to the left of or above the primary.
+        min_x = min(target.x for target in targets)
+        min_y = min(target.y for target in targets)
+        return [target._replace(x=target.x - min_x, y=target.y - min_y)
+                for target in targets]
+
+    def get_layout_size(self, snapshot, targets):
+        _, _, width, height = bounding_box(
+            (target.x, target.y) + output_size(
+                snapshot.catalog.by_id[target.mode], target.rotation)
+            for target in targets)
+        return width, height
+
+    def screen_size_operation(self, width, height):
+        width_px, height_px, width_mm, height_mm = (
+                self.backend.screen_dimensions())
+        return ("set_screen_size", (
+            width,
+            height,
+            round(width * width_mm / width_px),
+            round(height * height_mm / height_px),
+            ))
+
+    def crtc_config_operation(self, snapshot, crtc, x, y, mode, rotation,
+                              outputs):
+        return ("set_crtc_config", (
+            crtc, snapshot.config_timestamp, x, y, mode, rotation, outputs))
+
+    @timed("turn_off_display")
+    def turn_off_display(self, name, crtc=None):
+        """
+        Turn off the CRTC driving a display, leaving every other display
+        and the screen size as they are. Returns {crtc: status}.
+        """
+        if crtc is None:
+            display_info = self.find_display(name)
+            crtc = display_info["crtc"] if display_info else 0
+        if not crtc:
+            return {}
+        if not self.flushing:
+            self.backend.note("turn_off_display", name=name, crtc=crtc)
+
+        # A CRTC without a mode must not have outputs, or the server
+        # answers BadMatch.
+        result, = self.commands.submit([self.crtc_config_operation(
+            self.get_snapshot(), crtc, 0, 0, 0, randr.Rotate_0, [])
+            ]).result()
+        return {crtc: result.status}
+
+    def get_display_info(self, output_info, snapshot, output, mode=None):
+        primary_output = snapshot.primary_crtc()
         display_name = output_info.name
         display_type = "primary" if output_info.crtc == primary_output  \
             else "extended"
         display_status = "active" if output_info.crtc != 0  \
             else "inactive"
 
-        modes = self.get_modes(output_info, resources)
+        modes = snapshot.catalog.modes_for(output_info)
+        if mode is None:
+            mode = self.get_crtc_mode(snapshot, output_info.crtc)
 
         return {
             "name": display_name,
+            "output": output,
             "modes": modes,
+            "mode": mode,
             "type": display_type,
             "status": display_status,
             "crtc": output_info.crtc,
+            "edid": self.edid_cache.get(output),
         }
 
-    def get_modes(self, output_info, resources):
-        modes = []
-        for mode in resources.modes:
-            if mode.id in output_info.modes:
-                modes.append(mode)
-        return modes
+    def get_crtc_mode(self, snapshot, crtc):
+        if not crtc:
+            return 0
+        return snapshot.get_crtc_info(crtc).mode
 
     def update_display_info(self):
         self.prev_connected_displays = self.displays
+        self.invalidate_snapshot()
         self.displays = self.get_connected_displays()
 
     def get_primary_display(self):
@@ -190,10 +809,3 @@ class DisplayManager:
         return all(
                 display["status"] == "inactive" for display in self.displays)
 
-    def new_display_added(self):
-        return len(self.prev_connected_displays) < len(self.displays)
-
-
-if __name__ == "__main__":
-    display_manager = DisplayManager()
-    display_manager.start_monitoring()
@@ -0,0 +1,144 @@
+import hashlib
+from collections import namedtuple
+
+
+EDID_HEADER = b"\x00\xff\xff\xff\xff\xff\xff\x00"
+EDID_BLOCK_SIZE = 128
+
+DESCRIPTOR_SERIAL = 0xFF
+DESCRIPTOR_RANGE_LIMITS = 0xFD
+DESCRIPTOR_NAME = 0xFC
+
+Timing = namedtuple(
+        "Timing",
+        ["width", "height", "refresh_rate", "pixel_clock",
+         "width_mm", "height_mm"])
+
+
+class EdidInfo:
+    """The parsed base block of one monitor's EDID."""
+
+    __slots__ = (
+        "digest", "vendor", "product", "serial", "serial_string", "name",
+        "week", "year", "width_mm", "height_mm", "preferred_timing",
+        "vertical_range", "horizontal_range", "max_pixel_clock",
+    )
+
+    def __init__(self, digest):
+        self.digest = digest
+        self.serial_string = ""
+        self.name = ""
+        self.preferred_timing = None
+        self.vertical_range = None
+        self.horizontal_range = None
+        self.max_pixel_clock = None
+
+    @property
+    def description(self):
+        return self.name or f"{self.vendor} {self.product:04x}"
+
+    def __repr__(self):
+        return f"EdidInfo({self.vendor}, {self.product:#06x}, " \
+               f"{self.name!r}, serial={self.serial_string or self.serial})"
+
+
+def parse_edid(raw):
+    """
+    Parse the identification, physical size, preferred timing and range
+    limits out of an EDID base block. Raises ValueError for data that is
+    not an EDID.
+    """
+    if len(raw) < EDID_BLOCK_SIZE or raw[:8] != EDID_HEADER:
+        raise ValueError("Not an EDID base block")
+
+    edid = EdidInfo(hashlib.sha1(raw).hexdigest())
+    vendor = raw[8] << 8 | raw[9]
+    edid.vendor = "".join(
+        chr(((vendor >> shift) & 0x1F) + ord("A") - 1)
+        for shift in (10, 5, 0)
+        )
+    edid.product = raw[10] | raw[11] << 8
+    edid.serial = int.from_bytes(raw[12:16], "little")
+    edid.week = raw[16]
+    edid.year = raw[17] + 1990
+    edid.width_mm = raw[21] * 10
+    edid.height_mm = raw[22] * 10
+
+    for offset in range(54, 126, 18):
+        descriptor = raw[offset:offset + 18]
+        if descriptor[0] or descriptor[1]:
+            # The first detailed timing descriptor is the preferred mode.
+            if edid.preferred_timing is None:
+                edid.preferred_timing = parse_detailed_timing(descriptor)
+        else:
+            parse_display_descriptor(edid, descriptor)
+
+    return edid
+
+
+def parse_detailed_timing(descriptor):
+    pixel_clock = (descriptor[0] | descriptor[1] << 8) * 10000
+    width = descriptor[2] | (descriptor[4] & 0xF0) << 4
+    h_blank = descriptor[3] | (descriptor[4] & 0x0F) << 8
+    height = descriptor[5] | (descriptor[7] & 0xF0) << 4
+    v_blank = descriptor[6] | (descriptor[7] & 0x0F) << 8
+    width_mm = descriptor[12] | (descriptor[14] & 0xF0) << 4
+    height_mm = descriptor[13] | (descriptor[14] & 0x0F) << 8
+
+    total = (width + h_blank) * (height + v_blank)
+    refresh_rate = pixel_clock / total if total else 0.0
+    return Timing(
+            width, height, refresh_rate, pixel_clock, width_mm, height_mm)
+
+
+def parse_display_descriptor(edid, descriptor):
+    tag = descriptor[3]
+    data = descriptor[5:18]
+    if tag == DESCRIPTOR_NAME:
+        edid.name = descriptor_text(data)
+    elif tag == DESCRIPTOR_SERIAL:
+        edid.serial_string = descriptor_text(data)
+    elif tag == DESCRIPTOR_RANGE_LIMITS:
+        edid.vertical_range = (data[0], data[1])
+        edid.horizontal_range = (data[2], data[3])
+        edid.max_pixel_clock = data[4] * 10000000
+
+
+def descriptor_text(data):
+    return data.split(b"\n")[0].decode("ascii", "replace").strip()
+
+
+class EdidCache:
+    """
+    Parsed EDIDs by output. Results are shared by content hash, so a
+    monitor that is plugged back in is never parsed twice, and an output's
+    entry is only dropped when its EDID property changes.
+    """
+
+    def __init__(self):
+        self.digest_by_output = {}
+        self.parsed = {}
+
+    def __contains__(self, output):
+        return output in self.digest_by_output
+
+    def missing(self, outputs):
+        return [output for output in outputs
+                if output not in self.digest_by_output]
+
+    def get(self, output):
+        digest = self.digest_by_output.get(output)
+        return self.parsed.get(digest) if digest else None
+
+    def store(self, output, raw):
+        digest = hashlib.sha1(raw).hexdigest() if raw else None
+        if digest and digest not in self.parsed:
+            try:
+                self.parsed[digest] = parse_edid(raw)
+            except ValueError:
+                self.parsed[digest] = None
+        self.digest_by_output[output] = digest
+        return self.get(output)
+
+    def invalidate(self, output):
+        self.digest_by_output.pop(output, None)
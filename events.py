@@ -0,0 +1,94 @@
+from collections import namedtuple
+
+
+DisplayChanges = namedtuple(
+        "DisplayChanges", ["added", "removed", "mode_changed"])
+
+
+class DisplayEvent:
+    """Base class for events handed to the DisplayManager event handler."""
+
+    def __init__(self, folded=1):
+        self.folded = folded
+
+    def __repr__(self):
+        return f"{type(self).__name__}(folded={self.folded})"
+
+
+class InitialDisplaysEvent(DisplayEvent):
+    """Sent once at startup when a connected display is inactive."""
+
+    def __init__(self, displays):
+        super().__init__()
+        self.displays = displays
+
+
+class DisplaysChangedEvent(DisplayEvent):
+    """A settled transition of the connected displays."""
+
+    def __init__(self, changes, folded):
+        super().__init__(folded)
+        self.changes = changes
+
+    def __repr__(self):
+        names = {
+            kind: [display["name"] for display in displays]
+            for kind, displays in self.changes._asdict().items()
+            }
+        return f"{type(self).__name__}({names}, folded={self.folded})"
+
+
+class EventCoalescer:
+    """
+    Fold the DisplayChanges of a burst of raw events into one transition.
+
+    Changes are tracked per display name: a display that is added and
+    removed again inside one batch disappears from the result, and only
+    the latest state of every other display is kept.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.raw_events = 0
+        self.present_before = {}
+        self.latest = {}
+        self.removed_info = {}
+
+    def add(self, changes):
+        """Record one raw event and the changes it produced, if any."""
+        self.raw_events += 1
+        if changes is None:
+            return
+
+        for display_info in changes.added:
+            self.present_before.setdefault(display_info["name"], False)
+            self.latest[display_info["name"]] = display_info
+        for display_info in changes.removed:
+            self.present_before.setdefault(display_info["name"], True)
+            self.latest[display_info["name"]] = None
+            self.removed_info[display_info["name"]] = display_info
+        for display_info in changes.mode_changed:
+            self.present_before.setdefault(display_info["name"], True)
+            self.latest[display_info["name"]] = display_info
+
+    def flush(self):
+        """Return the coalesced event for the batch, or None."""
+        raw_events = self.raw_events
+        added, removed, mode_changed = [], [], []
+
+        for name, was_present in self.present_before.items():
+            display_info = self.latest[name]
+            if not was_present and display_info is not None:
+                added.append(display_info)
+            elif was_present and display_info is None:
+                removed.append(self.removed_info[name])
+            elif was_present:
+                mode_changed.append(display_info)
+
+        self.reset()
+        if not (added or removed or mode_changed):
+            return None
+        return DisplaysChangedEvent(
+                DisplayChanges(added, removed, mode_changed), raw_events)
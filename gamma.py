@@ -0,0 +1,240 @@
+import math
+import time
+from array import array
+from collections import OrderedDict
+
+
+NEUTRAL_TEMPERATURE = 6500
+MIN_TEMPERATURE = 1000
+MAX_TEMPERATURE = 25000
+MIN_BRIGHTNESS = 0.1
+FRAME_RATE = 30
+
+# Channel factors are rounded to this many steps, which is finer than a
+# 16-bit ramp entry can show at the top of a 4096 entry table.
+FACTOR_STEPS = 1 << 14
+
+
+def blackbody(temperature):
+    """
+    The (red, green, blue) of a black body at temperature kelvin, each
+    from 0 to 1, after Tanner Helland's fit of the CIE 1964 data.
+    """
+    temperature = min(max(temperature, MIN_TEMPERATURE), MAX_TEMPERATURE)
+    t = temperature / 100
+    if t <= 66:
+        red = 255.0
+        green = 99.4708025861 * math.log(t) - 161.1195681661
+    else:
+        red = 329.698727446 * (t - 60) ** -0.1332047592
+        green = 288.1221695283 * (t - 60) ** -0.0755148492
+    if t >= 66:
+        blue = 255.0
+    elif t <= 19:
+        blue = 0.0
+    else:
+        blue = 138.5177312231 * math.log(t - 10) - 305.0447927307
+    return tuple(min(max(channel, 0.0), 255.0) / 255
+                 for channel in (red, green, blue))
+
+
+NEUTRAL_WHITE = blackbody(NEUTRAL_TEMPERATURE)
+
+
+def channel_factors(brightness, temperature):
+    """
+    Scale factors of the red, green and blue ramps for a brightness and
+    a white point, with 6500 K as neutral white.
+    """
+    white = blackbody(temperature)
+    return tuple(
+        min(1.0, brightness * channel / neutral)
+        for channel, neutral in zip(white, NEUTRAL_WHITE))
+
+
+def quantise(factors):
+    return tuple(round(factor * FACTOR_STEPS) for factor in factors)
+
+
+class RampCache:
+    """
+    Gamma ramps as arrays of 16-bit entries, computed once per table size
+    and quantised channel factor.
+
+    A ramp only depends on the size of a CRTC's gamma table and on one
+    channel factor, so the CRTCs of a fade share the ramps of each frame
+    and channels with equal factors share one array. The least recently
+    used ramps are dropped beyond max_ramps.
+    """
+
+    def __init__(self, max_ramps=256):
+        self.max_ramps = max_ramps
+        self.bases = {}
+        self.ramps = OrderedDict()
+
+    def base(self, size):
+        """The identity ramp of a table size, scaled to 16 bits."""
+        base = self.bases.get(size)
+        if base is None:
+            step = 65535 / (size - 1) if size > 1 else 0
+            base = self.bases[size] = array(
+                    "d", [index * step for index in range(size)])
+        return base
+
+    def ramp(self, size, factor):
+        key = (size, round(factor * FACTOR_STEPS))
+        ramp = self.ramps.get(key)
+        if ramp is not None:
+            self.ramps.move_to_end(key)
+            return ramp
+
+        factor = key[1] / FACTOR_STEPS
+        ramp = array("H", [int(value * factor + 0.5)
+                           for value in self.base(size)])
+        self.ramps[key] = ramp
+        if len(self.ramps) > self.max_ramps:
+            self.ramps.popitem(last=False)
+        return ramp
+
+
+class GammaController:
+    """
+    Software brightness and colour temperature of CRTCs.
+
+    Each CRTC is kept as three channel factors that scale a linear ramp.
+    The factors of a CRTC not set before are read from the top of its
+    current ramps, so fades start from what the screen shows. A fade
+    never blocks: the main loop calls advance at deadline, and every
+    frame sends the ramps of all changed CRTCs in one burst with a
+    single flush. Frames without a visible change send nothing.
+    fade_started, when set, is called as a fade begins, for main loops
+    that schedule their timers instead of polling deadline.
+    """
+
+    def __init__(self, backend, ramp_cache=None, frame_rate=FRAME_RATE):
+        self.backend = backend
+        self.ramp_cache = ramp_cache or RampCache()
+        self.frame_rate = frame_rate
+        self.sizes = {}
+        self.factors = {}
+        self.settings = {}
+        # The CRTCs whose ramps this controller has written.
+        self.applied = set()
+        # CRTC: (start factors, target factors, start time, duration).
+        self.fades = {}
+        self.deadline = None
+        self.fade_started = None
+
+    def load(self, crtcs):
+        """Read the gamma size and ramps of new CRTCs in two round trips."""
+        crtcs = [crtc for crtc in crtcs if crtc not in self.sizes]
+        size_requests = [
+            (crtc, self.backend.get_crtc_gamma_size(crtc, defer=True))
+            for crtc in crtcs]
+        for crtc, request in size_requests:
+            self.sizes[crtc] = self.backend.read_reply(request).size
+
+        gamma_requests = [
+            (crtc, self.backend.get_crtc_gamma(crtc, defer=True))
+            for crtc in crtcs if self.sizes[crtc]]
+        for crtc, request in gamma_requests:
+            reply = self.backend.read_reply(request)
+            self.factors[crtc] = tuple(
+                (ramp[-1] / 65535 if len(ramp) else 1.0)
+                for ramp in (reply.red, reply.green, reply.blue))
+            self.settings.setdefault(
+                    crtc, (max(self.factors[crtc]), NEUTRAL_TEMPERATURE))
+
+    def target(self, crtc, brightness=None, temperature=None):
+        current_brightness, current_temperature = self.settings.get(
+                crtc, (1.0, NEUTRAL_TEMPERATURE))
+        if brightness is None:
+            brightness = current_brightness
+        if temperature is None:
+            temperature = current_temperature
+        brightness = min(max(brightness, MIN_BRIGHTNESS), 1.0)
+        temperature = min(
+                max(temperature, MIN_TEMPERATURE), MAX_TEMPERATURE)
+        return brightness, temperature
+
+    def fade(self, crtcs, brightness=None, temperature=None, duration=0.0):
+        """
+        Start moving crtcs to brightness and temperature over duration
+        seconds, replacing their running fades. None keeps a CRTC's
+        current value. Without a duration the ramps are sent at once.
+        Returns the CRTCs changed.
+        """
+        self.load(crtcs)
+        crtcs = [crtc for crtc in crtcs if self.sizes.get(crtc)]
+        now = time.monotonic()
+        targets = {}
+        for crtc in crtcs:
+            self.settings[crtc] = self.target(crtc, brightness, temperature)
+            targets[crtc] = channel_factors(*self.settings[crtc])
+            self.fades.pop(crtc, None)
+
+        if duration <= 0:
+            self.send_frame(targets)
+            return crtcs
+
+        for crtc in crtcs:
+            self.fades[crtc] = (
+                    self.factors[crtc], targets[crtc], now, duration)
+        if crtcs and self.deadline is None:
+            self.deadline = now + 1 / self.frame_rate
+            if self.fade_started is not None:
+                self.fade_started()
+        return crtcs
+
+    def advance(self, now=None):
+        """
+        Send the frame of every running fade when it is due. Returns the
+        time of the next frame, None once every fade has finished.
+        """
+        if now is None:
+            now = time.monotonic()
+        if self.deadline is not None and now < self.deadline:
+            return self.deadline
+
+        # A CRTC forgotten during its fade is read back first.
+        self.load(list(self.fades))
+        frame = {}
+        for crtc, (starts, targets, started, duration) in list(
+                self.fades.items()):
+            if not self.sizes.get(crtc):
+                del self.fades[crtc]
+                continue
+            progress = min(1.0, (now - started) / duration)
+            frame[crtc] = tuple(
+                start + (end - start) * progress
+                for start, end in zip(starts, targets))
+            if progress >= 1.0:
+                del self.fades[crtc]
+        self.send_frame(frame)
+
+        self.deadline = now + 1 / self.frame_rate if self.fades else None
+        return self.deadline
+
+    def send_frame(self, factors_by_crtc):
+        sent = False
+        for crtc, factors in factors_by_crtc.items():
+            if crtc in self.applied and quantise(factors) == quantise(
+                    self.factors[crtc]):
+                continue
+            size = self.sizes[crtc]
+            self.backend.set_crtc_gamma(crtc, size, *(
+                self.ramp_cache.ramp(size, factor) for factor in factors))
+            self.factors[crtc] = factors
+            self.applied.add(crtc)
+            sent = True
+        if sent:
+            self.backend.flush()
+
+    def forget(self, crtc):
+        """
+        Drop what is known of a CRTC whose gamma table may have been
+        reset, so that the next frame for it is sent whatever it shows.
+        """
+        self.sizes.pop(crtc, None)
+        self.factors.pop(crtc, None)
+        self.applied.discard(crtc)
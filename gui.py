@@ -2,58 +2,114 @@ import sys
 
 import gi
 gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk, GLib
+from gi.repository import Gdk, Gtk
+from Xlib.ext import randr
+
+from canvas import LayoutCanvas
+from display_manager import apply_succeeded
+from layout import output_size, solve_layout
+from modes import MODE_FLAGS, FlagIndex
+
+
+# Columns of the per-display mode Gtk.ListStore.
+MODE_LABEL, MODE_ID, MODE_SELECTED, MODE_VISIBLE = range(4)
+
+STYLESHEET = b"""
+.status {
+    font-style: oblique;
+    opacity: 0.8;
+}
+.status-active {
+    color: green;
+}
+.status-inactive {
+    color: red;
+}
+"""
+
+
+class DisplayPage:
+    """The dialog state of one display. Widgets are built on first view."""
+
+    def __init__(self, display_info):
+        self.flag_mask = 0
+        self.mode_ids = None
+        self.update(display_info)
+
+        self.container = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
+        self.built = False
+        self.check_menuitem = None
+        self.status_menuitem = None
+        self.mode_store = None
+        self.mode_view = None
+        self.mode_iters = {}
+        self.selected_iter = None
+        self.flag_index = None
+        self.visible_ids = frozenset()
+
+    def update(self, display_info):
+        """
+        Take the state of a refreshed display_info. Returns True when the
+        mode list changed and the mode store has to be rebuilt.
+        """
+        self.display_info = display_info
+        self.active = display_info["status"] == "active"
+
+        mode_ids = display_info["modes"].ids
+        modes_changed = mode_ids != self.mode_ids
+        self.mode_ids = mode_ids
+
+        self.modes = sorted(
+                display_info["modes"], key=lambda x: x.width, reverse=True)
+        self.modes_by_id = {mode.id: mode for mode in self.modes}
+        self.selected_mode = self.modes_by_id.get(
+                display_info["mode"], self.modes[0] if self.modes else None)
+        return modes_changed
 
 
 class GUI:
-    FLAGS = {
-        1: "HSyncPositive",
-        2: "HSyncNegative",
-        4: "VSyncPositive",
-        8: "VSyncNegative",
-        16: "Interlace",
-        32: "DoubleScan",
-        64: "CSync",
-        128: "CSyncPositive",
-        256: "CSyncNegative",
-    }
-
-    def __init__(self, display_manager, turn_on_display, turn_off_display,
-                 logger):
+    FLAGS = MODE_FLAGS
+
+    def __init__(self, display_manager, apply_layout, logger, screen=None):
+        screen = screen or Gdk.Screen.get_default()
         self.css_provider = Gtk.CssProvider()
+        self.css_provider.load_from_data(STYLESHEET)
+        Gtk.StyleContext.add_provider_for_screen(
+            screen,
+            self.css_provider,
+            Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION
+            )
         self.logger = logger
 
         self.display_manager = display_manager
-        self.displays = self.display_manager.displays
-        self.assign_flag_strings()
+        self.pages = {}
 
-        self.selected_displays = []
-        self.selected_flags = [[] for _ in range(len(self.displays))]
-        self.display_mode_objects = []
-        self.flags_check_menu_items = []
-        self.display_layouts = []
-        self.status_labels = []
-        self.initial_active_states = []
-
-        self.turn_on_display = turn_on_display
-        self.turn_off_display = turn_off_display
+        self.apply_layout = apply_layout
 
+        # The window lives as long as the process and is only hidden
+        # between hotplugs; show() reconciles its pages.
         self.window = Gtk.Window(title="Moni-Py")
-        self.window.set_default_size(520, 200)
+        self.window.set_screen(screen)
+        self.window.set_default_size(520, 400)
+        self.window.connect("delete-event", self.hide)
 
-        self.window.connect("destroy", Gtk.main_quit)
         self.main_box = Gtk.Box(
                 orientation=Gtk.Orientation.VERTICAL, spacing=0)
         self.main_box.set_margin_top(12)
         self.main_box.set_margin_bottom(12)
         self.window.add(self.main_box)
 
+        # Outputs are arranged by dragging them on the canvas.
+        self.canvas = LayoutCanvas()
+        self.main_box.pack_start(self.canvas.area, True, True, 0)
+
         # Create a Stack and a StackSwitcher
         self.stack = Gtk.Stack()
         self.stack.set_transition_type(
                 Gtk.StackTransitionType.SLIDE_LEFT_RIGHT)
         self.stack.set_transition_duration(200)
         self.stack.set_size_request(520, 160)
+        self.stack.connect("notify::visible-child", self.on_page_shown)
 
         stack_switcher = Gtk.StackSwitcher()
         stack_switcher.set_stack(self.stack)
@@ -64,10 +120,24 @@ class GUI:
         self.submit_button = Gtk.Button(label="Submit")
         self.submit_button.connect("clicked", self.submit)
 
-    def setup_menubar(self, display_info, i):
-        display_status = display_info["status"]
-        display_type = display_info["type"]
+        input_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
+        input_box.set_halign(Gtk.Align.END)
+        input_box.set_margin_top(10)
+        input_box.set_margin_end(10)
+
+        cancel_button = Gtk.Button(label="Cancel")
+        cancel_button.connect("clicked", self.hide)
+
+        self.remember_button = Gtk.CheckButton(
+                label="Remember for these monitors")
+        self.remember_button.set_margin_end(10)
 
+        input_box.pack_start(self.remember_button, False, False, 0)
+        input_box.pack_start(self.submit_button, False, False, 0)
+        input_box.pack_start(cancel_button, False, False, 0)
+        self.main_box.pack_start(input_box, False, False, 0)
+
+    def setup_menubar(self, page):
         box = Gtk.Box(spacing=0)
         box.set_homogeneous(False)
         box.set_size_request(520, 0)
@@ -81,42 +151,14 @@ class GUI:
 
         check_menuitem = Gtk.CheckMenuItem.new_with_label(" status:")
         status_menuitem = Gtk.MenuItem.new_with_label("")
+        check_menuitem.set_active(page.active)
 
-        if display_status == "active":
-            initial_state = True
-        else:
-            initial_state = False
-        check_menuitem.set_active(initial_state)
-        self.initial_active_states.append(initial_state)
-
-        flag_items = [
-            (flag, description, Gtk.CheckMenuItem(label=description))
-            for flag, description in self.FLAGS.items()
-            ]
-        for _, _, check_menu_item in flag_items:
+        for flag, description in self.FLAGS.items():
+            check_menu_item = Gtk.CheckMenuItem(label=description)
+            check_menu_item.set_active(bool(page.flag_mask & flag))
             check_menu_item.connect(
-                    "toggled", self.update_display_modes)
+                    "toggled", self.update_display_modes, page, flag)
             flags_menu.append(check_menu_item)
-        self.flags_check_menu_items.append(flag_items)
-
-        if display_type == "extended":
-            layout_menu = Gtk.Menu()
-            layout_menuitem = Gtk.MenuItem(label="layout")
-            layout_menuitem.set_submenu(layout_menu)
-
-            layouts = ["clone", "left", "right", "above", "below"]
-            group = None
-            for layout in layouts:
-                layout_radioitem = Gtk.RadioMenuItem \
-                    .new_with_label_from_widget(group, layout)
-                layout_radioitem.connect(
-                    "toggled",
-                    lambda radio_item=layout_radioitem,
-                    i=i: self.layout_changed(layout_menuitem, radio_item, i)
-                    )
-                group = layout_radioitem
-                layout_menu.append(layout_radioitem)
-            menubar_right.append(layout_menuitem)
 
         menubar_left.append(check_menuitem)
         menubar_left.append(status_menuitem)
@@ -129,338 +171,310 @@ class GUI:
 
         return box, check_menuitem, status_menuitem
 
-    def apply_css_to_widget(self, widget, color):
-        css = f"""
-        #status {{
-            color: {color};
-            font-style: oblique;
-            opacity: 0.8;
-        }}
-        """
-        css_provider = Gtk.CssProvider()
-        css_provider.load_from_data(bytes(css.encode()))
-        widget.set_name("status")
-        Gtk.StyleContext.add_provider(
-            widget.get_style_context(),
-            css_provider,
-            Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION
-            )
-
-    def update_display_status(self, check_menuitem, status_menuitem, i):
-        is_active = check_menuitem.get_active()
-        color = "green" if is_active else "red"
-        self.apply_css_to_widget(status_menuitem.get_child(), color)
-        status_menuitem.set_label("active" if is_active else "inactive")
-        self.toggle_modes(check_menuitem, i)
-        status_menuitem.queue_draw()
-
-    def create_display_box(self, display_info, i):
-        display_box = Gtk.Box(
-                orientation=Gtk.Orientation.HORIZONTAL, spacing=0)
+    def set_status_style(self, widget, is_active):
+        style_context = widget.get_style_context()
+        style_context.add_class("status")
+        if is_active:
+            style_context.remove_class("status-inactive")
+            style_context.add_class("status-active")
+        else:
+            style_context.remove_class("status-active")
+            style_context.add_class("status-inactive")
+
+    def update_display_status(self, check_menuitem, page):
+        page.active = check_menuitem.get_active()
+        self.set_status_style(page.status_menuitem.get_child(), page.active)
+        page.status_menuitem.set_label(
+                "active" if page.active else "inactive")
+        self.toggle_modes(page)
+        self.update_canvas(page)
+        page.status_menuitem.queue_draw()
+
+    def build_page(self, page):
         display_grid = Gtk.Grid()
-        display_box.pack_start(display_grid, False, False, 0)
+        page.container.pack_start(display_grid, False, False, 0)
         display_grid.set_size_request(400, 160)
 
-        # Add the display box to the stack
-        self.stack.add_titled(
-                display_box, display_info["name"], display_info["name"]
-                )
-
-        menubar, check_menuitem, status_menuitem = self.setup_menubar(
-                display_info, i)
+        menubar, page.check_menuitem, page.status_menuitem = \
+            self.setup_menubar(page)
         display_grid.attach(menubar, 0, 0, 1, 1)
 
-        # Create a new container for the modes.
-        mode_box = Gtk.Box(
-                orientation=Gtk.Orientation.VERTICAL, spacing=10)
-        mode_box.set_halign(Gtk.Align.CENTER)
+        page.mode_view = self.create_mode_view(page)
+        self.populate_modes(page)
 
         scrolled_window = Gtk.ScrolledWindow()
         scrolled_window.set_policy(
                 Gtk.PolicyType.NEVER, Gtk.PolicyType.ALWAYS)
         scrolled_window.set_size_request(400, 160)
         scrolled_window.set_shadow_type(Gtk.ShadowType.ETCHED_OUT)
-        scrolled_window.add(mode_box)
+        scrolled_window.add(page.mode_view)
 
         display_grid.attach(scrolled_window, 0, 1, 2, 1)
-        return display_box, mode_box, check_menuitem, status_menuitem
-
-    def create_mode_objects(self, modes, mode_box):
-        mode_group = None
-        display_modes_list = []
-        for j, mode in enumerate(modes):
-            refresh_rate = mode["dot_clock"] / (
-                    mode["width"] * mode["height"])
-            flag_string = self.get_flag_string(mode)
-            formatted_mode = f"({mode['width']} x {mode['height']}" \
-                             f" {round(refresh_rate)} Hz\n" \
-                             f"Flags: {flag_string}"
-
-            mode_radio_button = Gtk.RadioButton. \
-                new_with_label_from_widget(mode_group, formatted_mode)
-            mode_radio_button.set_sensitive(False)
-            mode_group = mode_radio_button
-
-            # Add each mode to the mode_box.
-            mode_box.pack_start(mode_radio_button, False, False, 0)
-            display_modes_list.append((mode, mode_radio_button))
-
-        return display_modes_list
+
+        page.check_menuitem.connect(
+                "toggled", self.update_display_status, page)
+        self.update_display_status(page.check_menuitem, page)
+
+        page.built = True
+        page.container.show_all()
+
+    def populate_modes(self, page):
+        page.flag_index = FlagIndex(self.filter_by_width(page.modes))
+        page.mode_store = self.create_mode_store(page)
+        mode_filter = page.mode_store.filter_new()
+        mode_filter.set_visible_column(MODE_VISIBLE)
+        page.mode_view.set_model(mode_filter)
+
+    def create_mode_store(self, page):
+        mode_store = Gtk.ListStore(str, int, bool, bool)
+        page.mode_iters = {}
+        page.selected_iter = None
+        page.visible_ids = page.flag_index.lookup(page.flag_mask)
+        for mode in page.modes:
+            tree_iter = mode_store.append([
+                mode.label,
+                mode.id,
+                mode is page.selected_mode,
+                mode.id in page.visible_ids,
+                ])
+            page.mode_iters[mode.id] = tree_iter
+            if mode is page.selected_mode:
+                page.selected_iter = tree_iter
+        return mode_store
+
+    def create_mode_view(self, page):
+        mode_view = Gtk.TreeView()
+        mode_view.set_headers_visible(False)
+        mode_view.set_halign(Gtk.Align.CENTER)
+
+        radio_renderer = Gtk.CellRendererToggle()
+        radio_renderer.set_radio(True)
+        radio_renderer.connect("toggled", self.mode_toggled, page)
+        mode_view.append_column(Gtk.TreeViewColumn(
+                "", radio_renderer, active=MODE_SELECTED))
+        mode_view.append_column(Gtk.TreeViewColumn(
+                "", Gtk.CellRendererText(), text=MODE_LABEL))
+        return mode_view
+
+    def on_page_shown(self, stack, param):
+        page = next(
+            (page for page in self.pages.values()
+             if page.container is stack.get_visible_child()), None)
+        if page is not None and not page.built:
+            self.build_page(page)
 
     def show(self):
         try:
-            for i, display_info in enumerate(self.displays):
-                display_box, mode_box, check_menuitem, status_menuitem = \
-                    self.create_display_box(display_info, i)
-                modes = sorted(
-                        display_info["modes"],
-                        key=lambda x: x['width'],
-                        reverse=True
-                        )
-                display_modes_list = self.create_mode_objects(modes, mode_box)
-                self.display_mode_objects.append(display_modes_list)
-
-                self.selected_displays.append(
-                        (display_info["name"],
-                         (check_menuitem, status_menuitem),
-                         display_modes_list, display_info["type"],
-                         display_info["status"], display_info["crtc"],
-                         None)
-                        )
-                check_menuitem.connect(
-                    "toggled",
-                    lambda check_menuitem=check_menuitem,
-                    status_menuitem=status_menuitem, i=i:
-                    self.update_display_status(
-                        check_menuitem, status_menuitem, i)
-                    )
-
-            input_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
-            input_box.set_halign(Gtk.Align.END)
-            input_box.set_margin_top(10)
-            input_box.set_margin_end(10)
-
-            cancel_button = Gtk.Button(label="Cancel")
-            cancel_button.connect("clicked", self.destroy_top_level_parent)
-
-            input_box.pack_start(self.submit_button, False, False, 0)
-            input_box.pack_start(cancel_button, False, False, 0)
-            self.main_box.pack_start(input_box, False, False, 0)
-
-            # Set check check_menuitems if display is active
-            for i, display_info in enumerate(self.displays):
-                check_menuitem = self.selected_displays[i][1][0]
-                status_menuitem = self.selected_displays[i][1][1]
-                self.update_display_status(check_menuitem, status_menuitem, i)
-                if self.initial_active_states[i]:
-                    self.toggle_modes(check_menuitem, i)
-
+            self.refresh()
             self.window.show_all()
-            self.update_display_modes(None)
-            Gtk.main()
+            # Only the page on screen is built; the rest wait for
+            # notify::visible-child.
+            self.on_page_shown(self.stack, None)
         except Exception as e:
             self.logger.exception(e)
             self.logger.debug(sys.exc_info())
 
-    def filter_by_width(self, display_info):
+    def hide(self, *args):
+        self.window.hide()
+        return True
+
+    def refresh(self):
+        """Redraw the pages and the canvas from the display model."""
+        self.reconcile_pages(self.display_manager.displays)
+        self.reset_canvas()
+
+    def reconcile_pages(self, displays):
+        """
+        Bring the stack in line with the display model: pages of removed
+        displays are destroyed, new displays get a page and the rest are
+        refreshed in place.
+        """
+        displays_by_name = {
+            display_info["name"]: display_info for display_info in displays
+            }
+
+        for name, page in list(self.pages.items()):
+            display_info = displays_by_name.get(name)
+            if display_info is None:
+                self.remove_page(name)
+            else:
+                self.refresh_page(page, display_info)
+
+        for name, display_info in displays_by_name.items():
+            if name not in self.pages:
+                self.pages[name] = DisplayPage(display_info)
+                self.stack.add_titled(
+                        self.pages[name].container,
+                        name,
+                        self.page_title(display_info)
+                        )
+
+    def remove_page(self, name):
+        page = self.pages.pop(name)
+        self.stack.remove(page.container)
+        page.container.destroy()
+
+    def page_title(self, display_info):
+        edid = display_info["edid"]
+        if edid is None:
+            return display_info["name"]
+        return f"{display_info['name']} ({edid.description})"
+
+    def refresh_page(self, page, display_info):
+        modes_changed = page.update(display_info)
+        self.stack.child_set_property(
+                page.container, "title", self.page_title(display_info))
+        if not page.built:
+            return
+
+        if modes_changed:
+            self.populate_modes(page)
+        elif page.selected_iter is not None:
+            page.mode_store[page.selected_iter][MODE_SELECTED] = False
+            page.selected_iter = page.mode_iters.get(
+                    getattr(page.selected_mode, "id", None))
+            if page.selected_iter is not None:
+                page.mode_store[page.selected_iter][MODE_SELECTED] = True
+
+        if page.check_menuitem.get_active() != page.active:
+            # The toggled handler updates the status, modes and canvas.
+            page.check_menuitem.set_active(page.active)
+        else:
+            self.update_display_status(page.check_menuitem, page)
+
+    def filter_by_width(self, modes):
         """
-        Function to filter by width.
-        If highest_first is True, sort by highest width first, else sort
-        by smallest width first.
+        Keep the mode with the highest refresh rate for every resolution,
+        sorted by highest width first.
         """
-        modes = display_info['modes']
-        # Create a map from resolution to mode with highest dot_clock
+        # Create a map from resolution to mode with highest refresh rate
         resolution_to_mode_map = {}
         for mode in modes:
-            resolution = (mode['width'], mode['height'])
+            resolution = (mode.width, mode.height)
             if resolution not in resolution_to_mode_map or                \
-                    mode['dot_clock'] > resolution_to_mode_map[
-                            resolution]['dot_clock']:
+                    mode.refresh_rate > resolution_to_mode_map[
+                            resolution].refresh_rate:
                 resolution_to_mode_map[resolution] = mode
         # Sort the modes by width
         sorted_modes = sorted(
             resolution_to_mode_map.values(),
-            key=lambda x: x['width'],
+            key=lambda x: x.width,
             reverse=True
             )
         return sorted_modes
 
-    def toggle_modes(self, widget, i):
-        state = widget.get_active()
-        display_info = self.selected_displays[i]
-        display_name, status_elements, _, display_type, display_status,  \
-            display_crtc, selected_mode = display_info
+    def toggle_modes(self, page):
+        page.mode_view.set_sensitive(page.active)
+        self.window.queue_draw()
 
-        for mode, mode_menu_item in self.display_mode_objects[i]:
-            mode_menu_item.set_sensitive(state and all(
-                (flag & mode['flags']) == flag
-                for flag, _, check_menu_item
-                in self.flags_check_menu_items[i]
-                if check_menu_item.get_active()
-                ))
+    def mode_toggled(self, renderer, path, page):
+        child_path = page.mode_view.get_model().convert_path_to_child_path(
+                Gtk.TreePath(path))
+        tree_iter = page.mode_store.get_iter(child_path)
+
+        if page.selected_iter is not None:
+            page.mode_store[page.selected_iter][MODE_SELECTED] = False
+        page.mode_store[tree_iter][MODE_SELECTED] = True
+        page.selected_iter = tree_iter
+        page.selected_mode = page.modes_by_id[
+                page.mode_store[tree_iter][MODE_ID]]
+        self.update_canvas(page)
+
+    def reset_canvas(self):
+        """Show the active displays where the server has them."""
+        current = {entry["name"]: entry
+                   for entry in self.display_manager.current_layout()}
+        layout = []
+        for name, page in self.pages.items():
+            entry = current.get(name)
+            if entry is None or not page.active \
+                    or page.selected_mode is None:
+                continue
+            width, height = output_size(
+                    page.selected_mode, entry["rotation"])
+            layout.append({
+                "name": name,
+                "x": entry["x"],
+                "y": entry["y"],
+                "width": width,
+                "height": height,
+                "rotation": entry["rotation"],
+                })
+        self.canvas.set_outputs(layout)
+
+        for page in self.pages.values():
+            if page.display_info["name"] not in current:
+                self.update_canvas(page)
+
+    def update_canvas(self, page):
+        """Follow a display being enabled, disabled or given a mode."""
+        name = page.display_info["name"]
+        if not page.active or page.selected_mode is None:
+            self.canvas.remove_output(name)
+            return
 
-        if not state:
-            for _, mode_menu_item in self.display_mode_objects[i]:
-                mode_menu_item.set_active(False)
+        output = self.canvas.outputs.get(name)
+        rotation = output.rotation if output else randr.Rotate_0
+        width, height = output_size(page.selected_mode, rotation)
+        self.canvas.set_output(name, width, height, rotation)
 
+    def update_display_modes(self, widget, page, flag):
+        if widget.get_active():
+            page.flag_mask |= flag
         else:
-            selected_mode = next(
-                (mode for mode, mode_menu_item
-                 in self.display_mode_objects[i]
-                 if mode_menu_item.get_active()), None
-                )
-
-            if selected_mode:
-                self.selected_displays[i] = (
-                        display_name,  status_elements,
-                        self.display_mode_objects[i], display_type,
-                        display_status, display_crtc, selected_mode,
-                        )
+            page.flag_mask &= ~flag
+        self.refresh_page_modes(page)
         self.window.queue_draw()
 
-    def layout_changed(self, label, menuitem, i):
-        if menuitem.get_active():
-            text = menuitem.get_label()
-            label.set_label(f"layout: {text}")
-            self.display_layouts.append(text)
-            menuitem.queue_draw()
-
-    def update_display_modes(self, widget):
-        for i, display_info in enumerate(self.displays):
-            self.selected_flags = [
-                    flag[0] for flag in self.flags_check_menu_items[i]
-                    if flag[2].get_active()
-                    ]
-            sorted_modes = self.filter_by_width(display_info)
-            for mode, mode_radio_button in self.display_mode_objects[i]:
-                should_hide = mode not in sorted_modes or not all(
-                    (mode['flags'] & flag) == flag
-                    for flag in self.selected_flags
-                    )
-                should_show = mode in sorted_modes and all(
-                    (mode['flags'] & flag) == flag
-                    for flag in self.selected_flags
-                    )
-                mode_radio_button.set_visible(should_show and not should_hide)
-        self.window.queue_draw()
-
-    def get_flags(self, bitmask):
-        flags = []
-        for flag, description in self.FLAGS.items():
-            if bitmask & flag:
-                flags.append(description)
-        return flags
-
-    def assign_flag_strings(self):
-        for display_info in self.displays:
-            for mode in display_info['modes']:
-                mode['flag_strings'] = self.find_flag_combinations(
-                        mode['flags'])
-
-    def get_flag_string(self, mode):
-        flag_string = ""
-        last_flag = mode["flag_strings"][-1]
-
-        for flag in mode["flag_strings"][:-1]:
-            flag_string += f"{flag}, "
-
-        flag_string += last_flag
-        return flag_string
-
-    def find_flag_combinations(self, value):
-        return [name for flag, name in self.FLAGS.items() if value & flag]
-
-    def destroy_top_level_parent(self, widget):
-        if widget.get_parent() is None:
-            return
-
-        parent = widget.get_parent()
-        self.destroy_top_level_parent(parent)
-        parent.destroy()
+    def refresh_page_modes(self, page):
+        visible_ids = page.flag_index.lookup(page.flag_mask)
+        # Only rows whose visibility flips are written back to the store.
+        for mode_id in visible_ids ^ page.visible_ids:
+            page.mode_store[page.mode_iters[mode_id]][MODE_VISIBLE] = \
+                mode_id in visible_ids
+        page.visible_ids = visible_ids
 
     def submit(self, button):
-        selected_displays = []
-        unselected_displays = []
-
-        for display_info in self.selected_displays:
-            display_name, status_elements, display_modes, display_type,  \
-                    display_status, display_crtc, selected_mode = display_info
-            if status_elements[0].get_active():
-                selected_displays.append(
-                    (display_name, status_elements, display_modes,
-                     display_type, display_status, display_crtc, selected_mode)
-                )
-            else:
-                unselected_displays.append(
-                        (display_name, display_crtc, display_status))
-
-        if not selected_displays:
-            dialog = Gtk.MessageDialog(
-                transient_for=self.window,
-                flags=0,
-                message_type=Gtk.MessageType.ERROR,
-                buttons=Gtk.ButtonsType.OK,
-                text="Please select at least one display."
-            )
-            dialog.run()
-            dialog.destroy()
+        pages = [page for page in self.pages.values()
+                 if page.active and page.selected_mode is not None]
+        if not pages:
+            self.show_error("Please select at least one display.")
             return
 
-        self.execute_display_operations(
-                selected_displays, unselected_displays)
-
-    def execute_display_operations(self, selected_displays,
-                                   unselected_displays):
-        if selected_displays:
-            last_display = selected_displays[-1]
-            for i, display in enumerate(selected_displays[:-1]):
-                name, _, _, _, status, crtc, mode = display
-                if status == "inactive":
-                    self.turn_on_display_callback(
-                            name,
-                            mode,
-                            crtc,
-                            unselected_displays,
-                            self.display_layouts[i],
-                            callback=None
-                            )
-            self.turn_on_display_callback(
-                    last_display[0],
-                    last_display[6],
-                    last_display[5],
-                    unselected_displays,
-                    self.display_layouts[-1],
-                    callback=self.turn_on_displays_complete
-                    )
-
-    def turn_on_displays_complete(self, unselected_displays):
-        if not unselected_displays:
-            self.window.destroy()
+        # The canvas holds the position of every enabled display, and a
+        # display left out of the layout would be turned off.
+        outputs = self.canvas.outputs
+        missing = [page.display_info["name"] for page in pages
+                   if page.display_info["name"] not in outputs]
+        if missing:
+            self.show_error(
+                    f"Displays missing from the layout: {', '.join(missing)}")
             return
 
-        last_display = unselected_displays[-1]
-        for name, crtc, status in unselected_displays[:-1]:
-            if status == "active":  # Check if the display is active
-                self.turn_off_display_callback(name, crtc, callback=None)
-
-        # set the callback to window destroy for the last display
-        if last_display[1] == "active":  # Check if the display is active
-            self.turn_off_display_callback(
-                    name, crtc, callback=self.window.destroy)
-        else:
-            self.window.destroy()
-
-    def turn_on_display_callback(self, name, mode, crtc, unselected_displays,
-                                 layout, callback=None):
-        def callback_wrapper():
-            self.turn_on_display(name, mode, crtc, layout)
-            if callback:
-                callback(unselected_displays)
-        GLib.timeout_add_seconds(1, callback_wrapper)
-
-    def turn_off_display_callback(self, name, crtc, callback=None):
-        def callback_wrapper():
-            self.turn_off_display(name, crtc)
-            if callback:
-                callback()
-        GLib.timeout_add_seconds(1, callback_wrapper)
+        entries = [{
+            "name": page.display_info["name"],
+            "mode": page.selected_mode,
+            "x": outputs[page.display_info["name"]].x,
+            "y": outputs[page.display_info["name"]].y,
+            "rotation": outputs[page.display_info["name"]].rotation,
+            } for page in pages]
+        layout, _ = solve_layout(entries)
+
+        statuses = self.apply_layout(
+                layout, self.remember_button.get_active())
+        if not apply_succeeded(statuses):
+            # Keep the dialog open so that the layout can be corrected.
+            self.show_error("The layout could not be applied.")
+            return
+        self.hide()
+
+    def show_error(self, text):
+        dialog = Gtk.MessageDialog(
+            transient_for=self.window,
+            flags=0,
+            message_type=Gtk.MessageType.ERROR,
+            buttons=Gtk.ButtonsType.OK,
+            text=text
+        )
+        dialog.run()
+        dialog.destroy()
@@ -0,0 +1,174 @@
+from bisect import bisect_left
+
+from Xlib.ext import randr
+
+
+RELATIONS = ("clone", "left", "right", "above", "below")
+ALIASES = {"up": "above", "down": "below"}
+
+
+def output_size(mode, rotation=randr.Rotate_0):
+    """The width and height a mode covers on the screen after rotation."""
+    if rotation & (randr.Rotate_90 | randr.Rotate_270):
+        return mode.height, mode.width
+    return mode.width, mode.height
+
+
+def bounding_box(rects):
+    """Return (min_x, min_y, max_x, max_y) of (x, y, width, height) rects."""
+    rects = list(rects)
+    if not rects:
+        return 0, 0, 0, 0
+    return (min(x for x, _, _, _ in rects),
+            min(y for _, y, _, _ in rects),
+            max(x + width for x, _, width, _ in rects),
+            max(y + height for _, y, _, height in rects))
+
+
+def solve_layout(entries, normalize=True):
+    """
+    Place every display of a layout in one pass.
+
+    entries are dicts with "name", "mode" (anything with width and
+    height) and an optional "rotation". An entry with "relation" and
+    "anchor" is placed clone/left/right/above/below the anchor display;
+    any other entry is placed at its "x" and "y", or the origin. Several
+    displays on the same side of one anchor form a chain instead of
+    overlapping.
+
+    Returns the entries with their coordinates and the size of the
+    framebuffer that holds them all. With normalize the layout is shifted
+    so that it starts at the origin, as X screen coordinates must.
+    Raises ValueError for unknown relations, and for anchors that are
+    missing or circular.
+    """
+    names = {entry["name"] for entry in entries}
+    placed = {}
+    # The display last placed on each (anchor, relation), for chaining.
+    chain_ends = {}
+    pending = list(entries)
+
+    while pending:
+        remaining = []
+        for entry in pending:
+            relation = entry.get("relation")
+            relation = ALIASES.get(relation, relation)
+            anchor = entry.get("anchor")
+            width, height = output_size(
+                    entry["mode"], entry.get("rotation", randr.Rotate_0))
+
+            if relation is None or anchor is None or anchor == entry["name"]:
+                x, y = entry.get("x", 0), entry.get("y", 0)
+            elif relation not in RELATIONS:
+                raise ValueError(f"Unknown placement {relation!r}")
+            elif anchor not in names:
+                raise ValueError(
+                        f"{entry['name']} is placed relative to {anchor}, "
+                        "which is not in the layout")
+            elif anchor not in placed:
+                remaining.append(entry)
+                continue
+            else:
+                if relation == "clone":
+                    neighbour = anchor
+                else:
+                    neighbour = chain_ends.get((anchor, relation), anchor)
+                    chain_ends[(anchor, relation)] = entry["name"]
+                x, y = place_next_to(
+                        placed[neighbour], relation, width, height)
+
+            placed[entry["name"]] = (x, y, width, height)
+
+        if len(remaining) == len(pending):
+            raise ValueError(
+                    "Circular placement of "
+                    f"{', '.join(entry['name'] for entry in remaining)}")
+        pending = remaining
+
+    min_x, min_y, max_x, max_y = bounding_box(placed.values())
+    size = (max_x - min_x, max_y - min_y)
+    if not normalize:
+        min_x, min_y = 0, 0
+
+    layout = []
+    for entry in entries:
+        x, y, _, _ = placed[entry["name"]]
+        layout.append({
+            "name": entry["name"],
+            "mode": entry["mode"],
+            "x": x - min_x,
+            "y": y - min_y,
+            "rotation": entry.get("rotation", randr.Rotate_0),
+            })
+    return layout, size
+
+
+def outermost(entries, relation):
+    """
+    The name of the entry reaching furthest to the left, right, above or
+    below, where a display placed on that side of the layout goes.
+    """
+    relation = ALIASES.get(relation, relation)
+    if relation not in RELATIONS or relation == "clone":
+        raise ValueError(f"Unknown placement {relation!r}")
+
+    def reach(entry):
+        width, height = output_size(
+                entry["mode"], entry.get("rotation", randr.Rotate_0))
+        x, y = entry.get("x", 0), entry.get("y", 0)
+        return {"left": -x, "right": x + width,
+                "above": -y, "below": y + height}[relation]
+
+    return max(entries, key=reach)["name"]
+
+
+def place_next_to(neighbour, relation, width, height):
+    x, y, neighbour_width, neighbour_height = neighbour
+    if relation == "left":
+        return x - width, y
+    if relation == "right":
+        return x + neighbour_width, y
+    if relation == "above":
+        return x, y - height
+    if relation == "below":
+        return x, y + neighbour_height
+    return x, y
+
+
+class EdgeIndex:
+    """
+    The vertical and horizontal edges of a set of (x, y, width, height)
+    rects in sorted lists, so that a rect being dragged finds the edges
+    it can snap to by bisection instead of by checking every pair.
+    """
+
+    def __init__(self, rects):
+        rects = list(rects)
+        self.xs = sorted({x for x, _, _, _ in rects}
+                         | {x + width for x, _, width, _ in rects})
+        self.ys = sorted({y for _, y, _, _ in rects}
+                         | {y + height for _, y, _, height in rects})
+
+    def snap(self, x, y, width, height, threshold):
+        """
+        Move the rect so that its nearest edge within threshold lines up
+        with an indexed edge, on each axis. Returns the new x and y.
+        """
+        return (snap_axis(self.xs, x, width, threshold),
+                snap_axis(self.ys, y, height, threshold))
+
+
+def nearest_edge(edges, value):
+    index = bisect_left(edges, value)
+    return min(edges[max(0, index - 1):index + 1],
+               key=lambda edge: abs(edge - value), default=None)
+
+
+def snap_axis(edges, start, length, threshold):
+    """Snap the start or the end of a span, whichever is closer."""
+    best, best_distance = start, threshold
+    for offset in (0, length):
+        edge = nearest_edge(edges, start + offset)
+        if edge is not None and abs(edge - start - offset) <= best_distance:
+            best, best_distance = edge - offset, abs(edge - start - offset)
+    return best
@@ -0,0 +1,291 @@
+import functools
+import json
+import os
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from Xlib import X
+
+
+# Upper bounds of the latency histogram buckets in milliseconds.
+BUCKETS_MS = (
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+def timed(name):
+    """Record the duration of a method in its owner's metrics."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.metrics.timed(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Histogram:
+    """Latency counts in fixed buckets, plus count, sum and maximum."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, elapsed_ms):
+        index = 0
+        while index < len(BUCKETS_MS) and elapsed_ms > BUCKETS_MS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def as_dict(self):
+        buckets = {
+            f"le_{bound}": count
+            for bound, count in zip(BUCKETS_MS, self.counts) if count}
+        if self.counts[-1]:
+            buckets["inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "sum_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3)
+            if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "buckets": buckets,
+            }
+
+
+class Trace:
+    """The stages one hotplug went through, in ms since the event."""
+
+    def __init__(self, name, started=None):
+        self.name = name
+        self.started = started or time.perf_counter()
+        self.wall_time = time.time() - (time.perf_counter() - self.started)
+        self.stages = []
+
+    def reached(self, stage):
+        return any(name == stage for name, _ in self.stages)
+
+    def mark(self, stage):
+        elapsed_ms = (time.perf_counter() - self.started) * 1000
+        self.stages.append((stage, elapsed_ms))
+        return elapsed_ms
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "started": self.wall_time,
+            "stages": {stage: round(ms, 3) for stage, ms in self.stages},
+            }
+
+
+class Metrics:
+    """
+    Counters, latency histograms and hotplug traces of one DisplayManager.
+
+    X requests and round trips are counted by request kind, and the time
+    spent waiting for replies is kept apart from the time of the
+    operation around it, so a slow hotplug can be attributed to the X
+    server, to Python or to building the dialog.
+    """
+
+    MAX_TRACES = 20
+
+    def __init__(self):
+        self.started = time.time()
+        self.requests = Counter()
+        self.round_trips = Counter()
+        self.events = Counter()
+        self.histograms = {}
+        self.x_wait_ms = 0.0
+        self.trace = None
+        self.traces = deque(maxlen=self.MAX_TRACES)
+
+    def count_request(self, kind):
+        self.requests[kind] += 1
+
+    def count_round_trip(self, kind, elapsed_ms):
+        self.round_trips[kind] += 1
+        self.x_wait_ms += elapsed_ms
+        self.record("x_round_trip", elapsed_ms)
+
+    def count_event(self, kind):
+        self.events[kind] += 1
+
+    def record(self, name, elapsed_ms):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.record(elapsed_ms)
+
+    @contextmanager
+    def timed(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - started) * 1000)
+
+    def begin_trace(self, name, started=None):
+        """
+        Start a trace at started, a time.perf_counter() value. A trace
+        still open is kept as it is, without the later stages.
+        """
+        if self.trace is not None:
+            self.traces.append(self.trace)
+        self.trace = Trace(name, started)
+
+    def mark(self, stage):
+        """Record that the open trace reached stage."""
+        if self.trace is not None:
+            self.record(
+                    f"{self.trace.name}.{stage}", self.trace.mark(stage))
+
+    def end_trace(self, stage):
+        if self.trace is not None:
+            self.mark(stage)
+            self.traces.append(self.trace)
+            self.trace = None
+
+    def as_dict(self):
+        return {
+            "since": self.started,
+            "requests": dict(self.requests),
+            "round_trips": dict(self.round_trips),
+            "x_wait_ms": round(self.x_wait_ms, 3),
+            "events": dict(self.events),
+            "latency": {
+                name: histogram.as_dict()
+                for name, histogram in sorted(self.histograms.items())
+                },
+            "open_trace": self.trace.as_dict() if self.trace else None,
+            "traces": [trace.as_dict() for trace in self.traces],
+            }
+
+    def dump(self, path):
+        """Write the metrics as JSON, replacing the file atomically."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as metrics_file:
+            json.dump(self.as_dict(), metrics_file, indent=2)
+        os.replace(tmp_path, path)
+
+
+class InstrumentedBackend:
+    """
+    Count the requests and round trips made through a RandR backend.
+
+    Deferred requests are pipelined, so a round trip is counted when the
+    first reply of a batch is waited for; reading the rest of the batch
+    is free. Blocking requests cost one round trip each.
+    """
+
+    def __init__(self, backend, metrics):
+        self.backend = backend
+        self.metrics = metrics
+        self.outstanding = {}
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def fileno(self):
+        return self.backend.fileno()
+
+    def blocking(self, kind, call, *args, **kwargs):
+        self.metrics.count_request(kind)
+        started = time.perf_counter()
+        result = call(*args, **kwargs)
+        self.metrics.count_round_trip(
+                kind, (time.perf_counter() - started) * 1000)
+        return result
+
+    def deferrable(self, kind, call, defer, *args):
+        if not defer:
+            return self.blocking(kind, call, *args)
+        self.metrics.count_request(kind)
+        request = call(*args, defer=True)
+        self.outstanding[id(request)] = kind
+        return request
+
+    def read_reply(self, request):
+        kind = self.outstanding.pop(id(request), None)
+        if kind is None:
+            return self.backend.read_reply(request)
+
+        started = time.perf_counter()
+        self.backend.read_reply(request)
+        # Everything sent before this reply has been answered with it.
+        self.outstanding.clear()
+        self.metrics.count_round_trip(
+                kind, (time.perf_counter() - started) * 1000)
+        return request
+
+    def grab_server(self):
+        self.metrics.count_request("GrabServer")
+        self.backend.grab_server()
+
+    def ungrab_server(self):
+        self.metrics.count_request("UngrabServer")
+        self.backend.ungrab_server()
+
+    def query_version(self):
+        return self.blocking("QueryVersion", self.backend.query_version)
+
+    def get_screen_resources(self, current=True):
+        kind = ("GetScreenResourcesCurrent" if current
+                else "GetScreenResources")
+        return self.blocking(
+                kind, self.backend.get_screen_resources, current)
+
+    def get_screen_size_range(self):
+        return self.blocking(
+                "GetScreenSizeRange", self.backend.get_screen_size_range)
+
+    def get_root_geometry(self):
+        return self.blocking("GetGeometry", self.backend.get_root_geometry)
+
+    def get_output_info(self, output, config_timestamp=X.CurrentTime,
+                        defer=False):
+        return self.deferrable(
+                "GetOutputInfo", self.backend.get_output_info, defer,
+                output, config_timestamp)
+
+    def get_crtc_info(self, crtc, config_timestamp=X.CurrentTime,
+                      defer=False):
+        return self.deferrable(
+                "GetCrtcInfo", self.backend.get_crtc_info, defer,
+                crtc, config_timestamp)
+
+    def get_output_property(self, output, atom, defer=False):
+        return self.deferrable(
+                "GetOutputProperty", self.backend.get_output_property, defer,
+                output, atom)
+
+    def set_crtc_config(self, crtc, config_timestamp, x, y, mode, rotation,
+                        outputs, defer=False):
+        return self.deferrable(
+                "SetCrtcConfig", self.backend.set_crtc_config, defer,
+                crtc, config_timestamp, x, y, mode, rotation, outputs)
+
+    def set_screen_size(self, width, height, width_mm, height_mm):
+        self.metrics.count_request("SetScreenSize")
+        self.backend.set_screen_size(width, height, width_mm, height_mm)
+
+    def get_crtc_gamma_size(self, crtc, defer=False):
+        return self.deferrable(
+                "GetCrtcGammaSize", self.backend.get_crtc_gamma_size, defer,
+                crtc)
+
+    def get_crtc_gamma(self, crtc, defer=False):
+        return self.deferrable(
+                "GetCrtcGamma", self.backend.get_crtc_gamma, defer, crtc)
+
+    def set_crtc_gamma(self, crtc, size, red, green, blue):
+        self.metrics.count_request("SetCrtcGamma")
+        self.backend.set_crtc_gamma(crtc, size, red, green, blue)
@@ -0,0 +1,187 @@
+from array import array
+from collections.abc import Sequence
+
+
+MODE_FLAGS = {
+    1: "HSyncPositive",
+    2: "HSyncNegative",
+    4: "VSyncPositive",
+    8: "VSyncNegative",
+    16: "Interlace",
+    32: "DoubleScan",
+    64: "CSync",
+    128: "CSyncPositive",
+    256: "CSyncNegative",
+}
+
+INTERLACE = 16
+DOUBLE_SCAN = 32
+
+
+class Mode:
+    """A RandR mode with its refresh rate, flags and label precomputed."""
+
+    __slots__ = (
+        "id", "name", "width", "height", "dot_clock", "h_total", "v_total",
+        "flags", "refresh_rate", "flag_names", "label",
+    )
+
+    def __init__(self, mode_info, name=""):
+        self.id = mode_info.id
+        self.name = name
+        self.width = mode_info.width
+        self.height = mode_info.height
+        self.dot_clock = mode_info.dot_clock
+        self.h_total = mode_info.h_total
+        self.v_total = mode_info.v_total
+        self.flags = mode_info.flags
+        self.refresh_rate = self.compute_refresh_rate()
+        self.flag_names = tuple(
+            description for flag, description in MODE_FLAGS.items()
+            if self.flags & flag
+            )
+        self.label = f"{self.width} x {self.height} " \
+                     f"{round(self.refresh_rate)} Hz\n" \
+                     f"Flags: {', '.join(self.flag_names)}"
+
+    def compute_refresh_rate(self):
+        if not self.h_total or not self.v_total:
+            return 0.0
+
+        v_total = self.v_total
+        if self.flags & DOUBLE_SCAN:
+            v_total *= 2
+        if self.flags & INTERLACE:
+            v_total /= 2
+        return self.dot_clock / (self.h_total * v_total)
+
+    @property
+    def geometry(self):
+        return self.width, self.height, round(self.refresh_rate, 2)
+
+    def __repr__(self):
+        return f"Mode({self.id}, {self.width}x{self.height}" \
+               f"@{self.refresh_rate:.2f})"
+
+
+class ModeList(Sequence):
+    """
+    The modes of an output as a compact array of mode ids, read through
+    the shared ModeCatalog. Lists compare by their ids.
+    """
+
+    __slots__ = ("catalog", "ids", "by_size")
+
+    def __init__(self, catalog, ids):
+        self.catalog = catalog
+        self.ids = ids
+        self.by_size = None
+
+    def with_size(self, width, height):
+        """The modes of width x height, in server order."""
+        if self.by_size is None:
+            self.by_size = {}
+            for mode in self:
+                self.by_size.setdefault(
+                        (mode.width, mode.height), []).append(mode)
+        return self.by_size.get((width, height), [])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.catalog.by_id[mode_id] for mode_id in self.ids[index]]
+        return self.catalog.by_id[self.ids[index]]
+
+    def __iter__(self):
+        return map(self.catalog.by_id.__getitem__, self.ids)
+
+    def __eq__(self, other):
+        if not isinstance(other, ModeList):
+            return NotImplemented
+        return self.ids == other.ids
+
+    def __repr__(self):
+        return f"ModeList({list(self.ids)})"
+
+
+def mode_signature(resources):
+    """Everything about a resource snapshot's modes that a Mode holds."""
+    names = getattr(resources, "names", None)
+    if names is None:
+        names = getattr(resources, "mode_names", "")
+    return names, tuple(
+        (mode_info.id, mode_info.width, mode_info.height,
+         mode_info.dot_clock, mode_info.h_total, mode_info.v_total,
+         mode_info.flags, mode_info.name_length)
+        for mode_info in resources.modes)
+
+
+class ModeCatalog:
+    """
+    Every mode of one resource snapshot, indexed by mode id. Outputs
+    share the Mode records, and outputs with the same modes share one
+    ModeList and its index by size. A catalog outlives the snapshot it
+    was built for as long as the server's modes stay the same.
+    """
+
+    def __init__(self, resources):
+        self.signature = mode_signature(resources)
+        names = self.signature[0]
+
+        self.by_id = {}
+        self.lists = {}
+        offset = 0
+        for mode_info in resources.modes:
+            name = names[offset:offset + mode_info.name_length]
+            offset += mode_info.name_length
+
+            mode = Mode(mode_info, name)
+            self.by_id[mode.id] = mode
+
+    def __contains__(self, mode_id):
+        return mode_id in self.by_id
+
+    def matches(self, resources):
+        """Whether resources list exactly the modes of this catalog."""
+        return mode_signature(resources) == self.signature
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def get(self, mode_id):
+        return self.by_id.get(mode_id)
+
+    def modes_for(self, output_info):
+        """Return the ModeList of an output's modes, in server order."""
+        key = tuple(output_info.modes)
+        mode_list = self.lists.get(key)
+        if mode_list is None:
+            mode_list = self.lists[key] = ModeList(self, array(
+                "I", [mode_id for mode_id in key if mode_id in self.by_id]))
+        return mode_list
+
+
+class FlagIndex:
+    """
+    Map a flag filter mask to the ids of the modes whose flags contain
+    every bit of the mask. Modes are grouped by their flag value once and
+    each mask is resolved at most once.
+    """
+
+    def __init__(self, modes):
+        self.ids_by_flags = {}
+        for mode in modes:
+            self.ids_by_flags.setdefault(mode.flags, set()).add(mode.id)
+        self.visible_by_mask = {}
+
+    def lookup(self, mask):
+        visible = self.visible_by_mask.get(mask)
+        if visible is None:
+            visible = frozenset().union(*(
+                ids for flags, ids in self.ids_by_flags.items()
+                if flags & mask == mask
+                ))
+            self.visible_by_mask[mask] = visible
+        return visible
@@ -0,0 +1,58 @@
+import hashlib
+import json
+import os
+
+
+DEFAULT_PROFILE_PATH = os.path.join(
+        os.path.expanduser("~"), ".config", "screen-manager-gtk",
+        "profiles.json")
+
+
+def edid_hash(edid_info, name):
+    """
+    Identify one output by its EDID content hash. Outputs without a
+    parsable EDID fall back to their connector name so they still take
+    part in the fingerprint.
+    """
+    if edid_info is not None:
+        return edid_info.digest
+    return hashlib.sha1(f"connector:{name}".encode()).hexdigest()
+
+
+def fingerprint(edid_hashes):
+    """Identify a set of connected monitors independent of their order."""
+    return hashlib.sha1(
+            "\n".join(sorted(edid_hashes)).encode()).hexdigest()
+
+
+class ProfileStore:
+    """
+    Layouts saved per monitor fingerprint, persisted as one JSON file.
+
+    Every saved output records its EDID hash so a profile still applies
+    when the same monitors come up on different connectors, and its mode
+    by geometry since RandR mode ids do not survive a server restart.
+    """
+
+    def __init__(self, path=DEFAULT_PROFILE_PATH):
+        self.path = path
+        self.profiles = self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as profile_file:
+                return json.load(profile_file)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key):
+        return self.profiles.get(key)
+
+    def save(self, key, outputs):
+        self.profiles[key] = {"outputs": outputs}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as profile_file:
+            json.dump(self.profiles, profile_file, indent=2)
+        os.replace(temp_path, self.path)
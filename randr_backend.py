@@ -0,0 +1,240 @@
+from collections import deque
+
+from Xlib import X
+from Xlib.display import Display
+from Xlib.ext import randr
+from Xlib.protocol import rq
+
+
+class SetCrtcGammaRamps(rq.Request):
+    """
+    RRSetCrtcGamma with the red, green and blue ramps packed as one byte
+    string. Xlib speaks the client's byte order, so arrays of native
+    16-bit entries are sent as they are instead of entry by entry.
+    """
+
+    _request = rq.Struct(
+        rq.Card8("opcode"),
+        rq.Opcode(24),
+        rq.RequestLength(),
+        rq.Card32("crtc"),
+        rq.Card16("size"),
+        rq.Pad(2),
+        rq.String8("ramps"),
+        )
+
+
+class EventRouter:
+    """
+    Split the events of one X connection between its screens.
+
+    Every event DisplayManager selects is reported on a root window, so
+    the events of each screen are queued by the id of its root and a
+    backend only ever sees the events of its own screen.
+    """
+
+    def __init__(self, display):
+        self.display = display
+        self.queues = {}
+
+    def add_root(self, root_window):
+        self.queues[root_window.id] = deque()
+
+    def route(self, event):
+        window = getattr(event, "window", None)
+        queue = self.queues.get(getattr(window, "id", window))
+        if queue is not None:
+            queue.append(event)
+
+    def pending_events(self, root_window):
+        while self.display.pending_events():
+            self.route(self.display.next_event())
+        return len(self.queues[root_window.id])
+
+    def next_event(self, root_window):
+        queue = self.queues[root_window.id]
+        while not queue:
+            self.route(self.display.next_event())
+        return queue.popleft()
+
+
+class XlibRandrBackend:
+    """
+    The X connection and every RandR request DisplayManager makes.
+
+    Methods that take defer=True send the request without waiting; the
+    returned object is answered by read_reply(), so callers can pipeline
+    several requests into one flush. Without defer the reply has already
+    been read. Alternative backends (fakes, recorders, replayers)
+    implement the same methods.
+
+    display is an open Display and screen one of its screen numbers,
+    which default to $DISPLAY and its default screen. Backends for
+    several screens of one display share the connection through an
+    EventRouter.
+    """
+
+    def __init__(self, display=None, screen=None, router=None):
+        self.display = display or Display()
+        self.screen_number = (self.display.get_default_screen()
+                              if screen is None else screen)
+        self.root_window = self.display.screen(self.screen_number).root
+        self.router = router
+        if router is not None:
+            router.add_root(self.root_window)
+
+    @property
+    def name(self):
+        """The X name of the screen, such as ":0.1"."""
+        host, _, number = self.display.get_display_name().rpartition(":")
+        return f"{host}:{number.split('.')[0]}.{self.screen_number}"
+
+    # Connection
+
+    def fileno(self):
+        return self.display.fileno()
+
+    def pending_events(self):
+        if self.router is not None:
+            return self.router.pending_events(self.root_window)
+        return self.display.pending_events()
+
+    def next_event(self):
+        if self.router is not None:
+            return self.router.next_event(self.root_window)
+        return self.display.next_event()
+
+    def flush(self):
+        self.display.flush()
+
+    def note(self, call, **args):
+        """Mark a point a recorded trace is replayed from; see randr_trace."""
+
+    def grab_server(self):
+        self.display.grab_server()
+
+    def ungrab_server(self):
+        self.display.ungrab_server()
+
+    @property
+    def extension_event(self):
+        return self.display.extension_event
+
+    def has_extension(self, name):
+        return self.display.query_extension(name).present
+
+    def query_version(self):
+        return self.display.xrandr_query_version()
+
+    def get_atom(self, name):
+        return self.display.get_atom(name)
+
+    def select_root_input(self, event_mask):
+        self.root_window.change_attributes(event_mask=event_mask)
+
+    def select_randr_input(self, mask):
+        self.root_window.xrandr_select_input(mask)
+
+    def screen_dimensions(self):
+        """Return the screen size in pixels and millimetres at connect."""
+        screen = self.display.screen(self.screen_number)
+        return (screen.width_in_pixels, screen.height_in_pixels,
+                screen.width_in_mms, screen.height_in_mms)
+
+    # Requests
+
+    def read_reply(self, request):
+        """Wait for the reply of a deferred request and return it."""
+        request.reply()
+        return request
+
+    def get_screen_resources(self, current=True):
+        if current:
+            return self.root_window.xrandr_get_screen_resources_current()
+        return self.root_window.xrandr_get_screen_resources()
+
+    def get_screen_size_range(self):
+        return self.root_window.xrandr_get_screen_size_range()
+
+    def get_root_geometry(self):
+        return self.root_window.get_geometry()
+
+    def get_output_info(self, output, config_timestamp=X.CurrentTime,
+                        defer=False):
+        return randr.GetOutputInfo(
+            display=self.display.display,
+            defer=defer,
+            opcode=self.display.get_extension_major(randr.extname),
+            output=output,
+            config_timestamp=config_timestamp,
+            )
+
+    def get_crtc_info(self, crtc, config_timestamp=X.CurrentTime,
+                      defer=False):
+        return randr.GetCrtcInfo(
+            display=self.display.display,
+            defer=defer,
+            opcode=self.display.get_extension_major(randr.extname),
+            crtc=crtc,
+            config_timestamp=config_timestamp,
+            )
+
+    def get_output_property(self, output, atom, defer=False):
+        return randr.GetOutputProperty(
+            display=self.display.display,
+            defer=defer,
+            opcode=self.display.get_extension_major(randr.extname),
+            output=output,
+            property=atom,
+            type=X.AnyPropertyType,
+            long_offset=0,
+            long_length=256,
+            delete=False,
+            pending=False,
+            )
+
+    def set_crtc_config(self, crtc, config_timestamp, x, y, mode, rotation,
+                        outputs, defer=False):
+        return randr.SetCrtcConfig(
+            display=self.display.display,
+            defer=defer,
+            opcode=self.display.get_extension_major(randr.extname),
+            crtc=crtc,
+            config_timestamp=config_timestamp,
+            x=x,
+            y=y,
+            mode=mode,
+            rotation=rotation,
+            outputs=outputs,
+            timestamp=X.CurrentTime,
+            )
+
+    def set_screen_size(self, width, height, width_mm, height_mm):
+        self.root_window.xrandr_set_screen_size(
+                width, height, width_mm, height_mm)
+
+    def get_crtc_gamma_size(self, crtc, defer=False):
+        return randr.GetCrtcGammaSize(
+            display=self.display.display,
+            defer=defer,
+            opcode=self.display.get_extension_major(randr.extname),
+            crtc=crtc,
+            )
+
+    def get_crtc_gamma(self, crtc, defer=False):
+        return randr.GetCrtcGamma(
+            display=self.display.display,
+            defer=defer,
+            opcode=self.display.get_extension_major(randr.extname),
+            crtc=crtc,
+            )
+
+    def set_crtc_gamma(self, crtc, size, red, green, blue):
+        """Send a CRTC's ramps, arrays of size unsigned 16-bit entries."""
+        SetCrtcGammaRamps(
+            display=self.display.display,
+            opcode=self.display.get_extension_major(randr.extname),
+            crtc=crtc,
+            size=size,
+            ramps=red.tobytes() + green.tobytes() + blue.tobytes(),
+            )
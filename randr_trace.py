@@ -0,0 +1,518 @@
+import atexit
+import bisect
+import gzip
+import json
+import os
+import time
+from types import SimpleNamespace
+
+from Xlib import X
+from Xlib.ext import randr
+from Xlib.xobject.resource import Resource
+
+
+TRACE_VERSION = 1
+
+# The reply fields DisplayManager reads, per backend query. Everything
+# else in a reply is left out of the trace.
+REPLY_FIELDS = {
+    "query_version": ("major_version", "minor_version"),
+    "get_screen_resources": (
+        "timestamp", "config_timestamp", "crtcs", "outputs", "modes",
+        "names", "mode_names"),
+    "get_screen_size_range": (
+        "min_width", "min_height", "max_width", "max_height"),
+    "get_root_geometry": ("width", "height"),
+    "get_output_info": (
+        "timestamp", "crtc", "mm_width", "mm_height", "connection",
+        "subpixel_order", "num_preferred", "crtcs", "modes", "clones",
+        "name"),
+    "get_crtc_info": (
+        "timestamp", "x", "y", "width", "height", "mode", "rotation",
+        "possible_rotations", "outputs", "possible_outputs"),
+    "get_output_property": ("format", "property_type", "value"),
+    "set_crtc_config": ("status", "new_timestamp"),
+    "get_crtc_gamma_size": ("size",),
+    "get_crtc_gamma": ("red", "green", "blue"),
+    }
+
+EXTENSION_EVENTS = (
+    "ScreenChangeNotify", "CrtcChangeNotify", "OutputChangeNotify",
+    "OutputPropertyNotify")
+
+# Fields Xlib keeps on every event that say nothing about the change.
+EVENT_SKIP_FIELDS = ("sequence_number", "send_event")
+
+
+class TraceError(Exception):
+    """A trace cannot answer a request the replayed code made."""
+
+
+def trace_path(path, screen_name=None):
+    """The trace file of a screen, with its name before the extension."""
+    path = os.path.expanduser(path)
+    if not screen_name:
+        return path
+    compressed = path.endswith(".gz")
+    root, extension = os.path.splitext(path[:-3] if compressed else path)
+    return (f"{root}{screen_name.replace('/', '_')}{extension}"
+            + (".gz" if compressed else ""))
+
+
+def encode_value(value):
+    """Turn a reply or event value into plain JSON values."""
+    if isinstance(value, (int, float, str)) or value is None:
+        return value
+    if isinstance(value, Resource):
+        return value.id
+    if isinstance(value, (bytes, bytearray)):
+        return list(value)
+    data = getattr(value, "_data", None)
+    if data is None and isinstance(value, SimpleNamespace):
+        data = vars(value)
+    if data is not None:
+        return {key: encode_value(item) for key, item in data.items()
+                if key and not key.startswith("_")}
+    return [encode_value(item) for item in value]
+
+
+def encode_reply(op, reply):
+    if op not in REPLY_FIELDS:
+        return encode_value(reply)
+    fields = {}
+    for field in REPLY_FIELDS[op]:
+        value = getattr(reply, field, None)
+        if value is not None:
+            fields[field] = encode_value(value)
+    return fields
+
+
+def encode_event(event):
+    data = getattr(event, "_data", None)
+    if data is None:
+        data = vars(event)
+    return {key: encode_value(value) for key, value in data.items()
+            if key not in EVENT_SKIP_FIELDS}
+
+
+def decode_value(value):
+    if isinstance(value, dict):
+        return SimpleNamespace(
+                **{key: decode_value(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [decode_value(item) for item in value]
+    return value
+
+
+def open_trace(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def read_trace(path):
+    """
+    Return the header and the records of a trace. A trace cut short by
+    a killed recorder keeps every record written before it.
+    """
+    records = []
+    with open_trace(path, "r") as trace_file:
+        try:
+            for line in trace_file:
+                if line.endswith("\n"):
+                    records.append(json.loads(line))
+        except EOFError:
+            pass
+    if not records or records[0].get("trace") != TRACE_VERSION:
+        raise TraceError(f"{path} is not a screen-manager trace")
+    return records[0], records[1:]
+
+
+class TraceWriter:
+    """
+    Append compact JSON lines to a trace, gzip compressed when the path
+    ends with .gz. Every record carries its time in seconds since the
+    trace started.
+    """
+
+    def __init__(self, path, header):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.trace_file = open_trace(path, "w")
+        self.started = time.monotonic()
+        self.write(dict(header, trace=TRACE_VERSION))
+        atexit.register(self.close)
+
+    def write(self, record):
+        if self.trace_file is None:
+            return
+        record["t"] = round(time.monotonic() - self.started, 6)
+        self.trace_file.write(json.dumps(record, separators=(",", ":")))
+        self.trace_file.write("\n")
+
+    def flush(self):
+        if self.trace_file is not None:
+            self.trace_file.flush()
+
+    def close(self):
+        if self.trace_file is not None:
+            self.trace_file.close()
+            self.trace_file = None
+
+
+class RecordingBackend:
+    """
+    Record every event and query reply that passes through a backend.
+
+    The trace holds the replies of the queries DisplayManager made, the
+    events it received and the notes it left at the points a replay has
+    to act on: each flush of coalesced events, and each layout applied
+    and display turned off from outside the event path. Records are
+    buffered, and written out at every note, so a quiet seat does not
+    touch the disk.
+    """
+
+    def __init__(self, backend, path):
+        self.backend = backend
+        self.outstanding = {}
+        self.writer = TraceWriter(path, {
+            "screen": getattr(backend, "name", None),
+            "extension_event": {
+                name: encode_value(getattr(
+                    backend.extension_event, name, None))
+                for name in EXTENSION_EVENTS
+                },
+            })
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def fileno(self):
+        return self.backend.fileno()
+
+    def record(self, op, key, reply):
+        self.writer.write(
+                {"op": op, "key": key, "reply": encode_reply(op, reply)})
+        return reply
+
+    def record_profiles(self, profile_store):
+        """Wrap profile_store so that its lookups are traced too."""
+        if profile_store is None:
+            return None
+        return RecordingProfileStore(profile_store, self)
+
+    def note(self, call, **args):
+        self.writer.write({"call": call, "args": args})
+        self.writer.flush()
+
+    def next_event(self):
+        event = self.backend.next_event()
+        self.writer.write({
+            "event": type(event).__name__, "fields": encode_event(event)})
+        return event
+
+    def read_reply(self, request):
+        reply = self.backend.read_reply(request)
+        entry = self.outstanding.pop(id(request), None)
+        if entry is not None:
+            self.record(*entry, reply)
+        return reply
+
+    def deferrable(self, op, key, call, defer, *args):
+        if not defer:
+            return self.record(op, key, call(*args))
+        request = call(*args, defer=True)
+        self.outstanding[id(request)] = (op, key)
+        return request
+
+    def has_extension(self, name):
+        return self.record(
+                "has_extension", [name], self.backend.has_extension(name))
+
+    def query_version(self):
+        return self.record(
+                "query_version", [], self.backend.query_version())
+
+    def get_atom(self, name):
+        return self.record("get_atom", [name], self.backend.get_atom(name))
+
+    def screen_dimensions(self):
+        return self.record(
+                "screen_dimensions", [], self.backend.screen_dimensions())
+
+    def get_screen_resources(self, current=True):
+        return self.record(
+                "get_screen_resources", [current],
+                self.backend.get_screen_resources(current))
+
+    def get_screen_size_range(self):
+        return self.record(
+                "get_screen_size_range", [],
+                self.backend.get_screen_size_range())
+
+    def get_root_geometry(self):
+        return self.record(
+                "get_root_geometry", [], self.backend.get_root_geometry())
+
+    def get_output_info(self, output, config_timestamp=X.CurrentTime,
+                        defer=False):
+        return self.deferrable(
+                "get_output_info", [output], self.backend.get_output_info,
+                defer, output, config_timestamp)
+
+    def get_crtc_info(self, crtc, config_timestamp=X.CurrentTime,
+                      defer=False):
+        return self.deferrable(
+                "get_crtc_info", [crtc], self.backend.get_crtc_info, defer,
+                crtc, config_timestamp)
+
+    def get_output_property(self, output, atom, defer=False):
+        return self.deferrable(
+                "get_output_property", [output, atom],
+                self.backend.get_output_property, defer, output, atom)
+
+    def set_crtc_config(self, crtc, config_timestamp, x, y, mode, rotation,
+                        outputs, defer=False):
+        return self.deferrable(
+                "set_crtc_config", [crtc], self.backend.set_crtc_config,
+                defer, crtc, config_timestamp, x, y, mode, rotation, outputs)
+
+    def get_crtc_gamma_size(self, crtc, defer=False):
+        return self.deferrable(
+                "get_crtc_gamma_size", [crtc],
+                self.backend.get_crtc_gamma_size, defer, crtc)
+
+    def get_crtc_gamma(self, crtc, defer=False):
+        return self.deferrable(
+                "get_crtc_gamma", [crtc], self.backend.get_crtc_gamma, defer,
+                crtc)
+
+
+class RecordingProfileStore:
+    """A ProfileStore whose lookups are part of the trace."""
+
+    def __init__(self, profile_store, backend):
+        self.profile_store = profile_store
+        self.backend = backend
+
+    def __getattr__(self, name):
+        return getattr(self.profile_store, name)
+
+    def get(self, key):
+        return self.backend.record(
+                "profile", [key], self.profile_store.get(key))
+
+
+class ReplayProfileStore:
+    """The profile lookups of a trace; saving is ignored."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get(self, key):
+        try:
+            return self.backend.answer("profile", [key], raw=True)
+        except TraceError:
+            return None
+
+    def save(self, key, outputs):
+        pass
+
+
+class ReplayBackend:
+    """
+    A backend that answers from a recorded trace.
+
+    Queries are answered with the reply recorded for the same request
+    and object, as of the record the replay has reached, so code that
+    makes more, fewer or reordered requests than the recorded one still
+    sees the server state it would have seen. Changes to the
+    configuration succeed unless the trace says otherwise. replay_trace
+    drives a DisplayManager through the trace's events and notes.
+    """
+
+    def __init__(self, path):
+        header, self.records = read_trace(path)
+        self.name = header.get("screen") or path
+        self.extension_event = SimpleNamespace(**{
+            name: tuple(code) if isinstance(code, list) else code
+            for name, code in header["extension_event"].items()
+            })
+        self.profile_store = ReplayProfileStore(self)
+        self.pending = []
+        self.event_classes = {}
+        self.indexes = {}
+        self.replies = {}
+        for index, record in enumerate(self.records):
+            if "op" in record:
+                key = (record["op"], *record["key"])
+                self.indexes.setdefault(key, []).append(index)
+                self.replies.setdefault(key, []).append(record["reply"])
+        # Queries made before the first step see the replies before it.
+        self.position = next(
+            (position for position, record in enumerate(self.records)
+             if "op" not in record), len(self.records))
+
+    def answer(self, op, key, raw=False):
+        """
+        The reply to op on key recorded last before the next step of the
+        replay, or the first one recorded for objects not queried yet.
+        """
+        key = (op, *key)
+        indexes = self.indexes.get(key)
+        if indexes is None:
+            raise TraceError(f"The trace has no reply to {key}")
+        found = max(0, bisect.bisect_left(indexes, self.position) - 1)
+        reply = self.replies[key][found]
+        return reply if raw else decode_value(reply)
+
+    def steps(self):
+        """
+        Yield the event and note records in order. The replies recorded
+        up to the next one answer the queries made for each.
+        """
+        positions = [position for position, record
+                     in enumerate(self.records) if "op" not in record]
+        for step, position in enumerate(positions):
+            self.position = (positions[step + 1] if step + 1 < len(positions)
+                             else len(self.records))
+            yield self.records[position]
+
+    def decode_event(self, record):
+        event_class = self.event_classes.get(record["event"])
+        if event_class is None:
+            # Named like the recorded class, so events can be told apart.
+            event_class = self.event_classes[record["event"]] = type(
+                    record["event"], (SimpleNamespace,), {})
+        return event_class(**{
+            key: tuple(value) if isinstance(value, list) else value
+            for key, value in record["fields"].items()})
+
+    # Connection
+
+    def fileno(self):
+        raise TraceError("A replayed trace has no connection to watch")
+
+    def pending_events(self):
+        return len(self.pending)
+
+    def next_event(self):
+        return self.pending.pop(0)
+
+    def flush(self):
+        pass
+
+    def grab_server(self):
+        pass
+
+    def ungrab_server(self):
+        pass
+
+    def note(self, call, **args):
+        pass
+
+    def has_extension(self, name):
+        return self.answer("has_extension", [name], raw=True)
+
+    def query_version(self):
+        return self.answer("query_version", [])
+
+    def get_atom(self, name):
+        return self.answer("get_atom", [name], raw=True)
+
+    def select_root_input(self, event_mask):
+        pass
+
+    def select_randr_input(self, mask):
+        pass
+
+    def screen_dimensions(self):
+        return tuple(self.answer("screen_dimensions", [], raw=True))
+
+    # Requests
+
+    def read_reply(self, request):
+        return request
+
+    def get_screen_resources(self, current=True):
+        try:
+            return self.answer("get_screen_resources", [current])
+        except TraceError:
+            return self.answer("get_screen_resources", [not current])
+
+    def get_screen_size_range(self):
+        return self.answer("get_screen_size_range", [])
+
+    def get_root_geometry(self):
+        try:
+            return self.answer("get_root_geometry", [])
+        except TraceError:
+            # Traces recorded before the query existed.
+            width, height, _, _ = self.screen_dimensions()
+            return SimpleNamespace(width=width, height=height)
+
+    def get_output_info(self, output, config_timestamp=X.CurrentTime,
+                        defer=False):
+        return self.answer("get_output_info", [output])
+
+    def get_crtc_info(self, crtc, config_timestamp=X.CurrentTime,
+                      defer=False):
+        return self.answer("get_crtc_info", [crtc])
+
+    def get_output_property(self, output, atom, defer=False):
+        return self.answer("get_output_property", [output, atom])
+
+    def set_crtc_config(self, crtc, config_timestamp, x, y, mode, rotation,
+                        outputs, defer=False):
+        try:
+            return self.answer("set_crtc_config", [crtc])
+        except TraceError:
+            return SimpleNamespace(
+                    status=randr.SetConfigSuccess, new_timestamp=0)
+
+    def set_screen_size(self, width, height, width_mm, height_mm):
+        pass
+
+    def get_crtc_gamma_size(self, crtc, defer=False):
+        return self.answer("get_crtc_gamma_size", [crtc])
+
+    def get_crtc_gamma(self, crtc, defer=False):
+        return self.answer("get_crtc_gamma", [crtc])
+
+    def set_crtc_gamma(self, crtc, size, red, green, blue):
+        pass
+
+
+def replay_trace(display_manager, backend, realtime=False):
+    """
+    Feed the events of a trace through display_manager's process_event,
+    and repeat its flushes, applies and turn-offs where they were
+    recorded. With realtime the recorded gaps between them are kept;
+    otherwise the trace runs as fast as possible. Returns the count of
+    each step.
+    """
+    counts = {"events": 0, "flush_events": 0, "apply_layout": 0,
+              "turn_off_display": 0}
+    started = time.monotonic()
+    for record in backend.steps():
+        if realtime:
+            delay = started + record["t"] - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        if "event" in record:
+            backend.pending.append(backend.decode_event(record))
+            display_manager.dispatch_pending()
+            counts["events"] += 1
+        elif record["call"] == "flush_events":
+            display_manager.flush_events()
+            counts["flush_events"] += 1
+        elif record["call"] == "apply_layout":
+            display_manager.apply_layout(record["args"]["layout"])
+            counts["apply_layout"] += 1
+        elif record["call"] == "turn_off_display":
+            display_manager.turn_off_display(
+                    record["args"]["name"], record["args"]["crtc"])
+            counts["turn_off_display"] += 1
+    return counts
@@ -1,56 +1,29 @@
-import threading
-import queue
-import logging
+import time
 
-from utils.logger import Logger
-from display_manager import DisplayManager
-from gui import GUI
+STARTED = time.perf_counter()
 
+import argparse
+import sys
 
-class ScreenManagerGTK:
-    def __init__(self):
-        self.event_queue = queue.Queue()
-        self.logger = Logger()
-        self.disp_mgr = DisplayManager(self.event_queue.put, self.logger)
-        self.gui = GUI(
-                self.disp_mgr,
-                self.turn_on_display,
-                self.turn_off_display,
-                self.logger
-                )
+from cli import add_commands, run_command
 
-    def turn_on_display(self, name, mode, crtc, layout="right"):
-        self.disp_mgr.turn_on_display(name, mode, crtc)
 
-    def turn_off_display(self, name, crtc):
-        self.disp_mgr.turn_off_display(name, crtc)
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            prog="screen-manager-gtk",
+            description="Monitor connected screens and configure them.")
+    subparsers = parser.add_subparsers(dest="command")
+    add_commands(subparsers)
+    args = parser.parse_args(argv)
 
-    def handle_event(self):
-        while True:
-            try:
-                event = self.event_queue.get()
-                if isinstance(event, str) and "display_added" in event:
-                    self.gui.show()
-                else:
-                    logging.warning(f"Unexpected event: {event}")
-            except Exception as e:
-                logging.error(f"Error handling event: {e}")
+    if args.command is None:
+        # GTK is only imported when the interactive daemon is wanted.
+        from app import ScreenManagerGTK
+        ScreenManagerGTK().start()
+        return 0
 
-    def run_display_monitor(self):
-        self.disp_mgr.start_monitoring()
-
-    def start(self):
-        disp_mon_thread = threading.Thread(target=self.run_display_monitor)
-        disp_mon_thread.start()
-
-        event_handler_thread = threading.Thread(target=self.handle_event)
-        event_handler_thread.start()
-
-
-def main():
-    moni_py = ScreenManagerGTK()
-    moni_py.start()
+    return run_command(args, STARTED)
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
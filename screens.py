@@ -0,0 +1,181 @@
+import select
+import time
+
+from Xlib.display import Display
+
+from display_manager import DisplayManager
+from randr_backend import EventRouter, XlibRandrBackend
+from randr_trace import RecordingBackend, trace_path
+
+
+def parse_screen_spec(spec):
+    """
+    Split an X name into its display and screen: ":1.2" is screen 2 of
+    ":1", and ":1" stands for all of its screens (screen None).
+    """
+    host, _, number = spec.rpartition(":")
+    display_number, _, screen = number.partition(".")
+    return f"{host}:{display_number}", int(screen) if screen else None
+
+
+class ScreenSet:
+    """
+    One DisplayManager per X screen, for any number of X displays.
+
+    Every display gets one connection, shared by its screens through an
+    EventRouter, and each screen keeps its own cached model.
+    start_monitoring multiplexes all connections and the watched file
+    objects on a single select loop, so an idle seat costs no wakeups
+    and no interpreter of its own. Main loops that own the connections
+    call dispatch(fd) instead.
+
+    event_handler is called with the screen name and the event. With
+    record_path every screen records a trace of its X traffic, named
+    after the screen when there are several. With command_connection
+    every screen sends its configuration changes on a second connection
+    of its own.
+    """
+
+    def __init__(self, specs, event_handler, logger, record_path=None,
+                 command_connection=False, **options):
+        self.logger = logger
+        self.record_path = record_path
+        self.command_connection = command_connection
+        self.managers = {}
+        self.connections = {}
+        self.watches = {}
+        self.deadlines = {}
+
+        screens_by_display = {}
+        for spec in specs or [None]:
+            display_name, screen = (None, None) if spec is None \
+                else parse_screen_spec(spec)
+            screens = screens_by_display.setdefault(display_name, set())
+            screens.add(screen)
+
+        displays = []
+        for display_name, screens in screens_by_display.items():
+            display = Display(display_name)
+            if None in screens:
+                screens = range(display.screen_count()) if display_name \
+                    else [display.get_default_screen()]
+            displays.append((display, sorted(screens)))
+
+        self.name_traces = sum(len(screens) for _, screens in displays) > 1
+        for display, screens in displays:
+            self.connect(display, screens, event_handler, options)
+
+    def connect(self, display, screens, event_handler, options):
+        router = EventRouter(display) if len(screens) > 1 else None
+
+        managers = []
+        for screen in screens:
+            backend = XlibRandrBackend(display, screen, router)
+            screen_options = dict(options)
+            if self.record_path:
+                backend = RecordingBackend(backend, trace_path(
+                    self.record_path,
+                    backend.name if self.name_traces else None))
+                screen_options["profile_store"] = backend.record_profiles(
+                        options.get("profile_store"))
+            if self.command_connection:
+                screen_options["command_backend"] = XlibRandrBackend(
+                        Display(display.get_display_name()), screen)
+            manager = DisplayManager(
+                    lambda event, name=backend.name: event_handler(
+                        name, event),
+                    self.logger,
+                    backend=backend,
+                    **screen_options)
+            self.managers[backend.name] = manager
+            managers.append(manager)
+        self.connections[display.fileno()] = managers
+
+    def __iter__(self):
+        return iter(self.managers.items())
+
+    def __len__(self):
+        return len(self.managers)
+
+    def screen_suffix(self, name):
+        """Files of a screen are only told apart when there are several."""
+        return name if len(self.managers) > 1 else None
+
+    def dump_metrics(self, metrics_path):
+        """
+        Write the metrics of every screen to metrics_path(suffix), with
+        the suffix from screen_suffix.
+        """
+        for name, manager in self.managers.items():
+            path = metrics_path(self.screen_suffix(name))
+            try:
+                manager.metrics.dump(path)
+                self.logger.info("Wrote metrics to %s", path)
+            except OSError as e:
+                self.logger.error("Error writing metrics: %s", e)
+
+    def check_initial_displays(self):
+        for manager in self.managers.values():
+            manager.check_initial_displays()
+
+    def dispatch(self, fd):
+        """
+        Process the pending events of every screen on the connection fd.
+        Returns the managers that received events.
+        """
+        return [manager for manager in self.connections.get(fd, ())
+                if manager.dispatch_pending()]
+
+    def add_watch(self, fileobj, callback):
+        self.watches[fileobj.fileno()] = (fileobj, callback)
+        return fileobj.fileno()
+
+    def remove_watch(self, token):
+        self.watches.pop(token, None)
+
+    def start_monitoring(self):
+        """
+        Serve every connection and watch from one loop. A screen's events
+        are flushed once it has been quiet for its settle window, and
+        the frames of its gamma fades are sent as they fall due.
+        """
+        for fd in self.connections:
+            self.schedule(self.dispatch(fd))
+
+        while True:
+            deadlines = list(self.deadlines.values()) + [
+                manager.gamma.deadline for manager in self.managers.values()
+                if manager.gamma.deadline is not None]
+            timeout = None
+            if deadlines:
+                timeout = max(0, min(deadlines) - time.monotonic())
+
+            readable, _, _ = select.select(
+                    list(self.connections) + list(self.watches), [], [],
+                    timeout)
+            for fd in readable:
+                if fd in self.connections:
+                    self.schedule(self.dispatch(fd))
+                elif fd in self.watches:
+                    fileobj, callback = self.watches[fd]
+                    callback(fileobj)
+                    # A control request may have applied a layout.
+                    for connection in self.connections:
+                        self.schedule(self.dispatch(connection))
+
+            now = time.monotonic()
+            for manager in self.managers.values():
+                if manager.gamma.deadline is not None:
+                    manager.gamma.advance(now)
+            for manager, deadline in list(self.deadlines.items()):
+                if deadline <= now:
+                    del self.deadlines[manager]
+                    manager.flush_events()
+                    # Replies read while applying can leave events in
+                    # Xlib's buffer without the socket turning readable.
+                    self.schedule(self.dispatch(manager.fileno()))
+
+    def schedule(self, managers):
+        for manager in managers:
+            self.deadlines[manager] = (
+                    time.monotonic() + manager.settle_window)
@@ -0,0 +1,83 @@
+import configparser
+import os
+import signal
+
+from profiles import DEFAULT_PROFILE_PATH, ProfileStore
+
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "config.ini")
+
+
+def load_config(path=CONFIG_PATH):
+    config = configparser.ConfigParser()
+    config.read(path)
+    return config
+
+
+def settle_window(config):
+    return config.getfloat("MONITOR", "SETTLE_WINDOW", fallback=0.25)
+
+
+def command_connection(config):
+    return config.getboolean(
+            "MONITOR", "COMMAND_CONNECTION", fallback=True)
+
+
+def control_enabled(config):
+    return config.getboolean("CONTROL", "ENABLE", fallback=True)
+
+
+def displays(config):
+    """The X displays and screens to manage; empty means $DISPLAY."""
+    value = config.get("MONITOR", "DISPLAYS", fallback="")
+    return [spec.strip() for spec in value.split(",") if spec.strip()]
+
+
+def control_socket_path(config, screen_name=None):
+    """
+    The control socket of a screen. A configured SOCKET_PATH gets the
+    screen name appended when several screens are managed.
+    """
+    path = config.get("CONTROL", "SOCKET_PATH", fallback="")
+    if path:
+        path = os.path.expanduser(path)
+        return f"{path}{screen_name.replace('/', '_')}" if screen_name \
+            else path
+
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    display_name = (screen_name or os.environ.get("DISPLAY", ":0")) \
+        .replace("/", "_")
+    return os.path.join(
+            runtime_dir, f"screen-manager-gtk{display_name}.sock")
+
+
+def profile_store(config):
+    return ProfileStore(os.path.expanduser(config.get(
+        "PROFILES", "PROFILE_PATH", fallback=DEFAULT_PROFILE_PATH)))
+
+
+def metrics_path(config, screen_name=None):
+    """The metrics file, with the screen name added for each screen."""
+    path = config.get("METRICS", "PATH", fallback="")
+    if path:
+        path = os.path.expanduser(path)
+    else:
+        cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser(
+                "~/.cache")
+        path = os.path.join(cache_dir, "screen-manager-gtk", "metrics.json")
+
+    if screen_name:
+        root, extension = os.path.splitext(path)
+        path = f"{root}{screen_name.replace('/', '_')}{extension}"
+    return path
+
+
+def record_path(config):
+    """The trace every managed screen records to, or "" for none."""
+    return config.get("TRACE", "RECORD_PATH", fallback="")
+
+
+def metrics_signal(config):
+    """The signal that dumps the metrics file, or None when disabled."""
+    name = config.get("METRICS", "DUMP_SIGNAL", fallback="SIGUSR1")
+    return signal.Signals[name] if name else None
@@ -0,0 +1,150 @@
+from Xlib import X
+from Xlib.ext import randr
+
+from crtcs import CrtcIndex
+from modes import ModeCatalog
+
+
+class ScreenSnapshot:
+    """
+    A cached view of the RandR screen resources, outputs and CRTCs.
+
+    Every output and CRTC info request is sent before any reply is read,
+    so a capture costs two round trips no matter how many outputs the
+    server has. The snapshot is kept until the owner drops it or updates
+    the single output or CRTC an event names. The mode catalog of the
+    previous snapshot is reused while the server's modes are the same.
+    """
+
+    def __init__(self, backend, catalog=None):
+        self.backend = backend
+        self.resources = None
+        self.config_timestamp = X.CurrentTime
+        self.catalog = catalog
+        self.outputs = {}
+        self.crtcs = {}
+        self.crtc_index = CrtcIndex()
+        self.size_range = None
+        self.capture()
+
+    def capture(self):
+        # The "current" variant never triggers a hardware probe. It can
+        # come back empty on a server that has not probed yet.
+        resources = self.backend.get_screen_resources(current=True)
+        if not resources.outputs:
+            resources = self.backend.get_screen_resources(current=False)
+
+        self.resources = resources
+        self.config_timestamp = resources.config_timestamp
+        if self.catalog is None or not self.catalog.matches(resources):
+            self.catalog = ModeCatalog(resources)
+
+        output_requests = [
+            (output, self.request_output_info(output))
+            for output in resources.outputs
+            ]
+        crtc_requests = [
+            (crtc, self.request_crtc_info(crtc)) for crtc in resources.crtcs
+            ]
+        self.outputs = {
+            output: self.read_reply(request)
+            for output, request in output_requests
+            }
+        self.crtcs = {
+            crtc: self.read_reply(request)
+            for crtc, request in crtc_requests
+            }
+
+        self.crtc_index = CrtcIndex()
+        for output, output_info in self.outputs.items():
+            self.crtc_index.update_output(output, output_info.crtcs)
+        for crtc, crtc_info in self.crtcs.items():
+            self.crtc_index.update_crtc(crtc, crtc_info.possible_outputs)
+
+    def request_output_info(self, output):
+        return self.backend.get_output_info(
+                output, self.config_timestamp, defer=True)
+
+    def request_crtc_info(self, crtc):
+        return self.backend.get_crtc_info(
+                crtc, self.config_timestamp, defer=True)
+
+    def request_edid(self, output):
+        return self.backend.get_output_property(
+                output, self.backend.get_atom("EDID"), defer=True)
+
+    def read_edids(self, outputs):
+        """Read the raw EDID bytes of all outputs in one round trip."""
+        requests = [
+            (output, self.request_edid(output)) for output in outputs
+            ]
+        return {
+            output: bytes(self.read_reply(request).value)
+            for output, request in requests
+            }
+
+    def read_reply(self, request):
+        return self.backend.read_reply(request)
+
+    def connected_outputs(self):
+        for output, output_info in self.outputs.items():
+            if output_info.connection == randr.Connected:
+                yield output, output_info
+
+    def find_output(self, name):
+        return next(
+            (output for output, output_info in self.connected_outputs()
+             if output_info.name == name), None)
+
+    def primary_crtc(self):
+        return self.resources.crtcs[0] if self.resources.crtcs else 0
+
+    def covers(self, output, output_info):
+        """Whether the cached resources know the output and its modes."""
+        # self.outputs gains the output as soon as it is refreshed, so
+        # ask the screen resources the snapshot was captured from.
+        return output in self.resources.outputs and all(
+            mode_id in self.catalog for mode_id in output_info.modes)
+
+    def refresh_output(self, output):
+        output_info = self.backend.get_output_info(output)
+        self.outputs[output] = output_info
+        self.crtc_index.update_output(output, output_info.crtcs)
+        return output_info
+
+    def get_crtc_info(self, crtc):
+        if crtc not in self.crtcs:
+            crtc_info = self.backend.get_crtc_info(crtc)
+            self.crtcs[crtc] = crtc_info
+            self.crtc_index.update_crtc(crtc, crtc_info.possible_outputs)
+        return self.crtcs[crtc]
+
+    def screen_size_range(self):
+        """The minimum and maximum screen size, read on first use."""
+        if self.size_range is None:
+            self.size_range = self.backend.get_screen_size_range()
+        return self.size_range
+
+    def load_crtcs(self):
+        """
+        Return the info of every CRTC, reading those discarded since the
+        capture in one round trip.
+        """
+        requests = [
+            (crtc, self.request_crtc_info(crtc))
+            for crtc in self.resources.crtcs if crtc not in self.crtcs
+            ]
+        for crtc, request in requests:
+            crtc_info = self.read_reply(request)
+            self.crtcs[crtc] = crtc_info
+            self.crtc_index.update_crtc(crtc, crtc_info.possible_outputs)
+        return self.crtcs
+
+    def discard_crtc(self, crtc):
+        # Possible outputs only change with the configuration, so the
+        # CRTC stays in the index.
+        self.crtcs.pop(crtc, None)
+
+    def update_config_timestamp(self, config_timestamp):
+        """Track the server's configuration time from RandR events."""
+        self.config_timestamp = config_timestamp
@@ -0,0 +1,11 @@
+import configparser
+
+from utils.logger import Logger
+
+
+def make_logger():
+    config = configparser.ConfigParser()
+    config.read_dict({"LOGGING": {
+        "LEVEL": "CRITICAL", "ENABLE_CONSOLE": "false",
+        "LOG_FILE_PATH": ""}})
+    return Logger(config, name="tests")
@@ -0,0 +1,113 @@
+"""
+Apply layouts on the fake RandR server without dispatching its events.
+
+    python -m unittest tests.test_apply_layout
+"""
+import unittest
+
+from display_manager import DisplayManager, apply_succeeded
+
+from benchmarks.fake_backend import FakeRandrBackend
+from tests import make_logger
+
+
+class ApplyLayoutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = FakeRandrBackend(outputs=2, modes=4, active=1)
+        self.display_manager = DisplayManager(
+                lambda event: None, make_logger(), backend=self.backend)
+        self.modes = self.display_manager.displays[0]["modes"]
+
+    def apply(self, mode):
+        return self.display_manager.apply_layout(
+                [{"name": "OUT-0", "mode": mode, "x": 0, "y": 0}])
+
+    def test_back_to_back_applies(self):
+        self.assertTrue(apply_succeeded(self.apply(self.modes[1])))
+        self.assertTrue(apply_succeeded(self.apply(self.modes[0])))
+        crtc = self.backend.crtcs[100]
+        self.assertEqual(crtc.mode, self.modes[0].id)
+        self.assertEqual(
+                self.backend.screen_size,
+                (self.modes[0].width, self.modes[0].height))
+
+    def test_unchanged_layout_sends_nothing(self):
+        self.backend.reset_counters()
+        self.assertTrue(apply_succeeded(self.apply(self.modes[0])))
+        self.assertEqual(self.backend.requests["SetCrtcConfig"], 0)
+        self.assertEqual(self.backend.requests["SetScreenSize"], 0)
+
+    def test_size_range_is_read_once(self):
+        self.backend.reset_counters()
+        self.assertTrue(apply_succeeded(self.apply(self.modes[1])))
+        self.assertTrue(apply_succeeded(self.apply(self.modes[0])))
+        self.assertEqual(self.backend.requests["GetScreenSizeRange"], 1)
+
+    def test_failed_apply_queries_screen_size(self):
+        # A stale configuration timestamp fails every SetCrtcConfig, so
+        # whatever size the screen ended up with is asked for again.
+        self.backend.config_timestamp += 1
+        self.assertFalse(apply_succeeded(self.apply(self.modes[1])))
+        self.backend.screen_size = (1234, 567)
+        self.backend.reset_counters()
+        self.assertEqual(
+                self.display_manager.current_screen_size(), (1234, 567))
+        self.assertEqual(self.backend.requests["GetGeometry"], 1)
+
+    def test_unplaceable_entry_fails(self):
+        self.backend.reset_counters()
+        statuses = self.display_manager.apply_layout([
+            {"name": "OUT-0", "mode": self.modes[1], "x": 0, "y": 0},
+            {"name": "OUT-9", "mode": self.modes[1], "x": 0, "y": 0},
+            ])
+        self.assertFalse(apply_succeeded(statuses))
+        self.assertEqual(self.backend.requests["SetCrtcConfig"], 0)
+
+
+class TurnOnDisplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = FakeRandrBackend(outputs=3, modes=4, active=3)
+        self.display_manager = DisplayManager(
+                lambda event: None, make_logger(), backend=self.backend)
+
+    def dispatch(self):
+        self.display_manager.dispatch_pending()
+        self.display_manager.flush_events()
+
+    def lit_rects(self):
+        return {
+            crtc: (state.x, state.y, state.width, state.height)
+            for crtc, state in self.backend.crtcs.items() if state.mode}
+
+    def assert_no_overlap(self):
+        rects = list(self.lit_rects().values())
+        for index, (x, y, width, height) in enumerate(rects):
+            for other_x, other_y, other_width, other_height in \
+                    rects[index + 1:]:
+                self.assertFalse(
+                    x < other_x + other_width and other_x < x + width
+                    and y < other_y + other_height
+                    and other_y < y + height,
+                    f"{rects} overlap")
+
+    def test_middle_display_goes_beyond_the_others(self):
+        # OUT-1 off and OUT-2 moved up next to OUT-0.
+        mode = self.display_manager.find_display("OUT-0")["modes"][0]
+        self.assertTrue(apply_succeeded(self.display_manager.apply_layout([
+            {"name": "OUT-0", "mode": mode, "x": 0, "y": 0},
+            {"name": "OUT-2", "mode": mode, "x": mode.width, "y": 0},
+            ])))
+        self.dispatch()
+
+        display_info = self.display_manager.find_display("OUT-1")
+        self.assertTrue(apply_succeeded(
+            self.display_manager.turn_on_display(
+                "OUT-1", display_info["modes"][0])))
+        self.dispatch()
+        self.assertEqual(len(self.lit_rects()), 3)
+        self.assert_no_overlap()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+"""
+Send command batches through the worker thread.
+
+    python -m unittest tests.test_commands
+"""
+import unittest
+
+from commands import CommandWorker
+
+from benchmarks.fake_backend import FakeRandrBackend
+
+
+class BrokenConnection(FakeRandrBackend):
+
+    def flush(self):
+        raise ConnectionResetError("X connection closed")
+
+
+class CommandWorkerTest(unittest.TestCase):
+
+    def test_results(self):
+        worker = CommandWorker(FakeRandrBackend())
+        try:
+            reply, = worker.submit(
+                    [("get_crtc_info", (100,))]).result(timeout=5)
+        finally:
+            worker.close()
+        self.assertEqual(reply.x, 0)
+
+    def test_broken_connection_fails_the_batch(self):
+        worker = CommandWorker(BrokenConnection())
+        try:
+            future = worker.submit([("get_crtc_info", (100,))])
+            with self.assertRaises(ConnectionResetError):
+                future.result(timeout=5)
+        finally:
+            worker.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+"""
+Answer control requests from the model of the fake RandR server.
+
+    python -m unittest tests.test_control
+"""
+import json
+import unittest
+
+from control import ControlServer
+from display_manager import DisplayManager
+
+from benchmarks.fake_backend import FakeRandrBackend
+from tests import make_logger
+
+
+class ControlTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = FakeRandrBackend(outputs=2, modes=4, active=1)
+        self.display_manager = DisplayManager(
+                lambda event: None, make_logger(), backend=self.backend)
+        self.server = ControlServer(
+                self.display_manager, None, None, None, make_logger())
+
+    def request(self, **request):
+        return self.server.handle_request(None, json.dumps(request))
+
+    def test_gamma_rejects_outputs_that_are_not_names(self):
+        for outputs in ("OUT-0", [0], {"OUT-0": 1}):
+            reply = self.request(
+                    command="gamma", outputs=outputs, brightness=0.5)
+            self.assertFalse(reply["ok"])
+        self.assertEqual(self.backend.requests["SetCrtcGamma"], 0)
+
+    def test_apply_drops_the_cached_model(self):
+        self.request(command="list")
+        mode = self.display_manager.displays[0]["modes"][1]
+        self.request(command="apply", layout=[{
+            "name": "OUT-0", "width": mode.width, "height": mode.height}])
+        self.assertIsNone(self.server.model_cache)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+"""
+Match outputs to the CRTCs that can drive them.
+
+    python -m unittest tests.test_crtcs
+"""
+import unittest
+
+from crtcs import CrtcIndex
+
+
+def make_index(crtcs_by_output, outputs_by_crtc=None):
+    index = CrtcIndex()
+    for output, crtcs in crtcs_by_output.items():
+        index.update_output(output, crtcs)
+    for crtc, outputs in (outputs_by_crtc or {}).items():
+        index.update_crtc(crtc, outputs)
+    return index
+
+
+class CrtcIndexTest(unittest.TestCase):
+
+    def test_both_sides_must_agree(self):
+        index = make_index({1: [10, 11]}, {10: [1], 11: [2]})
+        self.assertTrue(index.can_drive(10, 1))
+        self.assertFalse(index.can_drive(11, 1))
+        self.assertEqual(index.assign([1]), {1: 10})
+
+    def test_constrained_outputs_are_matched(self):
+        index = make_index({1: [10, 11], 2: [10]})
+        self.assertEqual(index.assign([1, 2]), {1: 11, 2: 10})
+
+    def test_current_crtcs_are_kept(self):
+        index = make_index({1: [10, 11], 2: [10, 11]})
+        self.assertEqual(
+                index.assign([1, 2], current={1: 11, 2: 10}),
+                {1: 11, 2: 10})
+
+    def test_current_crtc_moves_when_another_output_needs_it(self):
+        index = make_index({1: [10, 11], 2: [10]})
+        self.assertEqual(
+                index.assign([1, 2], current={1: 10}), {1: 11, 2: 10})
+
+    def test_outputs_without_a_crtc_are_left_out(self):
+        index = make_index({1: [10], 2: [10], 3: []})
+        assignment = index.assign([1, 2, 3])
+        self.assertEqual(len(assignment), 1)
+        self.assertEqual(list(assignment.values()), [10])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+Parse EDID base blocks and cache them by content.
+
+    python -m unittest tests.test_edid
+"""
+import unittest
+
+from edid import EdidCache, parse_edid
+
+
+def make_edid(name=b"DELL U2415"):
+    edid = bytearray(128)
+    edid[0:8] = b"\x00\xff\xff\xff\xff\xff\xff\x00"
+    edid[8:10] = (0x10AC).to_bytes(2, "big")
+    edid[10:12] = (0xA0C4).to_bytes(2, "little")
+    edid[12:16] = (1234).to_bytes(4, "little")
+    edid[16], edid[17] = 10, 25
+    edid[21], edid[22] = 53, 30
+    # 1920x1080 at 148.5 MHz with 280 and 45 lines of blanking: 60 Hz.
+    edid[54:72] = bytes([
+        0x02, 0x3A, 0x80, 0x18, 0x71, 0x38, 0x2D, 0x40,
+        0, 0, 0, 0, 0x13, 0x2B, 0x21, 0, 0, 0])
+    edid[72:90] = bytes([0, 0, 0, 0xFC, 0]) + name.ljust(13, b"\n")
+    edid[90:100] = bytes([0, 0, 0, 0xFD, 0, 56, 76, 30, 83, 17])
+    return bytes(edid)
+
+
+class ParseEdidTest(unittest.TestCase):
+
+    def test_identification(self):
+        edid = parse_edid(make_edid())
+        self.assertEqual(edid.vendor, "DEL")
+        self.assertEqual(edid.product, 0xA0C4)
+        self.assertEqual(edid.serial, 1234)
+        self.assertEqual((edid.week, edid.year), (10, 2015))
+        self.assertEqual((edid.width_mm, edid.height_mm), (530, 300))
+        self.assertEqual(edid.description, "DELL U2415")
+
+    def test_preferred_timing_and_ranges(self):
+        edid = parse_edid(make_edid())
+        timing = edid.preferred_timing
+        self.assertEqual((timing.width, timing.height), (1920, 1080))
+        self.assertAlmostEqual(timing.refresh_rate, 60.0)
+        self.assertEqual((timing.width_mm, timing.height_mm), (531, 299))
+        self.assertEqual(edid.vertical_range, (56, 76))
+        self.assertEqual(edid.horizontal_range, (30, 83))
+        self.assertEqual(edid.max_pixel_clock, 170000000)
+
+    def test_description_without_name(self):
+        self.assertEqual(parse_edid(make_edid(b"")).description, "DEL a0c4")
+
+    def test_rejects_other_data(self):
+        with self.assertRaises(ValueError):
+            parse_edid(b"\x00" * 128)
+        with self.assertRaises(ValueError):
+            parse_edid(make_edid()[:100])
+
+
+class EdidCacheTest(unittest.TestCase):
+
+    def test_outputs_share_parsed_edids(self):
+        cache = EdidCache()
+        first = cache.store(1, make_edid())
+        self.assertIs(cache.store(2, make_edid()), first)
+        self.assertEqual(cache.missing([1, 2, 3]), [3])
+
+    def test_unparseable_and_empty_edids(self):
+        cache = EdidCache()
+        self.assertIsNone(cache.store(1, b"\x00" * 128))
+        self.assertIsNone(cache.store(2, b""))
+        self.assertEqual(cache.missing([1, 2]), [])
+
+    def test_invalidate(self):
+        cache = EdidCache()
+        cache.store(1, make_edid())
+        cache.invalidate(1)
+        self.assertNotIn(1, cache)
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.missing([1]), [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
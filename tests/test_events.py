@@ -0,0 +1,66 @@
+"""
+Fold bursts of display changes into one transition.
+
+    python -m unittest tests.test_events
+"""
+import unittest
+
+from events import DisplayChanges, EventCoalescer
+
+
+def display(name, mode=1):
+    return {"name": name, "mode": mode}
+
+
+def names(displays):
+    return [display_info["name"] for display_info in displays]
+
+
+class EventCoalescerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.coalescer = EventCoalescer()
+
+    def add(self, added=(), removed=(), mode_changed=()):
+        self.coalescer.add(DisplayChanges(
+                list(added), list(removed), list(mode_changed)))
+
+    def test_plug_and_unplug_cancel_out(self):
+        self.add(added=[display("A")])
+        self.add(removed=[display("A")])
+        self.coalescer.add(None)
+        self.assertIsNone(self.coalescer.flush())
+        # The batch ends with the flush even when it folded to nothing.
+        self.assertEqual(self.coalescer.raw_events, 0)
+
+    def test_unplug_and_replug_is_a_change(self):
+        self.add(removed=[display("A", 1)])
+        self.add(added=[display("A", 2)])
+        event = self.coalescer.flush()
+        self.assertEqual(event.changes.added, [])
+        self.assertEqual(event.changes.removed, [])
+        self.assertEqual(event.changes.mode_changed, [display("A", 2)])
+
+    def test_latest_state_wins(self):
+        self.add(mode_changed=[display("A", 1)])
+        self.add(mode_changed=[display("A", 2)])
+        self.add(added=[display("B")])
+        self.add(removed=[display("C")])
+        self.coalescer.add(None)
+        event = self.coalescer.flush()
+        self.assertEqual(event.folded, 5)
+        self.assertEqual(event.changes.mode_changed, [display("A", 2)])
+        self.assertEqual(names(event.changes.added), ["B"])
+        self.assertEqual(names(event.changes.removed), ["C"])
+
+    def test_flush_starts_a_new_batch(self):
+        self.add(added=[display("A")])
+        self.coalescer.flush()
+        self.add(removed=[display("A")])
+        event = self.coalescer.flush()
+        self.assertEqual(event.folded, 1)
+        self.assertEqual(names(event.changes.removed), ["A"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""
+Run the gamma command against the fake RandR server.
+
+    python -m unittest tests.test_gamma_command
+"""
+import contextlib
+import io
+import unittest
+from types import SimpleNamespace
+
+import cli
+from display_manager import DisplayManager
+
+from benchmarks.fake_backend import FakeRandrBackend
+from tests import make_logger
+
+
+class GammaCommandTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = FakeRandrBackend(outputs=3, active=2)
+        self.display_manager = DisplayManager(
+                lambda event: None, make_logger(), backend=self.backend)
+        self.screens = [("fake", self.display_manager)]
+
+    def run_gamma(self, *outputs, brightness=None, temperature=None,
+                  fade=0.0):
+        args = SimpleNamespace(
+                outputs=list(outputs), brightness=brightness,
+                temperature=temperature, fade=fade)
+        with contextlib.redirect_stderr(io.StringIO()):
+            return cli.adjust_gamma(self.screens, args)
+
+    def test_sets_every_active_display(self):
+        self.assertEqual(self.run_gamma(brightness=0.5), 0)
+        self.assertEqual(self.backend.requests["SetCrtcGamma"], 2)
+        for crtc in (100, 101):
+            red, green, blue = self.backend.crtcs[crtc].gamma
+            self.assertAlmostEqual(red[-1] / 65535, 0.5, places=3)
+
+    def test_named_display(self):
+        self.assertEqual(self.run_gamma("OUT-1", temperature=3400), 0)
+        self.assertEqual(self.backend.requests["SetCrtcGamma"], 1)
+
+    def test_inactive_display_fails(self):
+        self.assertEqual(self.run_gamma("OUT-2", brightness=0.5), 1)
+
+    def test_needs_a_value(self):
+        self.assertEqual(self.run_gamma(), 2)
+
+    def test_fade_waits_for_the_last_frame(self):
+        self.assertEqual(self.run_gamma(brightness=0.5, fade=0.1), 0)
+        self.assertIsNone(self.display_manager.gamma.deadline)
+        self.assertGreater(self.backend.requests["SetCrtcGamma"], 2)
+        red, green, blue = self.backend.crtcs[100].gamma
+        self.assertAlmostEqual(red[-1] / 65535, 0.5, places=3)
+
+    def test_fade_does_not_block(self):
+        self.display_manager.adjust_gamma(brightness=0.5, duration=10)
+        self.assertIsNotNone(self.display_manager.gamma.deadline)
+
+    def test_resend_after_crtc_change(self):
+        self.run_gamma(brightness=0.5)
+        # A mode set that resets the ramps.
+        crtc = self.backend.crtcs[100]
+        crtc.gamma = [self.backend.crtcs[102].gamma[0]] * 3
+        self.backend.configure_crtc(
+                100, crtc.x, crtc.y, crtc.mode, crtc.rotation, crtc.outputs)
+        self.display_manager.dispatch_pending()
+
+        self.backend.reset_counters()
+        self.assertEqual(self.run_gamma("OUT-0", brightness=0.5), 0)
+        self.assertEqual(self.backend.requests["SetCrtcGamma"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+"""
+Feed hotplug events from the fake RandR server into the display model.
+
+    python -m unittest tests.test_hotplug
+"""
+import unittest
+
+from display_manager import DisplayManager
+
+from benchmarks.fake_backend import FakeRandrBackend
+from tests import make_logger
+
+
+class HotplugTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = FakeRandrBackend(outputs=1, crtcs=2, active=1)
+        self.display_manager = DisplayManager(
+                lambda event: None, make_logger(), backend=self.backend)
+
+    def dispatch(self):
+        self.display_manager.dispatch_pending()
+        self.display_manager.flush_events()
+
+    def test_new_output_can_be_enabled(self):
+        output = self.backend.add_output()
+        self.dispatch()
+        display_info = self.display_manager.find_display("OUT-1")
+        self.assertIsNotNone(display_info)
+
+        self.display_manager.turn_on_display(
+                "OUT-1", display_info["modes"][0])
+        self.assertTrue(self.backend.outputs[output].crtc)
+
+    def test_unplug(self):
+        self.backend.plug(200, connected=False)
+        self.dispatch()
+        self.assertEqual(self.display_manager.displays, [])
+
+    def test_failing_event_does_not_stop_dispatch(self):
+        process_randr_event = self.display_manager.process_randr_event
+        failed = []
+
+        def fail_once(event):
+            if not failed:
+                failed.append(event)
+                raise RuntimeError("bad event")
+            return process_randr_event(event)
+
+        self.display_manager.process_randr_event = fail_once
+        self.backend.add_output()
+        self.backend.add_output()
+        self.dispatch()
+        self.assertEqual(len(failed), 1)
+        self.assertIsNotNone(self.display_manager.find_display("OUT-2"))
+
+
+if __name__ == "__main__":
+    unittest.main()
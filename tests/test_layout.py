@@ -0,0 +1,125 @@
+"""
+Place displays next to each other.
+
+    python -m unittest tests.test_layout
+"""
+import unittest
+from types import SimpleNamespace
+
+from Xlib.ext import randr
+
+from layout import EdgeIndex, outermost, solve_layout
+
+
+FULL_HD = SimpleNamespace(width=1920, height=1080)
+HD = SimpleNamespace(width=1280, height=720)
+
+
+def positions(layout):
+    return {entry["name"]: (entry["x"], entry["y"]) for entry in layout}
+
+
+class SolveLayoutTest(unittest.TestCase):
+
+    def test_relations(self):
+        layout, size = solve_layout([
+            {"name": "A", "mode": FULL_HD},
+            {"name": "B", "mode": HD, "relation": "right", "anchor": "A"},
+            {"name": "C", "mode": HD, "relation": "below", "anchor": "A"},
+            {"name": "D", "mode": HD, "relation": "clone", "anchor": "A"},
+            ])
+        self.assertEqual(positions(layout), {
+            "A": (0, 0), "B": (1920, 0), "C": (0, 1080), "D": (0, 0)})
+        self.assertEqual(size, (3200, 1800))
+
+    def test_same_side_chains(self):
+        layout, _ = solve_layout([
+            {"name": "A", "mode": HD},
+            {"name": "B", "mode": HD, "relation": "right", "anchor": "A"},
+            {"name": "C", "mode": HD, "relation": "right", "anchor": "A"},
+            ])
+        self.assertEqual(positions(layout)["C"], (2560, 0))
+
+    def test_anchor_placed_later(self):
+        layout, _ = solve_layout([
+            {"name": "B", "mode": HD, "relation": "up", "anchor": "A"},
+            {"name": "A", "mode": HD, "x": 100, "y": 0},
+            ])
+        self.assertEqual(positions(layout), {"B": (0, 0), "A": (0, 720)})
+
+    def test_normalize(self):
+        entries = [
+            {"name": "A", "mode": HD},
+            {"name": "B", "mode": HD, "relation": "left", "anchor": "A"},
+            ]
+        layout, _ = solve_layout(entries)
+        self.assertEqual(positions(layout), {"A": (1280, 0), "B": (0, 0)})
+        layout, size = solve_layout(entries, normalize=False)
+        self.assertEqual(positions(layout), {"A": (0, 0), "B": (-1280, 0)})
+        self.assertEqual(size, (2560, 720))
+
+    def test_rotation(self):
+        layout, size = solve_layout([
+            {"name": "A", "mode": HD, "rotation": randr.Rotate_90},
+            {"name": "B", "mode": HD, "relation": "right", "anchor": "A"},
+            ])
+        self.assertEqual(positions(layout)["B"], (720, 0))
+        self.assertEqual(size, (2000, 1280))
+
+    def test_invalid_placements(self):
+        for entries in (
+                [{"name": "A", "mode": HD, "relation": "behind",
+                  "anchor": "B"},
+                 {"name": "B", "mode": HD}],
+                [{"name": "A", "mode": HD, "relation": "left",
+                  "anchor": "Z"}],
+                [{"name": "A", "mode": HD, "relation": "left",
+                  "anchor": "B"},
+                 {"name": "B", "mode": HD, "relation": "left",
+                  "anchor": "A"}]):
+            with self.assertRaises(ValueError):
+                solve_layout(entries)
+
+
+class OutermostTest(unittest.TestCase):
+
+    def setUp(self):
+        self.entries = [
+            {"name": "A", "mode": FULL_HD, "x": 0, "y": 0},
+            {"name": "B", "mode": HD, "x": 1920, "y": 0},
+            {"name": "C", "mode": HD, "x": 0, "y": 1080},
+            ]
+
+    def test_sides(self):
+        self.assertEqual(outermost(self.entries, "right"), "B")
+        self.assertEqual(outermost(self.entries, "down"), "C")
+        self.assertEqual(outermost(self.entries, "left"), "A")
+
+    def test_clone_is_not_a_side(self):
+        with self.assertRaises(ValueError):
+            outermost(self.entries, "clone")
+
+
+class EdgeIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = EdgeIndex([(0, 0, 1920, 1080), (1920, 0, 1280, 720)])
+
+    def test_snaps_the_nearer_edge(self):
+        # The left edge is 10 from 1920, the right edge 30 from 3200.
+        self.assertEqual(self.index.snap(1930, 0, 1300, 720, 40), (1920, 0))
+        # The top edge, then the bottom edge, is 5 from 1080.
+        self.assertEqual(self.index.snap(0, 1085, 800, 600, 40), (0, 1080))
+        self.assertEqual(self.index.snap(0, 475, 800, 600, 40), (0, 480))
+
+    def test_leaves_distant_rects_alone(self):
+        self.assertEqual(
+                self.index.snap(500, 300, 100, 100, 20), (500, 300))
+
+    def test_empty_index(self):
+        self.assertEqual(
+                EdgeIndex([]).snap(13, 17, 100, 100, 20), (13, 17))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+"""
+Rate limit repeated log messages.
+
+    python -m unittest tests.test_logger
+"""
+import unittest
+from unittest import mock
+
+from utils.logger import RateLimiter
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch(
+                "utils.logger.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_limit_per_interval(self):
+        limiter = RateLimiter(2, 10)
+        self.assertEqual(limiter.allow("a"), (True, 0))
+        self.assertEqual(limiter.allow("a"), (True, 0))
+        self.assertEqual(limiter.allow("a"), (False, 0))
+        self.assertEqual(limiter.allow("a"), (False, 0))
+        # Other message types have their own window.
+        self.assertEqual(limiter.allow("b"), (True, 0))
+
+        self.now += 10
+        self.assertEqual(limiter.allow("a"), (True, 2))
+        self.assertEqual(limiter.allow("a"), (True, 0))
+
+    def test_no_limit(self):
+        limiter = RateLimiter(0, 10)
+        for _ in range(100):
+            self.assertEqual(limiter.allow("a"), (True, 0))
+        self.assertEqual(limiter.windows, {})
+
+    def test_prune_keeps_windows_with_drops(self):
+        limiter = RateLimiter(1, 10)
+        limiter.MAX_WINDOWS = 2
+        limiter.allow("quiet")
+        limiter.allow("noisy")
+        limiter.allow("noisy")
+        self.now += 10
+        limiter.allow("new")
+        self.assertEqual(set(limiter.windows), {"noisy", "new"})
+        self.assertEqual(limiter.allow("noisy"), (True, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
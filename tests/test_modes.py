@@ -0,0 +1,42 @@
+"""
+Look up the modes of one output by size.
+
+    python -m unittest tests.test_modes
+"""
+import unittest
+from types import SimpleNamespace
+
+from modes import ModeCatalog
+
+
+def mode_info(mode_id, width, height, v_total=1000):
+    return SimpleNamespace(
+            id=mode_id, width=width, height=height, dot_clock=60000000,
+            h_total=1000, v_total=v_total, flags=0, name_length=0)
+
+
+class ModeListTest(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = ModeCatalog(SimpleNamespace(mode_names="", modes=[
+            mode_info(1, 1920, 1080),
+            mode_info(2, 1920, 1080, v_total=2000),
+            mode_info(3, 1280, 720),
+            ]))
+
+    def modes_for(self, *mode_ids):
+        return self.catalog.modes_for(SimpleNamespace(modes=mode_ids))
+
+    def test_with_size_keeps_server_order(self):
+        modes = self.modes_for(2, 3, 1)
+        self.assertEqual(
+                [mode.id for mode in modes.with_size(1920, 1080)], [2, 1])
+
+    def test_with_size_only_returns_the_output_modes(self):
+        # Another output supports 1280x720, this one does not.
+        self.modes_for(1, 3)
+        self.assertEqual(self.modes_for(1, 2).with_size(1280, 720), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
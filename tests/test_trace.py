@@ -0,0 +1,65 @@
+"""
+Record a session on the fake RandR server and replay its trace.
+
+    python -m unittest tests.test_trace
+"""
+import os
+import tempfile
+import unittest
+
+from display_manager import DisplayManager
+from randr_trace import RecordingBackend, ReplayBackend, replay_trace
+
+from benchmarks.fake_backend import FakeRandrBackend
+from tests import make_logger
+
+
+def display_states(display_manager):
+    return [(display["name"], display["status"], display["mode"])
+            for display in display_manager.displays]
+
+
+class TraceTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "trace.jsonl")
+
+    def test_replay_turn_off(self):
+        backend = RecordingBackend(
+                FakeRandrBackend(outputs=2, active=2), self.path)
+        recorded = DisplayManager(
+                lambda event: None, make_logger(), backend=backend)
+        recorded.turn_off_display("OUT-1")
+        recorded.dispatch_pending()
+        recorded.flush_events()
+        backend.writer.close()
+        self.assertEqual(
+                recorded.find_display("OUT-1")["status"], "inactive")
+
+        replay_backend = ReplayBackend(self.path)
+        replayed = DisplayManager(
+                lambda event: None, make_logger(), backend=replay_backend)
+        counts = replay_trace(replayed, replay_backend)
+        self.assertEqual(counts["turn_off_display"], 1)
+        self.assertEqual(
+                display_states(replayed), display_states(recorded))
+
+    def test_replay_keeps_empty_flushes(self):
+        backend = RecordingBackend(FakeRandrBackend(outputs=2), self.path)
+        recorded = DisplayManager(
+                lambda event: None, make_logger(), backend=backend)
+        recorded.flush_events()
+        recorded.flush_events()
+        backend.writer.close()
+
+        replay_backend = ReplayBackend(self.path)
+        replayed = DisplayManager(
+                lambda event: None, make_logger(), backend=replay_backend)
+        counts = replay_trace(replayed, replay_backend)
+        self.assertEqual(counts["flush_events"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1 +0,0 @@
-/home/james/git/fetchAPOD/logger.py
\ No newline at end of file
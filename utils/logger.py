@@ -0,0 +1,200 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import time
+
+import settings
+
+
+SIZE_SUFFIXES = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+RECORD_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# The record queue and listener of the process. The first Logger starts
+# the listener with its output handlers and every Logger writes to the
+# same queue, so records keep their order no matter which Logger wrote
+# them.
+_queue = queue.SimpleQueue()
+_listener = None
+
+
+def parse_size(value):
+    """Parse a byte count such as "1048576", "512K" or "1M"."""
+    value = value.strip().upper()
+    multiplier = SIZE_SUFFIXES.get(value[-1:], 1)
+    if value[-1:] in SIZE_SUFFIXES:
+        value = value[:-1]
+    return int(float(value) * multiplier)
+
+
+class StructuredFormatter(logging.Formatter):
+    """Append a record's key-value fields to the message, logfmt style."""
+
+    def format(self, record):
+        message = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            message += " " + " ".join(
+                f"{key}={format_value(value)}"
+                for key, value in fields.items())
+        return message
+
+
+def format_value(value):
+    text = str(value)
+    if not text or any(char in text for char in ' "='):
+        return '"' + text.replace('"', '\\"') + '"'
+    return text
+
+
+class RateLimiter:
+    """
+    Allow at most limit messages of one type per interval seconds. The
+    first message of the next interval learns how many were dropped.
+    """
+
+    MAX_WINDOWS = 1024
+
+    def __init__(self, limit, interval):
+        self.limit = limit
+        self.interval = interval
+        self.windows = {}
+
+    def allow(self, key):
+        """Return whether to log, and how many were suppressed before."""
+        if self.limit <= 0:
+            return True, 0
+
+        now = time.monotonic()
+        if key not in self.windows and len(self.windows) >= self.MAX_WINDOWS:
+            self.prune(now)
+        started, count, suppressed = self.windows.get(key, (now, 0, 0))
+        reported = 0
+        if now - started >= self.interval:
+            started, count, reported, suppressed = now, 0, suppressed, 0
+
+        if count >= self.limit:
+            self.windows[key] = (started, count, suppressed + 1)
+            return False, 0
+        self.windows[key] = (started, count + 1, suppressed)
+        return True, reported
+
+    def prune(self, now):
+        """Forget the windows that have expired without dropping."""
+        self.windows = {
+            key: window for key, window in self.windows.items()
+            if window[2] or now - window[0] < self.interval}
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue records unformatted; the listener thread formats and writes
+    them, so the caller pays neither for formatting nor for disk I/O.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            # Tracebacks reference live frames, so render them now.
+            record.exc_text = logging.Formatter().formatException(
+                    record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class Logger:
+    """
+    The application log, configured from the [LOGGING] section of
+    config.ini.
+
+    Messages take %-style arguments that are only formatted when the
+    record is written, and keyword arguments that are written as
+    key=value fields. Records go through a queue to a background thread
+    that owns the console and file handlers, and each message type is
+    rate limited so that a flood of X events cannot flood the log.
+    """
+
+    def __init__(self, config=None, name="screen-manager"):
+        if config is None:
+            config = settings.load_config()
+        self.logger = logging.getLogger(name)
+        self.logger.propagate = False
+        self.logger.setLevel(
+                config.get("LOGGING", "LEVEL", fallback="INFO"))
+        if not self.logger.handlers:
+            self.logger.addHandler(self.create_queue_handler(config))
+        self.rate_limiter = RateLimiter(
+            config.getint("LOGGING", "RATE_LIMIT", fallback=20),
+            config.getfloat("LOGGING", "RATE_INTERVAL", fallback=10.0))
+
+    def create_queue_handler(self, config):
+        global _listener
+
+        if _listener is None:
+            formatter = StructuredFormatter(RECORD_FORMAT)
+            handlers = []
+            if config.getboolean(
+                    "LOGGING", "ENABLE_CONSOLE", fallback=True):
+                handlers.append(logging.StreamHandler())
+            path = config.get("LOGGING", "LOG_FILE_PATH", fallback="")
+            if path:
+                handlers.append(self.create_file_handler(config, path))
+            for output_handler in handlers:
+                output_handler.setFormatter(formatter)
+
+            _listener = logging.handlers.QueueListener(
+                    _queue, *handlers, respect_handler_level=True)
+            _listener.start()
+            atexit.register(_listener.stop)
+        return DeferredQueueHandler(_queue)
+
+    def create_file_handler(self, config, path):
+        path = os.path.expanduser(path)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if not config.getboolean(
+                "LOGGING", "ENABLE_ROTATION", fallback=True):
+            return logging.FileHandler(path, delay=True)
+        return logging.handlers.RotatingFileHandler(
+            path,
+            maxBytes=parse_size(config.get(
+                "LOGGING", "MAX_FILE_SIZE", fallback="1M")),
+            backupCount=config.getint(
+                "LOGGING", "BACKUP_COUNT", fallback=5),
+            delay=True,
+            )
+
+    def log(self, level, msg, *args, exc_info=None, rate_key=None,
+            **fields):
+        """
+        Log msg % args with fields. Messages are rate limited by
+        rate_key, or by msg itself, before a record is even created.
+        """
+        if not self.logger.isEnabledFor(level):
+            return
+        if rate_key is None:
+            rate_key = msg if isinstance(msg, str) else type(msg).__name__
+        allowed, suppressed = self.rate_limiter.allow(rate_key)
+        if not allowed:
+            return
+        if suppressed:
+            fields["suppressed"] = suppressed
+        self.logger.log(
+            level, msg, *args, exc_info=exc_info, stacklevel=3,
+            extra={"fields": fields})
+
+    def debug(self, msg, *args, **fields):
+        self.log(logging.DEBUG, msg, *args, **fields)
+
+    def info(self, msg, *args, **fields):
+        self.log(logging.INFO, msg, *args, **fields)
+
+    def warning(self, msg, *args, **fields):
+        self.log(logging.WARNING, msg, *args, **fields)
+
+    def error(self, msg, *args, **fields):
+        self.log(logging.ERROR, msg, *args, **fields)
+
+    def exception(self, msg, *args, **fields):
+        self.log(logging.ERROR, msg, *args, exc_info=True, **fields)